@@ -1,9 +1,10 @@
-from app import create_app, db
+from app import create_app
+from app.commands import upgrade_schema
 
 app = create_app()
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
     app.run(host='0.0.0.0', port=3000, debug=True)
 
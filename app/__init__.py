@@ -3,27 +3,54 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_mail import Mail
 from config import Config
+from .database import configure_engine, engine_options
+from .kv import KV
+from .cache import CatalogCache
+from .mailer import EmailBatcher
+from .metrics import Metrics
+from .encoding import Compress, FastJSONProvider
 
 db = SQLAlchemy()
 mail = Mail()
+kv = KV()
+catalog_cache = CatalogCache()
+email_batcher = EmailBatcher()
+metrics = Metrics()
+compress = Compress()
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///inventory.db"
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config.from_object(Config)
+    # overrides have to land before the extensions read the config
+    if test_config:
+        app.config.update(test_config)
+
+    # orjson when installed, stdlib otherwise (JSON_PROVIDER)
+    app.json = FastJSONProvider(app)
 
     # Enhanced CORS configuration
     CORS(app,
          origins=["http://localhost:5173", "http://127.0.0.1:5173"],
          methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-         allow_headers=["Content-Type", "Authorization"])
+         allow_headers=["Content-Type", "Authorization", "Idempotency-Key"])
 
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config)
+    metrics.init_app(app)
     mail.init_app(app)
+    email_batcher.init_app(app)
+    kv.init_app(app)
+    catalog_cache.init_app(app)
+    compress.init_app(app)
 
     # Import and register routes
     from . import routes
     app.register_blueprint(routes.bp)
 
+    from .commands import register_commands
+    register_commands(app)
+
     return app
\ No newline at end of file
@@ -0,0 +1,213 @@
+import json
+import time
+from collections import deque
+from sqlalchemy import insert, select
+from . import db
+from .inventory import InsufficientStock, aggregate_quantities, is_valid_product_id, is_valid_quantity, load_products, reserve_stock
+from .models import Order, OrderItem, PaymentStatus, Product, ShippingStatus
+from .hot_stock import available_stock, hot_product_ids, hot_reservation
+from .low_stock import mark_low
+
+
+# Bulk order ingestion (marketplace feeds)
+# - body is a JSON array of orders, {"orders": [...]}, or NDJSON (one order per line)
+# - every order is validated against one preloaded product map
+# - orders/items go in with multi-row INSERTs, one transaction per chunk
+# - each order gets its own result, a bad order never sinks its neighbours
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+class BulkBodyError(ValueError):
+    pass
+
+
+def parse_bulk_body(request):
+    """
+    Turn the request body into a list of order payloads
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        orders = []
+        for line_no, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                orders.append(json.loads(line))
+            except ValueError:
+                raise BulkBodyError(f'line {line_no} is not valid JSON')
+        return orders
+
+    if not request.is_json:
+        raise BulkBodyError('body must be a JSON array or NDJSON')
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('orders')
+    if not isinstance(body, list):
+        raise BulkBodyError('body must be a JSON array of orders or {"orders": [...]}')
+    return body
+
+
+def validate_order(payload, names, remaining):
+    """
+    Return an error message, or None when payload can be placed.
+    names maps product id to name for every known product,
+    remaining ({product_id: stock}) is the stock left after the orders
+    accepted so far and is decremented for an accepted order.
+    """
+    if not isinstance(payload, dict) or not all(k in payload for k in ['name', 'email', 'items']):
+        return "those fields must included : ['name', 'email', 'items']"
+    for field in ('name', 'email'):
+        if not isinstance(payload[field], str) or not payload[field].strip():
+            return f'{field} must be a non empty string'
+    items = payload['items']
+    if not isinstance(items, list) or len(items) == 0:
+        return 'items must be a non empty list'
+    for item in items:
+        if not isinstance(item, dict) or not all(k in item for k in ['product_id', 'quantity']):
+            return 'Each item must have product_id and quantity'
+        if not is_valid_product_id(item['product_id']):
+            return 'product_id must be an integer'
+        if not is_valid_quantity(item['quantity']):
+            return 'quantity must be a positive integer'
+
+    quantities = aggregate_quantities(items)
+    for product_id, quantity in quantities.items():
+        if product_id not in names:
+            return f'Product with ID {product_id} not found'
+        if remaining[product_id] < quantity:
+            return f'Insufficient stock for product {names[product_id]}. Available: {remaining[product_id]}'
+
+    for product_id, quantity in quantities.items():
+        remaining[product_id] -= quantity
+    return None
+
+
+def current_stock(product_ids):
+    stmt = select(Product.id, Product.stock).where(Product.id.in_(product_ids))
+    return dict(db.session.execute(stmt).all())
+
+
+def _product_ids(payloads):
+    ids = set()
+    for payload in payloads:
+        items = payload.get('items') if isinstance(payload, dict) else None
+        if isinstance(items, list):
+            ids.update(item['product_id'] for item in items
+                       if isinstance(item, dict) and isinstance(item.get('product_id'), int))
+    return ids
+
+
+def _insert_chunk(accepted, prices, hot_ids):
+    """
+    Insert the accepted (index, payload) pairs and take their stock.
+    prices snapshots the unit price per product id, hot_ids are the products
+    taken from their counters (app/hot_stock.py).
+    Returns the new order ids in the same order.
+    """
+    quantities = aggregate_quantities(item for _, payload in accepted for item in payload['items'])
+    with hot_reservation(quantities, hot_ids) as hot:
+        order_ids = db.session.scalars(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True),
+            [
+                {
+                    'name': payload['name'],
+                    'email': payload['email'],
+                    'payment_status': PaymentStatus.PENDING,
+                    'shipping_status': ShippingStatus.PENDING,
+                    'total_amount': sum(item['quantity'] * prices[item['product_id']] for item in payload['items']),
+                }
+                for _, payload in accepted
+            ]
+        ).all()
+
+        db.session.execute(insert(OrderItem), [
+            {
+                'order_id': order_id,
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'unit_price': prices[item['product_id']],
+                'stock_applied': item['product_id'] not in hot,
+            }
+            for order_id, (_, payload) in zip(order_ids, accepted)
+            for item in payload['items']
+        ])
+
+        low = reserve_stock({pid: q for pid, q in quantities.items() if pid not in hot})
+        db.session.commit()
+    mark_low(low)
+    return order_ids
+
+
+def ingest_orders(payloads, chunk_size=500):
+    """
+    Validate and insert payloads in chunks of chunk_size orders.
+    Returns (results, summary), results has one entry per payload in input order.
+    """
+    started = time.perf_counter()
+    results = [None] * len(payloads)
+    # plain dicts, so nothing has to be refreshed after each chunk commits
+    products = load_products(_product_ids(payloads))
+    names = {product_id: product.name for product_id, product in products.items()}
+    prices = {product_id: product.price for product_id, product in products.items()}
+    remaining = {product_id: product.stock for product_id, product in products.items()}
+    hot_ids = hot_product_ids(products.values())
+    remaining.update(available_stock(hot_ids))
+
+    chunks = deque(list(enumerate(payloads[offset:offset + chunk_size], offset))
+                   for offset in range(0, len(payloads), chunk_size))
+    while chunks:
+        chunk = chunks.popleft()
+
+        # a concurrent writer can take stock between our preload and the
+        # conditional update; then reload the chunk's stock and try once more
+        for attempt in range(2):
+            accepted = []
+            snapshot = dict(remaining)
+            for index, payload in chunk:
+                error = validate_order(payload, names, remaining)
+                if error:
+                    results[index] = {'index': index, 'status': 'failed', 'error': error}
+                else:
+                    accepted.append((index, payload))
+            if not accepted:
+                break
+            try:
+                order_ids = _insert_chunk(accepted, prices, hot_ids)
+            except InsufficientStock:
+                db.session.rollback()
+                remaining = snapshot
+                chunk_ids = {pid for _, payload in accepted for pid in aggregate_quantities(payload['items'])}
+                remaining.update(current_stock(chunk_ids))
+                remaining.update(available_stock(chunk_ids & hot_ids))
+                if attempt == 0:
+                    continue
+                for index, _ in accepted:
+                    results[index] = {'index': index, 'status': 'failed',
+                                      'error': 'Insufficient stock, the product sold out while ingesting'}
+                break
+            except Exception as e:
+                db.session.rollback()
+                # nothing of the chunk was taken
+                remaining = snapshot
+                if len(accepted) > 1:
+                    # don't let one bad order sink the chunk: place its orders one at a time
+                    chunks.extendleft([entry] for entry in reversed(accepted))
+                    break
+                for index, _ in accepted:
+                    results[index] = {'index': index, 'status': 'failed',
+                                      'error': f'Failed to create order: {str(e)}'}
+                break
+            for order_id, (index, _) in zip(order_ids, accepted):
+                results[index] = {'index': index, 'status': 'created', 'id': order_id}
+            break
+
+    elapsed = time.perf_counter() - started
+    created = sum(1 for result in results if result['status'] == 'created')
+    summary = {
+        'received': len(payloads),
+        'created': created,
+        'failed': len(payloads) - created,
+        'elapsed_seconds': round(elapsed, 4),
+        'orders_per_second': round(created / elapsed, 1) if elapsed > 0 else None,
+    }
+    return results, summary
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from .kv import KVError
+
+
+logger = logging.getLogger(__name__)
+
+
+# Versioned product catalog cache
+# - tier 1: in-process LRU, tier 2: the shared KV store (Redis, see app/kv.py)
+# - entries are keyed by a catalog version, anything that changes products or
+#   stock bumps the version, so stale entries are never read again and simply
+#   age out or expire (CATALOG_CACHE_TTL in both tiers, so a version that
+#   comes round again after Redis lost its key can't serve old entries for long)
+# - an entry is the encoded response body plus its strong ETag, so a 304 or
+#   a hit never re-serializes the catalog; its gzip / br bodies are kept on
+#   the in-process entry once compressed, so a hit never re-compresses either
+# - while Redis is unreachable nothing is cached: a bump in one process
+#   could not reach the others, so every read builds the catalog
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+class LRUCache:
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class CatalogEntry:
+    __slots__ = ('etag', 'body', 'headers', 'variants')
+
+    def __init__(self, body, headers=None, etag=None):
+        self.body = body
+        self.headers = headers or {}
+        self.etag = etag or hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {}
+
+    def encoded(self, encoding, compress):
+        """
+        The body in encoding (None: as is), compress(body, encoding) runs once
+        per encoding for the life of the entry, i.e. of its catalog version
+        """
+        if encoding is None:
+            return self.body
+        body = self.variants.get(encoding)
+        if body is None:
+            body = self.variants[encoding] = compress(self.body, encoding)
+        return body
+
+
+class _CatalogState:
+    def __init__(self, app):
+        self.lru = LRUCache(app.config['CATALOG_CACHE_SIZE'], app.config['CATALOG_CACHE_TTL'])
+        self.ttl = app.config['CATALOG_CACHE_TTL']
+
+
+class CatalogCache:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CATALOG_CACHE_SIZE', 64)
+        app.config.setdefault('CATALOG_CACHE_TTL', 300)
+        app.extensions['catalog_cache'] = _CatalogState(app)
+
+    @property
+    def _state(self):
+        return current_app.extensions['catalog_cache']
+
+    @property
+    def _kv(self):
+        return current_app.extensions['kv']
+
+    def version(self):
+        """
+        The shared catalog version, None when it can't be read
+        """
+        try:
+            return int(self._kv.get(CATALOG_VERSION_KEY) or 0)
+        except KVError as e:
+            logger.warning('catalog cache: redis unavailable, not caching: %s', e)
+        return None
+
+    def bump(self):
+        """
+        Invalidate every cached catalog response, call after a commit that
+        changed products or stock
+        """
+        try:
+            self._kv.incr(CATALOG_VERSION_KEY)
+        except KVError as e:
+            logger.warning('catalog cache: could not bump redis version: %s', e)
+
+    def get_or_build(self, key, build):
+        """
+        Return the CatalogEntry for key at the current version.
+        build() -> (body bytes, headers dict) only runs when neither tier has it.
+        """
+        state = self._state
+        version = self.version()
+        if version is None:
+            body, headers = build()
+            return CatalogEntry(body, headers)
+        cache_key = f'catalog:{version}:{key}'
+
+        entry = state.lru.get(cache_key)
+        if entry is not None:
+            return entry
+
+        entry = self._shared_get(cache_key)
+        if entry is None:
+            body, headers = build()
+            entry = CatalogEntry(body, headers)
+            self._shared_set(state, cache_key, entry)
+        state.lru.set(cache_key, entry)
+        return entry
+
+    def _shared_get(self, cache_key):
+        try:
+            body, meta = self._kv.get_many([f'{cache_key}:body', f'{cache_key}:meta'])
+        except KVError:
+            return None
+        if body is None or meta is None:
+            return None
+        meta = json.loads(meta)
+        return CatalogEntry(body, meta['headers'], meta['etag'])
+
+    def _shared_set(self, state, cache_key, entry):
+        try:
+            self._kv.set_many({
+                f'{cache_key}:body': entry.body,
+                f'{cache_key}:meta': json.dumps({'etag': entry.etag, 'headers': entry.headers}),
+            }, ttl=state.ttl)
+        except KVError as e:
+            logger.warning('catalog cache: could not store %s: %s', cache_key, e)
@@ -1,22 +1,110 @@
-from celery import Celery
+from celery import Celery, Task
 from celery.schedules import crontab
+from celery.signals import worker_process_init
+from kombu import Queue
+from flask import has_app_context
 from config import Config
 
+
+# One Flask app (and so one SQLAlchemy engine / pool, one Mail setup) per
+# worker process, built once when the process starts instead of per task run.
+_flask_app = None
+
+
+def init_worker_app(app=None):
+    """
+    Set the Flask app tasks run in for this process, built with create_app()
+    when none is given. Returns it.
+    """
+    global _flask_app
+    if app is None:
+        from app import create_app
+        app = create_app()
+    _flask_app = app
+    return app
+
+
+def get_worker_app():
+    return _flask_app or init_worker_app()
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    # connections inherited from the parent across fork() must not be shared
+    app = get_worker_app()
+    with app.app_context():
+        from app import db
+        from app.emails import warm_templates
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        # email templates compiled once here, not on each process's first email
+        warm_templates(app)
+
+
+class FlaskTask(Task):
+    """Run every task inside the worker's Flask app context"""
+    def __call__(self, *args, **kwargs):
+        # eager calls from a request already have the right app pushed
+        if has_app_context():
+            return self._run_tracked(*args, **kwargs)
+        with get_worker_app().app_context():
+            return self._run_tracked(*args, **kwargs)
+
+    def _run_tracked(self, *args, **kwargs):
+        from app.metrics import track_task
+        with track_task(self.name):
+            return self.run(*args, **kwargs)
+
+
+# Queues, so a long batch job never sits in front of an order confirmation
+# - email: transactional email, short and urgent
+# - notifications: status updates and alerts
+# - batch: beat jobs and bulk updates, long running
+# email / notifications and batch are consumed by separate workers (see
+# docker-compose.yml): a sales report only ever occupies a batch worker.
+TASK_QUEUES = ('email', 'notifications', 'batch')
+
+# Priority (0-9, higher first) orders the messages waiting in one queue, e.g.
+# a bulk shipping update a user is waiting on goes before the nightly
+# cleanup. The queues are declared with x-max-priority, which RabbitMQ (the
+# broker) honours; with the Redis transport it would need priority_steps.
+# task -> (queue, priority, soft time limit, hard time limit), in seconds
+TASK_ROUTES = {
+    'app.tasks.send_order_confirmation': ('email', 9, 30, 60),
+    'app.tasks.send_email_async': ('email', 5, 30, 60),
+    'app.tasks.update_order_status': ('notifications', 6, 30, 60),
+    'app.tasks.send_shipping_notifications': ('notifications', 5, 300, 360),
+    'app.tasks.check_low_stock': ('notifications', 3, 60, 120),
+    'app.tasks.bulk_update_order_status': ('batch', 6, 600, 660),
+    'app.tasks.reconcile_hot_stock': ('batch', 5, 120, 180),
+    'app.tasks.cache_popular_products': ('batch', 3, 300, 360),
+    'app.tasks.cleanup_old_pending_orders': ('batch', 1, 1800, 1900),
+    'app.tasks.generate_daily_sales_report': ('batch', 1, 1800, 1900),
+}
+
+
+# Tasks here are acknowledged when they start, not with CELERY_ACKS_LATE:
+# single emails return with their message still queued in the process's
+# batcher, which is flushed at worker shutdown (see app/tasks.py)
+EARLY_ACK_QUEUES = ('email',)
+
+
 def make_celery(app_name='flasky'):
     celery = Celery(
         app_name,
         broker=Config.CELERY_BROKER_URL,
         backend=Config.CELERY_RESULT_BACKEND,
-        include=['app.tasks']  # This tells Celery where to find tasks
+        include=['app.tasks'],  # This tells Celery where to find tasks
+        task_cls=FlaskTask
     )
 
     celery.config_from_object(Config)
 
     # Celery Beat Schedule
     celery.conf.beat_schedule = {
-        'check-low-stock-daily': {
+        'low-stock-digest': {
             'task': 'app.tasks.check_low_stock',
-            'schedule': crontab(hour=9, minute=0),
+            'schedule': Config.LOW_STOCK_DIGEST_SECONDS,
         },
         'cleanup-old-pending-orders': {
             'task': 'app.tasks.cleanup_old_pending_orders',
@@ -30,6 +118,10 @@ def make_celery(app_name='flasky'):
             'task': 'app.tasks.cache_popular_products',
             'schedule': crontab(minute='*/30'),
         },
+        'reconcile-hot-stock': {
+            'task': 'app.tasks.reconcile_hot_stock',
+            'schedule': Config.HOT_STOCK_RECONCILE_SECONDS,
+        },
     }
 
     celery.conf.update(
@@ -38,6 +130,19 @@ def make_celery(app_name='flasky'):
         result_serializer='json',
         timezone='UTC',
         enable_utc=True,
+        # anything not routed below stays on the default 'celery' queue
+        task_queues=[Queue('celery')] + [
+            Queue(name, routing_key=name, queue_arguments={'x-max-priority': 9}) for name in TASK_QUEUES
+        ],
+        task_routes={
+            task: {'queue': queue, 'routing_key': queue, 'priority': priority}
+            for task, (queue, priority, _, _) in TASK_ROUTES.items()
+        },
+        task_annotations={
+            task: {'soft_time_limit': soft, 'time_limit': hard,
+                   'acks_late': Config.CELERY_ACKS_LATE and queue not in EARLY_ACK_QUEUES}
+            for task, (queue, _, soft, hard) in TASK_ROUTES.items()
+        },
     )
 
     return celery
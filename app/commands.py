@@ -0,0 +1,134 @@
+import click
+from sqlalchemy import inspect, text
+from . import db
+
+
+# Schema upgrades for existing databases
+# db.create_all() only creates missing tables, so columns and indexes added to
+# the models later are brought in here:
+#   flask --app app upgrade-db
+#
+# BACKFILLS: SQL run once the columns are in place, for each (table, column)
+# that was just added to an existing table, in list order. Columns are added
+# nullable (SQLite cannot add a NOT NULL column without a constant default),
+# the backfill fills the existing rows.
+
+BACKFILL_UNIT_PRICES = (
+    'UPDATE order_item SET unit_price = '
+    '(SELECT price FROM product WHERE product.id = order_item.product_id) '
+    'WHERE unit_price IS NULL'
+)
+BACKFILL_ORDER_TOTALS = (
+    'UPDATE "order" SET total_amount = COALESCE('
+    '(SELECT SUM(quantity * unit_price) FROM order_item WHERE order_item.order_id = "order".id), 0)'
+)
+
+BACKFILLS = [
+    (('order', 'created_at'), 'UPDATE "order" SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL'),
+    (('order_item', 'unit_price'), BACKFILL_UNIT_PRICES),
+    (('order', 'total_amount'), BACKFILL_ORDER_TOTALS),
+    # best guess for orders paid before paid_at existed
+    (('order', 'paid_at'), 'UPDATE "order" SET paid_at = created_at WHERE payment_status = \'PAID\' AND paid_at IS NULL'),
+    (('product', 'is_hot'), 'UPDATE product SET is_hot = FALSE WHERE is_hot IS NULL'),
+    (('order_item', 'stock_applied'), 'UPDATE order_item SET stock_applied = TRUE WHERE stock_applied IS NULL'),
+    # the threshold the daily scan used
+    (('product', 'low_stock_threshold'), 'UPDATE product SET low_stock_threshold = 5 WHERE low_stock_threshold IS NULL'),
+]
+
+
+def upgrade_schema():
+    """
+    Create missing tables, add missing columns and indexes.
+    Returns a list of what was changed.
+    """
+    changes = []
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    added = set()
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.add((table.name, column.name))
+                changes.append(f'added column {table.name}.{column.name}')
+
+        for key, backfill in BACKFILLS:
+            if key in added:
+                conn.execute(text(backfill))
+                changes.append(f'backfilled {key[0]}.{key[1]}')
+
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        existing_indexes = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine, checkfirst=True)
+                changes.append(f'created index {index.name}')
+    return changes
+
+
+def register_commands(app):
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Bring an existing database up to the current models."""
+        changes = upgrade_schema()
+        for change in changes:
+            click.echo(change)
+        click.echo('database is up to date' if not changes else f'{len(changes)} change(s) applied')
+
+    @app.cli.command('backfill-order-totals')
+    @click.option('--reprice', is_flag=True,
+                  help='Also overwrite unit prices already set with the current product price.')
+    def backfill_order_totals_command(reprice):
+        """Fill order_item.unit_price and recompute order.total_amount."""
+        with db.engine.begin() as conn:
+            unit_prices = BACKFILL_UNIT_PRICES
+            if reprice:
+                unit_prices = unit_prices.replace(' WHERE unit_price IS NULL', '')
+            items = conn.execute(text(unit_prices)).rowcount
+            orders = conn.execute(text(BACKFILL_ORDER_TOTALS)).rowcount
+        click.echo(f'priced {items} order item(s), recomputed {orders} order total(s)')
+
+    @app.cli.command('sync-low-stock')
+    def sync_low_stock_command():
+        """Rebuild the low-stock set from the database (once, after upgrading)."""
+        from .low_stock import sync_low_stock
+        low = sync_low_stock()
+        click.echo(f'{len(low)} product(s) at or below their low-stock threshold')
+
+    @app.cli.group('hot-stock')
+    def hot_stock_group():
+        """Hot-product stock counters (HOT_STOCK_ENABLED)."""
+
+    @hot_stock_group.command('mark')
+    @click.argument('product_ids', nargs=-1, type=int, required=True)
+    def mark_hot_command(product_ids):
+        """Reserve stock for PRODUCT_IDS on counters."""
+        from .hot_stock import set_hot
+        set_hot(product_ids, hot=True)
+        click.echo(f'{len(product_ids)} product(s) marked hot')
+
+    @hot_stock_group.command('unmark')
+    @click.argument('product_ids', nargs=-1, type=int, required=True)
+    def unmark_hot_command(product_ids):
+        """Back to the database for PRODUCT_IDS (after the drop)."""
+        from .hot_stock import set_hot
+        set_hot(product_ids, hot=False)
+        click.echo(f'{len(product_ids)} product(s) back on the database')
+
+    @hot_stock_group.command('reconcile')
+    def reconcile_hot_command():
+        """Apply pending order lines to stock and report drift."""
+        from .hot_stock import reconcile_hot_stock
+        report = reconcile_hot_stock(app.config['HOT_STOCK_RECONCILE_BATCH'])
+        click.echo(f"applied {sum(report['applied'].values())} unit(s) over {len(report['applied'])} product(s)")
+        for product_id, drift in report['drift'].items():
+            click.echo(f'product {product_id}: counter off by {drift:+d}')
@@ -0,0 +1,82 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+# Database engine setup
+# - the URI and pool settings come from Config (DATABASE_URL, DB_POOL_*)
+# - server databases get a sized, pre-pinged, recycled pool and a statement
+#   timeout passed with the connect arguments
+# - SQLite gets connect-time pragmas: WAL so readers don't block the writer,
+#   synchronous=NORMAL (safe with WAL, one fsync per checkpoint instead of per
+#   commit) and mmap for reads, plus a busy timeout so concurrent writers wait
+#   for the lock instead of failing with "database is locked"
+
+
+def is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS built from the DB_* settings, anything already
+    set in SQLALCHEMY_ENGINE_OPTIONS wins
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if backend != 'sqlite':
+        # SQLite pools are per-file / per-thread, sizing only applies to servers
+        options['pool_size'] = config['DB_POOL_SIZE']
+        options['max_overflow'] = config['DB_MAX_OVERFLOW']
+        options['pool_timeout'] = config['DB_POOL_TIMEOUT']
+
+    timeout = int(config['DB_STATEMENT_TIMEOUT'] or 0)
+    if backend == 'sqlite':
+        # sqlite3's own busy handler, in seconds
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}
+    elif timeout and backend == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    elif timeout and backend in ('mysql', 'mariadb'):
+        options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={timeout}'}
+
+    overrides = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if 'connect_args' in options and 'connect_args' in overrides:
+        overrides['connect_args'] = {**options['connect_args'], **overrides['connect_args']}
+    options.update(overrides)
+    return options
+
+
+def sqlite_pragmas(config, memory=False):
+    pragmas = []
+    if not memory and config['SQLITE_JOURNAL_MODE']:
+        # WAL needs a file, an in-memory database always stays in MEMORY mode
+        pragmas.append(f"journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+    if config['SQLITE_SYNCHRONOUS']:
+        pragmas.append(f"synchronous = {config['SQLITE_SYNCHRONOUS']}")
+    if config['SQLITE_MMAP_SIZE']:
+        pragmas.append(f"mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+    return pragmas
+
+
+def configure_engine(engine, config):
+    """
+    Set the SQLite pragmas on every new connection (no-op for other databases)
+    """
+    if engine.url.get_backend_name() != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config, memory=is_memory_sqlite(engine.url))
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(f'PRAGMA {pragma}')
+        finally:
+            cursor.close()
@@ -0,0 +1,41 @@
+from flask import current_app, render_template
+from flask_mail import Message
+
+
+# Templated emails
+# - email tasks carry a template name and a small JSON context (ids and
+#   scalars), the worker renders the HTML: no markup goes through the broker
+#   or the result backend
+# - the templates are compiled once per worker process (warm_templates runs
+#   at worker_process_init) and served from the app's Jinja cache after that
+
+# name -> (subject, formatted with the context; template file)
+EMAIL_TEMPLATES = {
+    'order_confirmation': ('Order Confirmation', 'email/order_confirmation.html'),
+    'status_update': ('Order #{order_id} Status Update', 'email/status_update.html'),
+    'low_stock': ('Low Stock Alert', 'email/low_stock.html'),
+}
+
+
+def render_email(template, **context):
+    """
+    (subject, html) for one of EMAIL_TEMPLATES, raises KeyError for an unknown name
+    """
+    subject, path = EMAIL_TEMPLATES[template]
+    return subject.format(**context), render_template(path, **context)
+
+
+def build_message(template, to, **context):
+    subject, html = render_email(template, **context)
+    msg = Message(subject, recipients=[to])
+    msg.html = html
+    return msg
+
+
+def warm_templates(app=None):
+    """
+    Compile every email template into the Jinja cache
+    """
+    app = app or current_app
+    for _, path in EMAIL_TEMPLATES.values():
+        app.jinja_env.get_template(path)
@@ -0,0 +1,166 @@
+import zlib
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+
+# Response encoding
+# - FastJSONProvider is the app's JSON provider (jsonify, current_app.json):
+#   orjson when it is installed, the stdlib encoder otherwise or with
+#   JSON_PROVIDER=stdlib. Output matches the default provider (sorted keys,
+#   dates as HTTP dates) and decodes to the same values, except that non-ASCII
+#   text is sent as UTF-8 rather than \u escapes and non-string keys sort as
+#   strings; anything orjson can't encode falls back to stdlib.
+# - Compress (after_request): JSON / text bodies of COMPRESS_MIN_SIZE bytes or
+#   more are sent br (if brotli is installed) or gzip, whichever the client
+#   prefers in Accept-Encoding. Streamed responses (?stream=1) are compressed
+#   chunk by chunk as they are generated, never buffered; server-sent events
+#   are left alone so each event goes out as it happens.
+# - responses with a strong ETag are left alone too: the validator names those
+#   exact bytes and a 304 never reaches the hook. Routes that send one (the
+#   catalog) pick the encoding with negotiate_encoding(), compress once per
+#   cached entry and tag each encoding with its own ETag.
+
+COMPACT_SEPARATORS = (',', ':')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        choice = app.config.get('JSON_PROVIDER', 'auto')
+        if choice not in ('auto', 'orjson', 'stdlib'):
+            raise ValueError(f'JSON_PROVIDER must be auto, orjson or stdlib, not {choice!r}')
+        if choice == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_PROVIDER=orjson but orjson is not installed')
+        self.backend = 'orjson' if orjson is not None and choice != 'stdlib' else 'stdlib'
+
+    def _orjson_options(self):
+        # datetimes go through self.default, like the stdlib path (HTTP dates)
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        # orjson output is always compact: only usable when nothing else
+        # (indent, ensure_ascii, ...) is asked for
+        if self.backend == 'orjson' and kwargs.get('separators', COMPACT_SEPARATORS) == COMPACT_SEPARATORS \
+                and set(kwargs) <= {'separators'}:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode()
+            except TypeError:
+                # e.g. integers over 64 bits, the stdlib encoder handles those
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.backend == 'orjson' and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+
+class _CompressState:
+    def __init__(self, app):
+        self.enabled = app.config['COMPRESS_ENABLED']
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+        self.brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+        self.mimetypes = set(app.config['COMPRESS_MIMETYPES'])
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def _compressor(state, encoding):
+    """
+    (compress(chunk) -> bytes, finish() -> bytes) for one response
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=state.brotli_quality)
+        return compressor.process, compressor.finish
+    # wbits 16 + MAX_WBITS: gzip header and trailer
+    compressor = zlib.compressobj(state.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def negotiate_encoding(size):
+    """
+    Content-Encoding to send a size-byte body with for this request, None for as is
+    """
+    state = current_app.extensions['compress']
+    if not state.enabled or size < state.min_size:
+        return None
+    return request.accept_encodings.best_match(state.encodings)
+
+
+def compress_body(body, encoding):
+    compress, finish = _compressor(current_app.extensions['compress'], encoding)
+    return compress(body) + finish()
+
+
+def _compress_stream(chunks, compress, finish):
+    try:
+        for chunk in chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _has_strong_etag(response):
+    etag, weak = response.get_etag()
+    return etag is not None and not weak
+
+
+class Compress:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+        app.config.setdefault('COMPRESS_MIMETYPES', ['application/json', 'text/plain', 'text/html', 'text/csv'])
+        state = app.extensions['compress'] = _CompressState(app)
+        app.after_request(lambda response: self._after_request(state, response))
+
+    def _after_request(self, state, response):
+        if (not state.enabled
+                or response.mimetype not in state.mimetypes
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.direct_passthrough
+                or _has_strong_etag(response)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(state.encodings)
+        if encoding is None:
+            return response
+
+        compress, finish = _compressor(state, encoding)
+        if response.is_streamed:
+            chunks = response.iter_encoded()
+            response.response = _compress_stream(chunks, compress, finish)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < state.min_size:
+                return response
+            response.set_data(compress(body) + finish())
+
+        response.headers['Content-Encoding'] = encoding
+        return response
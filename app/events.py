@@ -0,0 +1,99 @@
+import json
+import logging
+import time
+from flask import current_app
+from . import kv
+from .kv import KVError
+
+
+logger = logging.getLogger(__name__)
+
+
+# Order status events (GET /api/orders/<id>/events, server-sent events)
+# - pay_order and the update_order_status / bulk_update_order_status tasks
+#   publish only what changed on the order's channel (KV pub/sub: Redis, or
+#   in-process for tests)
+# - a viewer subscribes first, then gets a `snapshot` of the current status,
+#   so nothing published in between is lost, then one event per change
+# - a comment line every SSE_HEARTBEAT seconds keeps proxies from closing
+#   the connection; after SSE_MAX_DURATION seconds (or once the order is
+#   delivered) the stream ends and EventSource reconnects on its own
+
+TERMINAL_SHIPPING_STATUSES = {'delivered'}
+
+
+def order_channel(order_id):
+    return f'orders:{order_id}:events'
+
+
+def publish_order_event(order_id, event, data):
+    """
+    Publish {event, data} to viewers of the order, never fails the caller
+    """
+    try:
+        kv.publish(order_channel(order_id), json.dumps({'event': event, 'data': data}))
+    except KVError as e:
+        logger.warning('Could not publish %s event for order %s: %s', event, order_id, e)
+
+
+def publish_order_events(order_ids, event, data):
+    """
+    Publish the same {event, data} to several orders' viewers in one round
+    trip, never fails the caller
+    """
+    message = json.dumps({'event': event, 'data': data})
+    try:
+        kv.publish_many([(order_channel(order_id), message) for order_id in order_ids])
+    except KVError as e:
+        logger.warning('Could not publish %s events for %d orders: %s', event, len(order_ids), e)
+
+
+def order_status(order):
+    return {
+        'id': order.id,
+        'payment_status': order.payment_status.value,
+        'payment_reference': order.payment_reference,
+        'paid_at': order.paid_at.isoformat() if order.paid_at else None,
+        'shipping_status': order.shipping_status.value,
+    }
+
+
+def format_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def order_event_stream(subscription, snapshot):
+    """
+    SSE body for one viewer. Doesn't touch the database or the app context,
+    so the request's session is released while the stream stays open.
+    """
+    config = current_app.config
+    heartbeat = config['SSE_HEARTBEAT']
+    deadline = time.monotonic() + config['SSE_MAX_DURATION']
+    retry_ms = int(config['SSE_RETRY'] * 1000)
+
+    def generate():
+        try:
+            yield f'retry: {retry_ms}\n'
+            yield format_event('snapshot', snapshot, event_id=0)
+            if snapshot['shipping_status'] in TERMINAL_SHIPPING_STATUSES:
+                return
+            event_id = 0
+            while time.monotonic() < deadline:
+                message = subscription.get(min(heartbeat, max(0.0, deadline - time.monotonic())))
+                if message is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                event_id += 1
+                payload = json.loads(message)
+                yield format_event(payload['event'], payload['data'], event_id=event_id)
+                if payload['data'].get('shipping_status') in TERMINAL_SHIPPING_STATUSES:
+                    return
+        finally:
+            subscription.close()
+
+    return generate()
@@ -0,0 +1,222 @@
+import json
+import logging
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy import case, false, func, select, true, update
+from . import db, kv
+from .inventory import InsufficientStock, crossed_threshold
+from .low_stock import mark_low
+from .models import OrderItem, Product, utcnow
+
+
+logger = logging.getLogger(__name__)
+
+
+# Hot-product stock counters (HOT_STOCK_ENABLED)
+# During a drop every order for the same product serializes on its one
+# Product.stock row. For products flagged is_hot:
+# - stock is taken from a KV counter (stock:hot:<id>) before the DB
+#   transaction, all-or-nothing across the cart (one Lua script on Redis)
+# - the order's lines are stored with stock_applied = false, the product row
+#   isn't touched; the counter is put back if the transaction fails
+# - reconcile_hot_stock (Celery beat) subtracts those lines from
+#   Product.stock in set-based batches and marks them applied
+# - a missing counter is seeded from the database: stock - pending lines
+#
+# No overselling: the counter only goes down by what it had, and the DB path
+# (inventory.reserve_stock) counts pending lines as taken. Drift, counter vs
+# stock - pending, is reported by the reconcile; a counter above the database
+# is brought down, a counter below it is only reported since reservations in
+# flight (counter taken, order not committed yet) look the same.
+
+COUNTER_KEY = 'stock:hot:{}'
+LAST_RECONCILE_KEY = 'hot_stock:last_reconcile'
+
+
+def counter_key(product_id):
+    return COUNTER_KEY.format(product_id)
+
+
+def enabled():
+    return current_app.config['HOT_STOCK_ENABLED']
+
+
+def hot_product_ids(products):
+    """
+    Ids of the products (loaded Product objects) reserved on counters
+    """
+    if not enabled():
+        return set()
+    return {product.id for product in products if product.is_hot}
+
+
+def db_available(product_ids):
+    """
+    {product_id: stock - pending lines}, what a counter should hold
+    """
+    pending = (
+        select(func.coalesce(func.sum(OrderItem.quantity), 0))
+        .where(OrderItem.product_id == Product.id, OrderItem.stock_applied == false())
+        .scalar_subquery()
+    )
+    rows = db.session.execute(select(Product.id, Product.stock - pending).where(Product.id.in_(product_ids)))
+    return dict(rows.all())
+
+
+def seed_counters(product_ids):
+    """
+    Create missing counters from the database (SET NX, a live counter is
+    never overwritten)
+    """
+    for product_id, available in db_available(product_ids).items():
+        kv.set(counter_key(product_id), max(available, 0), nx=True)
+
+
+def available_stock(product_ids):
+    """
+    {product_id: units left on the counter} for counters that exist
+    """
+    product_ids = list(product_ids)
+    values = kv.get_many([counter_key(pid) for pid in product_ids])
+    return {pid: int(value) for pid, value in zip(product_ids, values) if value is not None}
+
+
+def reserve_hot_stock(quantities):
+    """
+    Take {product_id: quantity} from the counters, all or nothing.
+    Raises InsufficientStock for the product that fell short.
+    """
+    if not quantities:
+        return
+    by_key = {counter_key(pid): (pid, quantity) for pid, quantity in sorted(quantities.items())}
+    for attempt in range(2):
+        result = kv.reserve_many({key: quantity for key, (_, quantity) in by_key.items()})
+        if result is None:
+            return
+        reason, key = result
+        if reason == 'short' or attempt:
+            break
+        seed_counters([pid for pid, _ in by_key.values()])
+    product_id, quantity = by_key[key]
+    raise InsufficientStock(product_id, quantity)
+
+
+def release_hot_stock(quantities):
+    """
+    Give {product_id: quantity} back to the counters that exist
+    """
+    if quantities and enabled():
+        kv.release_many({counter_key(pid): quantity for pid, quantity in quantities.items()})
+
+
+@contextmanager
+def hot_reservation(quantities, hot_ids):
+    """
+    Reserve the hot part of quantities on counters for the block, handing it
+    back if the block raises. Yields the set of product ids reserved that way,
+    their lines go in with stock_applied=False and skip reserve_stock.
+    """
+    hot = {pid: quantity for pid, quantity in quantities.items() if pid in hot_ids}
+    reserve_hot_stock(hot)
+    try:
+        yield set(hot)
+    except BaseException:
+        release_hot_stock(hot)
+        raise
+
+
+def apply_pending_stock(batch_size=1000):
+    """
+    Subtract pending lines from Product.stock, batch_size lines per
+    transaction. Returns {product_id: quantity applied}.
+    """
+    applied = {}
+    while True:
+        lines = db.session.execute(
+            select(OrderItem.id, OrderItem.product_id, OrderItem.quantity)
+            .where(OrderItem.stock_applied == false())
+            .order_by(OrderItem.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not lines:
+            break
+
+        quantities = {}
+        for _, product_id, quantity in lines:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        line_ids = [line_id for line_id, _, _ in lines]
+
+        marked = db.session.execute(
+            update(OrderItem)
+            .where(OrderItem.id.in_(line_ids), OrderItem.stock_applied == false())
+            .values(stock_applied=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if marked != len(line_ids):
+            # another reconcile got some of them first, start over
+            db.session.rollback()
+            continue
+        rows = db.session.execute(
+            update(Product)
+            .where(Product.id.in_(quantities))
+            .values(stock=Product.stock - case(quantities, value=Product.id))
+            .returning(Product.id, Product.stock, Product.low_stock_threshold)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        mark_low(crossed_threshold(rows, quantities))
+        for product_id, quantity in quantities.items():
+            applied[product_id] = applied.get(product_id, 0) + quantity
+    return applied
+
+
+def measure_drift(product_ids):
+    """
+    {product_id: counter - (stock - pending)} for hot products with a counter
+    """
+    expected = db_available(product_ids)
+    counters = available_stock(expected)
+    return {pid: counters[pid] - expected[pid] for pid in counters}
+
+
+def reconcile_hot_stock(batch_size=1000):
+    """
+    Write-behind: apply pending lines to Product.stock, seed missing counters,
+    report drift and bring down counters that are above the database.
+    """
+    applied = apply_pending_stock(batch_size)
+    report = {'applied': applied, 'drift': {}, 'corrected': {}, 'at': utcnow().isoformat()}
+    if enabled():
+        hot_ids = list(db.session.scalars(select(Product.id).where(Product.is_hot == true())))
+        if hot_ids:
+            seed_counters(hot_ids)
+            drift = {pid: d for pid, d in measure_drift(hot_ids).items() if d}
+            report['drift'] = drift
+            corrected = {pid: -d for pid, d in drift.items() if d > 0}
+            if corrected:
+                release_hot_stock(corrected)
+                report['corrected'] = corrected
+            for pid, d in drift.items():
+                logger.warning('Hot stock counter for product %s is off by %+d', pid, d)
+        kv.set(LAST_RECONCILE_KEY, json.dumps(report))
+    return report
+
+
+def set_hot(product_ids, hot=True):
+    """
+    Flag / unflag products. A product taken off loses its counter and is
+    reconciled right away so its stock is exact again for the normal path;
+    do it once the drop is over, an order still holding units on the old
+    counter is only counted by the normal path after it commits.
+    """
+    db.session.execute(
+        update(Product).where(Product.id.in_(product_ids)).values(is_hot=hot)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if hot:
+        seed_counters(product_ids)
+    else:
+        kv.delete(*[counter_key(pid) for pid in product_ids])
+        apply_pending_stock()
@@ -0,0 +1,112 @@
+import functools
+import hashlib
+import json
+import time
+import uuid
+from flask import current_app, jsonify, make_response, request
+from . import kv
+from .kv import KVError
+
+
+# Idempotency-Key support for POST endpoints
+# - the first response for a key is stored in the KV store for
+#   IDEMPOTENCY_TTL seconds and replayed as-is for retries with the same key
+#   (Idempotent-Replayed: true), the view doesn't run again
+# - while the first request is still running, the key is held with SET NX;
+#   duplicates wait for the stored response instead of doing the work twice
+#   and get a 409 if it doesn't show up within IDEMPOTENCY_LOCK_TIMEOUT;
+#   if the lock goes without a stored response, the duplicate takes it over
+# - a key reused with a different body is a 422
+# - 5xx responses are not stored so the client can retry them
+# - without the header, or with the KV store down, the view runs as usual
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    entry = json.loads(stored)
+    if entry['fingerprint'] != fingerprint:
+        return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used with a different request body'}), 422
+    response = current_app.response_class(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _store(key, response, fingerprint):
+    entry = {
+        'status': response.status_code,
+        'mimetype': response.mimetype,
+        'body': response.get_data(as_text=True),
+        'fingerprint': fingerprint,
+    }
+    kv.set(key, json.dumps(entry), ttl=current_app.config['IDEMPOTENCY_TTL'])
+
+
+def _release(lock_key, token):
+    try:
+        # only release our own lock, it may have expired and been retaken
+        if kv.get(lock_key) == token.encode():
+            kv.delete(lock_key)
+    except KVError:
+        pass
+
+
+def idempotent(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key:
+            return view(*args, **kwargs)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        # scoped to the endpoint, one key can't replay another route's answer
+        key = f'idempotency:{request.method}:{request.path}:{idempotency_key}'
+        lock_key = f'{key}:lock'
+        fingerprint = _fingerprint()
+        lock_timeout = current_app.config['IDEMPOTENCY_LOCK_TIMEOUT']
+        token = uuid.uuid4().hex
+        try:
+            stored = kv.get(key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            locked = kv.set(lock_key, token, ttl=lock_timeout, nx=True)
+            deadline = time.monotonic() + lock_timeout
+            while not locked:
+                if time.monotonic() >= deadline:
+                    return jsonify({'error': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'}), 409
+                time.sleep(0.05)
+                stored = kv.get(key)
+                if stored is not None:
+                    return _replay(stored, fingerprint)
+                # a lock gone with nothing stored: the first request failed
+                # (5xx) or expired, this one does the work
+                locked = kv.set(lock_key, token, ttl=lock_timeout, nx=True)
+
+            # the first request may have stored its response and released
+            # the lock between our GET and SET NX
+            stored = kv.get(key)
+            if stored is not None:
+                _release(lock_key, token)
+                return _replay(stored, fingerprint)
+        except KVError:
+            return view(*args, **kwargs)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code < 500:
+                # stored before the lock goes, a waiting duplicate must find it
+                try:
+                    _store(key, response, fingerprint)
+                except KVError:
+                    pass
+        finally:
+            _release(lock_key, token)
+        return response
+    return wrapper
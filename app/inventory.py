@@ -0,0 +1,166 @@
+from sqlalchemy import case, delete, false, func, select, true, update
+from . import db
+from .models import Order, OrderItem, PaymentStatus, Product
+
+
+# Stock reservation
+# - products for a whole cart are fetched with one IN query
+# - stock is taken with one conditional update per cart (stock = stock - q
+#   WHERE stock >= q, q picked per row with CASE), so two concurrent orders
+#   can never both pass the check and oversell
+# - order lines reserved on a hot product's counter (app/hot_stock.py) are not
+#   in Product.stock until reconciled, the check here counts them as taken
+# - the caller owns the transaction: on InsufficientStock it rolls everything back
+# - the same UPDATE returns the new stock, so products that just went below
+#   their low_stock_threshold come back without another query (app/low_stock.py)
+# - stale pending orders are purged in bounded batches, each batch gives its
+#   stock back with one aggregated UPDATE and bulk-deletes its rows
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f'Insufficient stock for product {product_id}')
+
+
+def is_valid_quantity(quantity):
+    # bool is an int subclass, and a negative quantity would add stock
+    return isinstance(quantity, int) and not isinstance(quantity, bool) and quantity > 0
+
+
+def is_valid_product_id(product_id):
+    # "1" or true would look up / report the wrong product, a list can't be a key
+    return isinstance(product_id, int) and not isinstance(product_id, bool)
+
+
+def load_products(product_ids):
+    """
+    Fetch every product in product_ids with a single query, keyed by id
+    """
+    stmt = select(Product).where(Product.id.in_(set(product_ids)))
+    return {product.id: product for product in db.session.scalars(stmt)}
+
+
+def aggregate_quantities(items):
+    """
+    Sum the requested quantity per product, a cart may list a product twice
+    """
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+
+def pending_quantity():
+    """
+    Correlated subquery: units of Product sold on its hot counter and not yet
+    subtracted from Product.stock (0 for almost every product)
+    """
+    return func.coalesce(
+        select(func.sum(OrderItem.quantity))
+        .where(OrderItem.product_id == Product.id, OrderItem.stock_applied == false())
+        .scalar_subquery(),
+        0
+    )
+
+
+def crossed_threshold(rows, taken):
+    """
+    Ids of products that went low. rows: (product_id, new stock, threshold)
+    after taking taken ({product_id: quantity})
+    """
+    return {
+        product_id for product_id, stock, threshold in rows
+        if stock <= threshold < stock + taken.get(product_id, 0)
+    }
+
+
+def reserve_stock(quantities):
+    """
+    Atomically take quantities ({product_id: quantity}) out of stock with one
+    conditional UPDATE over the whole cart, so the statement count doesn't
+    grow with the number of lines. Raises InsufficientStock for the lowest
+    product id that lost; the caller rolls back the lines that went through.
+    Returns the ids of products that crossed their low-stock threshold.
+    """
+    if not quantities:
+        return set()
+    wanted = case(quantities, value=Product.id)
+    rows = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(quantities), Product.stock - pending_quantity() >= wanted)
+        .values(stock=Product.stock - wanted)
+        .returning(Product.id, Product.stock, Product.low_stock_threshold)
+        .execution_options(synchronize_session=False)
+    ).all()
+    missing = sorted(set(quantities) - {row[0] for row in rows})
+    if missing:
+        raise InsufficientStock(missing[0], quantities[missing[0]])
+    return crossed_threshold(rows, quantities)
+
+
+def restore_stock_for_orders(order_ids):
+    """
+    Give back the stock held by order_ids with a single UPDATE:
+    stock = stock + (sum of the batch's applied quantities for that product).
+    Returns ({product_id: quantity} of everything the batch held on hot
+    products, for their counters; ids of products back above their low-stock
+    threshold).
+    """
+    lines = lambda *criteria: (
+        select(func.coalesce(func.sum(OrderItem.quantity), 0))
+        .where(OrderItem.product_id == Product.id, OrderItem.order_id.in_(order_ids), *criteria)
+        .scalar_subquery()
+    )
+    returned = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(select(OrderItem.product_id).where(OrderItem.order_id.in_(order_ids))))
+        .values(stock=Product.stock + lines(OrderItem.stock_applied == true()))
+        .returning(Product.id, Product.is_hot, lines(), Product.stock, Product.low_stock_threshold)
+        .execution_options(synchronize_session=False)
+    ).all()
+    hot_returned = {product_id: quantity for product_id, is_hot, quantity, _, _ in returned if is_hot}
+    restocked = {product_id for product_id, _, _, stock, threshold in returned if stock > threshold}
+    return hot_returned, restocked
+
+
+def purge_pending_orders(cutoff, batch_size=500):
+    """
+    Delete orders still pending since before cutoff, batch_size orders per
+    transaction, restoring their stock. Returns how many were deleted.
+    """
+    # Import here to avoid circular imports
+    from .hot_stock import release_hot_stock
+    from .low_stock import mark_restocked
+
+    deleted = 0
+    while True:
+        # locked so a payment can't land between restoring stock and deleting
+        # (FOR UPDATE is a no-op on SQLite, where the writer lock covers it)
+        order_ids = db.session.scalars(
+            select(Order.id)
+            .where(Order.payment_status == PaymentStatus.PENDING, Order.created_at < cutoff)
+            .order_by(Order.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not order_ids:
+            break
+
+        hot_returned, restocked = restore_stock_for_orders(order_ids)
+        db.session.execute(
+            delete(OrderItem).where(OrderItem.order_id.in_(order_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            delete(Order).where(Order.id.in_(order_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        # counters only after the commit, a failed batch must not free stock
+        release_hot_stock(hot_returned)
+        mark_restocked(restocked)
+        deleted += len(order_ids)
+    return deleted
+
@@ -0,0 +1,487 @@
+import logging
+import os
+import queue
+import threading
+import time
+import redis
+from flask import current_app
+
+
+logger = logging.getLogger(__name__)
+
+# Small key/value layer over Redis
+# - RedisKV: one connection pool per process, sized and timed out from config
+#   (CACHE_REDIS_*), not the Celery result backend URL
+# - multi-key operations (get_many / set_many / expire_many / incr_many) are a single
+#   MGET or one pipelined round trip
+# - publish / publish_many / subscribe: Redis pub/sub (publish_many is one
+#   pipelined round trip). Subscriptions don't hold a pool connection each:
+#   one listener thread per process owns a single pub/sub connection of its
+#   own and fans messages out to in-process queues, like MemoryKV does
+# - reserve_many / release_many: all-or-nothing DECRBY over several counters
+#   and INCRBY of counters that exist, one Lua script each on Redis
+# - add_members / remove_members / members / pop_members: sets (SADD, SREM,
+#   SMEMBERS, SMEMBERS + DEL in one transaction)
+# - MemoryKV: same API in-process (CACHE_REDIS_URL=memory://), for tests,
+#   benchmarks and running without a Redis server
+# Values come back as bytes from both backends.
+
+KVError = redis.RedisError
+
+# returns 0 when every counter was taken, i when KEYS[i] is short, -i when missing
+RESERVE_MANY_SCRIPT = """
+for i = 1, #KEYS do
+    local current = redis.call('GET', KEYS[i])
+    if not current then
+        return -i
+    end
+    if tonumber(current) < tonumber(ARGV[i]) then
+        return i
+    end
+end
+for i = 1, #KEYS do
+    redis.call('DECRBY', KEYS[i], ARGV[i])
+end
+return 0
+"""
+
+RELEASE_MANY_SCRIPT = """
+for i = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], ARGV[i])
+    end
+end
+return #KEYS
+"""
+
+
+def _reserve_result(keys, code):
+    if code == 0:
+        return None
+    return ('missing' if code < 0 else 'short', keys[abs(code) - 1])
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class RedisKV:
+    def __init__(self, url, max_connections=50, socket_timeout=1.0,
+                 socket_connect_timeout=1.0, health_check_interval=30):
+        self.pool = redis.ConnectionPool.from_url(
+            url,
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            health_check_interval=health_check_interval,
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        # its own single connection, however many viewers subscribe
+        self.hub = PubSubHub(
+            redis.Redis.from_url(url, socket_connect_timeout=socket_connect_timeout,
+                                 health_check_interval=health_check_interval),
+            subscribe_timeout=socket_connect_timeout + socket_timeout,
+        )
+        self._reserve_many = self.client.register_script(RESERVE_MANY_SCRIPT)
+        self._release_many = self.client.register_script(RELEASE_MANY_SCRIPT)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def get_many(self, keys):
+        return self.client.mget(keys) if keys else []
+
+    def set(self, key, value, ttl=None, nx=False):
+        return bool(self.client.set(key, value, ex=ttl, nx=nx))
+
+    def set_many(self, mapping, ttl=None):
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ttl)
+        pipe.execute()
+
+    def expire(self, key, ttl):
+        return bool(self.client.expire(key, ttl))
+
+    def expire_many(self, keys, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.expire(key, ttl)
+        pipe.execute()
+
+    def delete(self, *keys):
+        return self.client.delete(*keys) if keys else 0
+
+    def incr(self, key, amount=1):
+        return self.client.incr(key, amount)
+
+    def incr_many(self, mapping):
+        pipe = self.client.pipeline(transaction=False)
+        for key, amount in mapping.items():
+            pipe.incrby(key, amount)
+        return pipe.execute()
+
+    def reserve_many(self, mapping):
+        """
+        Take every {counter: amount} or none of them. Returns None when
+        taken, else ('short' | 'missing', first counter that stopped it).
+        """
+        if not mapping:
+            return None
+        keys = list(mapping)
+        return _reserve_result(keys, self._reserve_many(keys=keys, args=[mapping[k] for k in keys]))
+
+    def release_many(self, mapping):
+        """
+        Add amounts back to counters that still exist (never recreates one)
+        """
+        if mapping:
+            keys = list(mapping)
+            self._release_many(keys=keys, args=[mapping[k] for k in keys])
+
+    def add_members(self, key, members):
+        """
+        Add members to the set at key, returns the ones that weren't in it yet
+        """
+        members = list(members)
+        if not members:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for member in members:
+            pipe.sadd(key, member)
+        return [member for member, added in zip(members, pipe.execute()) if added]
+
+    def remove_members(self, key, members):
+        members = list(members)
+        return self.client.srem(key, *members) if members else 0
+
+    def members(self, key):
+        return self.client.smembers(key)
+
+    def pop_members(self, key):
+        """
+        Read and empty the set at key atomically
+        """
+        pipe = self.client.pipeline(transaction=True)
+        pipe.smembers(key)
+        pipe.delete(key)
+        return pipe.execute()[0]
+
+    def publish(self, channel, message):
+        return self.client.publish(channel, message)
+
+    def publish_many(self, messages):
+        """
+        Publish [(channel, message), ...] in one round trip
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for channel, message in messages:
+            pipe.publish(channel, message)
+        return pipe.execute()
+
+    def subscribe(self, channel):
+        return self.hub.subscribe(channel)
+
+    def close(self):
+        self.hub.close()
+        self.pool.disconnect()
+
+
+class PubSubHub:
+    """
+    One Redis pub/sub connection per process, read by a listener thread that
+    puts each message on the queue of every local subscription to its
+    channel. SUBSCRIBE / UNSUBSCRIBE are sent by the listener as well (a
+    PubSub object isn't shared between threads); subscribe() waits for
+    Redis to confirm, so nothing published after it returns is missed.
+    """
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, client, subscribe_timeout=2.0):
+        self.client = client
+        self.subscribe_timeout = subscribe_timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._channels = {}
+        self._confirmed = {}
+        self._commands = []
+        self._stopped = None
+        self._thread = None
+
+    def _ensure_listener(self):
+        # called with the lock held; a forked child starts its own listener
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None:
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(target=self._listen, args=(self._stopped,), name='kv-pubsub', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, channel):
+        subscription = MemorySubscription(self, channel)
+        with self._lock:
+            self._ensure_listener()
+            subscriptions = self._channels.setdefault(channel, set())
+            if not subscriptions:
+                self._confirmed[channel] = threading.Event()
+                self._commands.append(('subscribe', channel))
+            subscriptions.add(subscription)
+            confirmed = self._confirmed[channel]
+        if not confirmed.wait(self.subscribe_timeout):
+            subscription.close()
+            raise KVError(f'Could not subscribe to {channel}')
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._channels.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions and self._channels.pop(subscription.channel, None) is not None:
+                self._confirmed.pop(subscription.channel, None)
+                self._commands.append(('unsubscribe', subscription.channel))
+
+    def _listen(self, stopped):
+        pubsub = self.client.pubsub()
+        try:
+            while not stopped.is_set():
+                try:
+                    with self._lock:
+                        commands, self._commands = self._commands, []
+                    for command, channel in commands:
+                        getattr(pubsub, command)(channel)
+                    message = pubsub.get_message(timeout=self.POLL_INTERVAL)
+                except KVError as e:
+                    # redis-py reconnects and resubscribes on the next call
+                    logger.warning('Pub/sub listener error: %s', e)
+                    stopped.wait(self.POLL_INTERVAL)
+                    continue
+                if message is not None:
+                    self._dispatch(message)
+        finally:
+            pubsub.close()
+
+    def _dispatch(self, message):
+        channel = message['channel'].decode()
+        with self._lock:
+            if message['type'] == 'subscribe':
+                confirmed = self._confirmed.get(channel)
+                if confirmed is not None:
+                    confirmed.set()
+                return
+            subscriptions = list(self._channels.get(channel, ())) if message['type'] == 'message' else []
+        for subscription in subscriptions:
+            subscription.queue.put(message['data'])
+
+    def close(self):
+        with self._lock:
+            if self._stopped is not None:
+                self._stopped.set()
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1)
+
+
+class MemorySubscription:
+    def __init__(self, kv, channel):
+        self.kv = kv
+        self.channel = channel
+        self.queue = queue.Queue()
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.kv._unsubscribe(self)
+
+
+class MemoryKV:
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._channels = {}
+        self._lock = threading.RLock()
+
+    def _alive(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            return self._data[key] if self._alive(key) else None
+
+    def get_many(self, keys):
+        with self._lock:
+            return [self.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None, nx=False):
+        with self._lock:
+            if nx and self._alive(key):
+                return False
+            self._data[key] = _to_bytes(value)
+            if ttl:
+                self._expires[key] = time.monotonic() + ttl
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def set_many(self, mapping, ttl=None):
+        with self._lock:
+            for key, value in mapping.items():
+                self.set(key, value, ttl)
+
+    def expire(self, key, ttl):
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._expires[key] = time.monotonic() + ttl
+            return True
+
+    def expire_many(self, keys, ttl):
+        with self._lock:
+            for key in keys:
+                self.expire(key, ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._alive(key):
+                    removed += 1
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return removed
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = int(self.get(key) or 0) + amount
+            self._data[key] = _to_bytes(value)
+            return value
+
+    def incr_many(self, mapping):
+        with self._lock:
+            return [self.incr(key, amount) for key, amount in mapping.items()]
+
+    def reserve_many(self, mapping):
+        with self._lock:
+            keys = list(mapping)
+            for i, key in enumerate(keys, 1):
+                current = self.get(key)
+                if current is None:
+                    return _reserve_result(keys, -i)
+                if int(current) < mapping[key]:
+                    return _reserve_result(keys, i)
+            for key in keys:
+                self.incr(key, -mapping[key])
+            return None
+
+    def release_many(self, mapping):
+        with self._lock:
+            for key, amount in mapping.items():
+                if self._alive(key):
+                    self.incr(key, amount)
+
+    def add_members(self, key, members):
+        with self._lock:
+            if not self._alive(key):
+                self._data[key] = set()
+            current = self._data[key]
+            added = []
+            for member in members:
+                if _to_bytes(member) not in current:
+                    current.add(_to_bytes(member))
+                    added.append(member)
+            return added
+
+    def remove_members(self, key, members):
+        with self._lock:
+            if not self._alive(key):
+                return 0
+            current = self._data[key]
+            removed = {_to_bytes(member) for member in members} & current
+            current -= removed
+            if not current:
+                self.delete(key)
+            return len(removed)
+
+    def members(self, key):
+        with self._lock:
+            return set(self._data[key]) if self._alive(key) else set()
+
+    def pop_members(self, key):
+        with self._lock:
+            members = self.members(key)
+            self.delete(key)
+            return members
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.queue.put(_to_bytes(message))
+        return len(subscriptions)
+
+    def publish_many(self, messages):
+        return [self.publish(channel, message) for channel, message in messages]
+
+    def subscribe(self, channel):
+        subscription = MemorySubscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._channels.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._channels.pop(subscription.channel, None)
+
+    def close(self):
+        pass
+
+
+def create_kv(url, **pool_options):
+    if url.startswith('memory://'):
+        return MemoryKV()
+    return RedisKV(url, **pool_options)
+
+
+class KV:
+    """
+    Flask extension, `kv.get(...)` goes to the current app's backend
+    """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_REDIS_URL', 'memory://')
+        app.config.setdefault('CACHE_REDIS_MAX_CONNECTIONS', 50)
+        app.config.setdefault('CACHE_REDIS_SOCKET_TIMEOUT', 1.0)
+        app.config.setdefault('CACHE_REDIS_CONNECT_TIMEOUT', 1.0)
+        app.config.setdefault('CACHE_REDIS_HEALTH_CHECK_INTERVAL', 30)
+        app.extensions['kv'] = create_kv(
+            app.config['CACHE_REDIS_URL'] or 'memory://',
+            max_connections=app.config['CACHE_REDIS_MAX_CONNECTIONS'],
+            socket_timeout=app.config['CACHE_REDIS_SOCKET_TIMEOUT'],
+            socket_connect_timeout=app.config['CACHE_REDIS_CONNECT_TIMEOUT'],
+            health_check_interval=app.config['CACHE_REDIS_HEALTH_CHECK_INTERVAL'],
+        )
+
+    @property
+    def backend(self):
+        return current_app.extensions['kv']
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
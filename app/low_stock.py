@@ -0,0 +1,87 @@
+import logging
+from sqlalchemy import select
+from . import db, kv
+from .inventory import pending_quantity
+from .kv import KVError
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+
+# Low-stock alerts, driven by the stock updates instead of a daily scan
+# - the statements that take stock (inventory.reserve_stock, the hot-stock
+#   reconcile) return the new stock of what they touched; a product whose
+#   stock went from above its low_stock_threshold to at or below it crossed
+# - LOW_STOCK_KEY (a set of product ids) holds every product at or below its
+#   threshold: ids are added on the crossing and removed when stock comes back
+#   up (purged orders), never rebuilt
+# - only ids that weren't in the set yet are alerted, so a product alerts once
+#   per crossing; they wait in LOW_STOCK_PENDING_KEY until the check_low_stock
+#   beat task sends them as one digest every LOW_STOCK_DIGEST_SECONDS
+# - everything here runs after the commit and never fails the order
+
+LOW_STOCK_KEY = 'low_stock_products'
+LOW_STOCK_PENDING_KEY = 'low_stock_products:pending'
+
+
+def mark_low(product_ids):
+    """
+    Add products to the low-stock set, queueing the new ones for the digest
+    """
+    if not product_ids:
+        return
+    try:
+        new = kv.add_members(LOW_STOCK_KEY, sorted(product_ids))
+        if new:
+            kv.add_members(LOW_STOCK_PENDING_KEY, new)
+    except KVError as e:
+        logger.warning('Could not record low stock for products %s: %s', sorted(product_ids), e)
+
+
+def mark_restocked(product_ids):
+    """
+    Take products back out of the set, their next crossing alerts again
+    """
+    if not product_ids:
+        return
+    try:
+        kv.remove_members(LOW_STOCK_KEY, sorted(product_ids))
+    except KVError as e:
+        logger.warning('Could not clear low stock for products %s: %s', sorted(product_ids), e)
+
+
+def low_stock_ids():
+    return {int(member) for member in kv.members(LOW_STOCK_KEY)}
+
+
+def is_low():
+    # hot-product units sold but not reconciled yet are already gone
+    return Product.stock - pending_quantity() <= Product.low_stock_threshold
+
+
+def pop_digest():
+    """
+    Take the products queued since the last digest, the ones still at or
+    below their threshold as (id, name, stock left, threshold) rows
+    """
+    product_ids = {int(member) for member in kv.pop_members(LOW_STOCK_PENDING_KEY)}
+    if not product_ids:
+        return []
+    return db.session.execute(
+        select(Product.id, Product.name, Product.stock - pending_quantity(), Product.low_stock_threshold)
+        .where(Product.id.in_(product_ids), is_low())
+        .order_by(Product.id)
+    ).all()
+
+
+def sync_low_stock():
+    """
+    One full scan to bring the set in line with the database (after upgrading,
+    or if Redis lost it). Products newly found low are queued for the digest.
+    Returns the ids that are low.
+    """
+    low = set(db.session.scalars(select(Product.id).where(is_low())))
+    kv.remove_members(LOW_STOCK_KEY, low_stock_ids() - low)
+    mark_low(low)
+    return low
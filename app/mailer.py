@@ -0,0 +1,160 @@
+import logging
+import smtplib
+import threading
+from flask import current_app
+
+
+logger = logging.getLogger(__name__)
+
+
+# Batching email sender
+# - messages queue up per process and go out together over one SMTP session
+#   (one mail.connect(): one TCP + TLS handshake + login per batch)
+# - a batch is flushed when MAIL_BATCH_SIZE messages are queued or
+#   MAIL_BATCH_WINDOW seconds after the first one, whichever comes first
+#   (a window of 0 sends every message straight away)
+# - each message is retried MAIL_SEND_RETRIES times, a dropped connection is
+#   reopened for the rest of the batch
+# - a message that still fails for a reason that may go away (4xx, dropped
+#   connection) is handed to its on_failure callback, the caller decides
+#   whether it goes out again later (see app/tasks.py)
+
+
+class _BatcherState:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config['MAIL_BATCH_SIZE']
+        self.window = app.config['MAIL_BATCH_WINDOW']
+        self.retries = app.config['MAIL_SEND_RETRIES']
+        self.pending = []
+        self.lock = threading.Lock()
+        self.timer = None
+
+
+class EmailBatcher:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_BATCH_SIZE', 50)
+        app.config.setdefault('MAIL_BATCH_WINDOW', 2.0)
+        app.config.setdefault('MAIL_SEND_RETRIES', 2)
+        app.extensions['email_batcher'] = _BatcherState(app)
+
+    @property
+    def _state(self):
+        return current_app.extensions['email_batcher']
+
+    def add(self, message, on_failure=None):
+        """
+        Queue a flask_mail.Message for the next batch. on_failure(error) is
+        called if it can't be sent for now (not on a permanent failure)
+        """
+        state = self._state
+        with state.lock:
+            state.pending.append((message, on_failure))
+            full = len(state.pending) >= state.batch_size or state.window <= 0
+            if not full and state.timer is None:
+                state.timer = threading.Timer(state.window, self._flush_from_timer, args=(state,))
+                state.timer.daemon = True
+                state.timer.start()
+        if full:
+            self.flush()
+
+    def pending(self):
+        return len(self._state.pending)
+
+    def flush(self):
+        """
+        Send everything queued now. Returns (sent, failed) counts.
+        """
+        return self._flush(self._state)
+
+    def send_batch(self, messages):
+        """
+        Send messages now over one connection, without going through the
+        queue. Returns the ones worth sending again later.
+        """
+        failures = []
+        self._send_batch(self._state, [(message, lambda error, message=message: failures.append(message))
+                                       for message in messages])
+        return failures
+
+    def _flush_from_timer(self, state):
+        with state.app.app_context():
+            self._flush(state)
+
+    def _flush(self, state):
+        with state.lock:
+            items, state.pending = state.pending, []
+            if state.timer is not None:
+                state.timer.cancel()
+                state.timer = None
+        if not items:
+            return 0, 0
+        return self._send_batch(state, items)
+
+    def _send_batch(self, state, items):
+        from app import mail
+
+        sent = failed = 0
+        conn = None
+        try:
+            for message, on_failure in items:
+                error = None
+                permanent = False
+                for attempt in range(state.retries + 1):
+                    try:
+                        if conn is None:
+                            conn = mail.connect()
+                            conn.__enter__()
+                        conn.send(message)
+                        error = None
+                        break
+                    except smtplib.SMTPServerDisconnected as e:
+                        error = e
+                        conn = self._close(conn)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                        # 4xx is worth another try, 5xx will never go through
+                        error = e
+                        if not self._is_transient(e):
+                            permanent = True
+                            break
+                    except OSError as e:
+                        # SMTPException and socket errors, start over on a new session
+                        error = e
+                        conn = self._close(conn)
+                    except Exception as e:
+                        # bad headers / no sender: retrying won't help
+                        error = e
+                        permanent = True
+                        break
+                if error is None:
+                    sent += 1
+                else:
+                    failed += 1
+                    logger.warning('Failed to send email to %s: %s', message.recipients, error)
+                    if on_failure is not None and not permanent:
+                        try:
+                            on_failure(error)
+                        except Exception:
+                            logger.exception('on_failure callback for %s raised', message.recipients)
+        finally:
+            self._close(conn)
+        return sent, failed
+
+    @staticmethod
+    def _is_transient(error):
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return all(400 <= code < 500 for code, _ in error.recipients.values())
+        return 400 <= error.smtp_code < 500
+
+    @staticmethod
+    def _close(conn):
+        if conn is not None and conn.host is not None:
+            try:
+                conn.host.quit()
+            except (smtplib.SMTPException, OSError):
+                conn.host.close()
+        return None
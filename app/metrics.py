@@ -0,0 +1,282 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, request
+from sqlalchemy import event
+from .kv import KVError
+
+
+# Request and task instrumentation
+# - SQLAlchemy before/after_cursor_execute count statements and time spent in
+#   the database for whatever is being tracked (a request, a task, or both
+#   when a task runs eagerly inside a request)
+# - Flask before/after_request record wall time, query count and DB time per
+#   endpoint into histograms kept in the process
+# - Celery tasks (FlaskTask) record the same per task name into the KV store
+#   with one pipelined INCRBY, the workers are other processes and the web
+#   process has to be able to report them
+# - GET /api/metrics renders both in the Prometheus text format
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TASK_METRICS_PREFIX = 'metrics:task'
+
+_active = contextvars.ContextVar('query_stats', default=())
+
+
+class QueryStats:
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+@contextmanager
+def track_queries():
+    """
+    Collect query count and DB time for the statements run inside the block
+    """
+    stats = QueryStats()
+    token = _active.set(_active.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    active = _active.get()
+    if not active or context is None:
+        return
+    elapsed = time.perf_counter() - getattr(context, '_metrics_started', time.perf_counter())
+    for stats in active:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(engine):
+    if not event.contains(engine, 'after_cursor_execute', _after_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            # per-bucket counts (not cumulative) + the +Inf overflow, sum
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total) in sorted(self.series.items()):
+            lines.extend(render_histogram(self.name, dict(zip(self.labels, label_values)),
+                                          self.buckets, counts, total))
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, label_values, amount=1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{format_labels(dict(zip(self.labels, label_values)))} {value}')
+        return lines
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render_histogram(name, labels, buckets, counts, total):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets + (float('inf'),), counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{format_labels({**labels, "le": format_value(bound)})} {cumulative}')
+    lines.append(f'{name}_sum{format_labels(labels)} {total}')
+    lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    return lines
+
+
+class _Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        labels = ('endpoint', 'method')
+        self.requests = Counter('flasky_http_requests_total', 'HTTP requests handled.',
+                                labels + ('status',))
+        self.duration = Histogram('flasky_http_request_duration_seconds', 'Wall time per request.',
+                                  labels, DURATION_BUCKETS)
+        self.queries = Histogram('flasky_http_request_db_queries', 'SQL statements per request.',
+                                 labels, QUERY_BUCKETS)
+        self.db_time = Histogram('flasky_http_request_db_duration_seconds', 'Time in the database per request.',
+                                 labels, DURATION_BUCKETS)
+
+    def observe(self, endpoint, method, status, seconds, stats):
+        labels = (endpoint, method)
+        with self.lock:
+            self.requests.inc(labels + (str(status),))
+            self.duration.observe(labels, seconds)
+            self.queries.observe(labels, stats.queries)
+            self.db_time.observe(labels, stats.seconds)
+
+    def render(self):
+        with self.lock:
+            return [line for metric in (self.requests, self.duration, self.queries, self.db_time)
+                    for line in metric.render()]
+
+
+# Task metrics live in the KV store as plain integer counters:
+#   metrics:task:<task>:<metric>:<bucket index>   observations per bucket
+#   metrics:task:<task>:<metric>:sum              sum (microseconds for times)
+#   metrics:task:<task>:runs:<state>              runs by final state
+TASK_HISTOGRAMS = (
+    ('duration', 'flasky_celery_task_duration_seconds', 'Run time per task.', DURATION_BUCKETS, 1_000_000),
+    ('queries', 'flasky_celery_task_db_queries', 'SQL statements per task run.', QUERY_BUCKETS, 1),
+    ('db_time', 'flasky_celery_task_db_duration_seconds', 'Time in the database per task run.',
+     DURATION_BUCKETS, 1_000_000),
+)
+TASK_STATES = ('success', 'failure')
+
+
+def _task_key(task_name, *parts):
+    return ':'.join((TASK_METRICS_PREFIX, task_name) + tuple(str(p) for p in parts))
+
+
+def record_task(task_name, state, seconds, stats):
+    values = {'duration': seconds, 'queries': stats.queries, 'db_time': stats.seconds}
+    increments = {_task_key(task_name, 'runs', state): 1}
+    for metric, _, _, buckets, scale in TASK_HISTOGRAMS:
+        value = values[metric]
+        increments[_task_key(task_name, metric, bisect.bisect_left(buckets, value))] = 1
+        increments[_task_key(task_name, metric, 'sum')] = int(round(value * scale))
+    current_app.extensions['kv'].incr_many(increments)
+
+
+def render_task_metrics(task_names):
+    kv = current_app.extensions['kv']
+    keys = []
+    for task_name in task_names:
+        keys.extend(_task_key(task_name, 'runs', state) for state in TASK_STATES)
+        for metric, _, _, buckets, _ in TASK_HISTOGRAMS:
+            keys.extend(_task_key(task_name, metric, i) for i in range(len(buckets) + 1))
+            keys.append(_task_key(task_name, metric, 'sum'))
+    values = dict(zip(keys, (int(v or 0) for v in kv.get_many(keys))))
+
+    ran = [name for name in task_names
+           if any(values[_task_key(name, 'runs', state)] for state in TASK_STATES)]
+    lines = ['# HELP flasky_celery_task_runs_total Task runs by final state.',
+             '# TYPE flasky_celery_task_runs_total counter']
+    for task_name in ran:
+        for state in TASK_STATES:
+            lines.append(f'flasky_celery_task_runs_total{format_labels({"task": task_name, "state": state})} '
+                         f'{values[_task_key(task_name, "runs", state)]}')
+    for metric, name, help, buckets, scale in TASK_HISTOGRAMS:
+        lines.extend([f'# HELP {name} {help}', f'# TYPE {name} histogram'])
+        for task_name in ran:
+            counts = [values[_task_key(task_name, metric, i)] for i in range(len(buckets) + 1)]
+            total = values[_task_key(task_name, metric, 'sum')] / scale
+            lines.extend(render_histogram(name, {'task': task_name}, buckets, counts, total))
+    return lines
+
+
+@contextmanager
+def track_task(task_name):
+    """
+    Time a task run and record it, never lets metrics break the task
+    """
+    started = time.perf_counter()
+    state = 'failure'
+    with track_queries() as stats:
+        try:
+            yield
+            state = 'success'
+        finally:
+            try:
+                record_task(task_name, state, time.perf_counter() - started, stats)
+            except KVError:
+                pass
+
+
+class Metrics:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = _Registry()
+        with app.app_context():
+            from . import db
+            for engine in db.engines.values():
+                instrument_engine(engine)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_stats = stats = QueryStats()
+        g._metrics_token = _active.set(_active.get() + (stats,))
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None and request.endpoint is not None:
+            current_app.extensions['metrics'].observe(
+                request.endpoint, request.method, response.status_code,
+                time.perf_counter() - started, g._metrics_stats)
+        return response
+
+    def _teardown_request(self, exc):
+        token = g.pop('_metrics_token', None)
+        if token is not None:
+            _active.reset(token)
+
+    def render(self):
+        from .celery_app import celery
+        # registers the task names (the modules in celery's include=)
+        celery.loader.import_default_modules()
+        task_names = sorted(name for name in celery.tasks if name.startswith('app.tasks.'))
+        lines = current_app.extensions['metrics'].render()
+        try:
+            lines.extend(render_task_metrics(task_names))
+        except KVError:
+            # Redis being down must not take the request metrics with it
+            pass
+        return '\n'.join(lines) + '\n'
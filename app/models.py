@@ -1,6 +1,11 @@
 from . import db
 import enum
-from sqlalchemy import Enum
+from datetime import datetime, timezone
+from sqlalchemy import Enum, false
+
+def utcnow():
+    # naive UTC, the way the columns store it (datetime.utcnow is deprecated)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 class PaymentStatus(enum.Enum):
     PENDING = "pending"
@@ -17,6 +22,10 @@ class ShippingStatus(enum.Enum):
 # - price
 # - name
 # - stock: int
+# - is_hot -> stock reserved on KV counters during drops (app/hot_stock.py),
+#   applied back to stock by reconcile_hot_stock
+# - low_stock_threshold -> an order taking stock to or below it raises a
+#   low-stock alert (app/low_stock.py)
 
 
 class Product(db.Model):
@@ -24,13 +33,16 @@ class Product(db.Model):
     name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
     stock = db.Column(db.Integer, nullable=False)
+    is_hot = db.Column(db.Boolean, nullable=False, default=False)
+    low_stock_threshold = db.Column(db.Integer, nullable=False, default=5)
 
     def serialize(self):
         return {
             'id': self.id,
             'name': self.name,
             'price': self.price,
-            'stock': self.stock
+            'stock': self.stock,
+            'low_stock_threshold': self.low_stock_threshold
         }
 
 
@@ -42,6 +54,11 @@ class Product(db.Model):
 # - shipping_status -> pending, in_progress, delivered
 # - name
 # - email
+# - created_at -> indexed, drives time windows (popular products, reports, cleanup)
+# - total_amount -> maintained when items are added, sum of quantity * unit_price
+# - paid_at -> indexed, set by the payment, scopes the daily sales rollups
+# - email / payment_status / shipping_status -> indexed together with
+#   id for the GET /api/orders filters and their keyset pages
 # - order_items <- back-ref
 
 
@@ -52,28 +69,23 @@ class Order(db.Model):
     shipping_status =db.Column(Enum(ShippingStatus), default=ShippingStatus.PENDING, nullable=False)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=utcnow, nullable=False, index=True)
+    total_amount = db.Column(db.Float, default=0.0, nullable=False)
+    paid_at = db.Column(db.DateTime, nullable=True, index=True)
     items = db.relationship('OrderItem', back_populates='order')
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'payment_status': self.payment_status.value,
-            'payment_reference': self.payment_reference,
-            'shipping_status': self.shipping_status.value,
-            'name': self.name,
-            'email': self.email,
-            'items': [item.serialize() for item in self.items],
-            'total_amount': self.total_amount
-        }
 
-    @property
-    def total_amount(self):
-        return sum(item.quantity * item.product.price for item in self.items)
+db.Index('ix_order_email_id', Order.email, Order.id)
+db.Index('ix_order_payment_status_id', Order.payment_status, Order.id)
+db.Index('ix_order_shipping_status_id', Order.shipping_status, Order.id)
 
 
 # Map as normalization -> OrderItem
 # - product: 12M => one OI has -> many Prods
 # - quantity
+# - unit_price -> product price at purchase time, later price edits don't touch it
+# - stock_applied -> false while the quantity (reserved on a hot product's
+#   counter) is not yet subtracted from Product.stock
 # - order: FK
 
 class OrderItem(db.Model):
@@ -81,14 +93,33 @@ class OrderItem(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
+    unit_price = db.Column(db.Float, nullable=False)
+    stock_applied = db.Column(db.Boolean, nullable=False, default=True)
     order = db.relationship('Order', back_populates='items') # => for objs level
     product = db.relationship('Product')
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'product_id': self.product_id,
-            'order_id': self.order_id,
-            'quantity': self.quantity,
-            'product': self.product.serialize() if self.product else None
-        }
+
+# only the few lines still waiting for reconciliation are indexed
+db.Index(
+    'ix_order_item_stock_pending', OrderItem.product_id,
+    sqlite_where=OrderItem.stock_applied == false(),
+    postgresql_where=OrderItem.stock_applied == false(),
+)
+
+
+# Daily sales rollups, one row per day (+ one per product sold that day)
+# - written by generate_daily_sales_report from SQL aggregates over that day's
+#   paid orders only, so a report over any range reads N rollup rows
+
+class DailySales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    total_orders = db.Column(db.Integer, nullable=False, default=0)
+    total_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow, nullable=False)
+
+
+class DailyProductSales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
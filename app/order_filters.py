@@ -0,0 +1,65 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, select
+from .models import Order, PaymentStatus, ShippingStatus
+
+
+# Server-side filters for GET /api/orders
+#   ?email=           exact match
+#   ?payment_status=  pending | paid
+#   ?shipping_status= pending | in_progress | delivered
+#   ?start= / ?end=   created_at date range (YYYY-MM-DD, both ends inclusive)
+# They combine with each other and with ?limit/?after and ?stream. Each one
+# has an index led by the filtered column (see the Order indexes): email and
+# the statuses are followed by id, so WHERE x = ? AND id > ? ORDER BY id is
+# one index range read with no sort, the way keyset pagination reads it;
+# the date range is narrowed to an id range through the created_at index.
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _enum_arg(args, key, enum):
+    try:
+        return enum(args[key])
+    except ValueError:
+        choices = ', '.join(member.value for member in enum)
+        raise FilterError(f'{key} must be one of: {choices}')
+
+
+def _date_arg(args, key):
+    try:
+        return date.fromisoformat(args[key])
+    except ValueError:
+        raise FilterError(f'{key} must be a date (YYYY-MM-DD)')
+
+
+def filter_orders(stmt, args):
+    """
+    Add the filters present in args to an Order SELECT, raises FilterError
+    """
+    criteria = []
+    if args.get('email'):
+        criteria.append(Order.email == args['email'].strip())
+    if args.get('payment_status'):
+        criteria.append(Order.payment_status == _enum_arg(args, 'payment_status', PaymentStatus))
+    if args.get('shipping_status'):
+        criteria.append(Order.shipping_status == _enum_arg(args, 'shipping_status', ShippingStatus))
+
+    start = _date_arg(args, 'start') if args.get('start') else None
+    end = _date_arg(args, 'end') if args.get('end') else None
+    if start and end and end < start:
+        raise FilterError('end must not be before start')
+    if start or end:
+        # always two-sided: without statistics SQLite takes a one-sided range
+        # as unselective and walks the whole table in id order instead
+        lower = datetime.combine(start, time.min) if start else datetime.min
+        # the day after end is the bound, there is none after date.max
+        upper = datetime.combine(end + timedelta(days=1), time.min) if end and end < date.max else datetime.max
+        window = (Order.created_at >= lower, Order.created_at < upper)
+        # every matching id lies between the window's min and max id (read
+        # from the covering created_at index), so the page itself is an id
+        # range read in id order: no sort, whatever the cursor
+        id_bounds = lambda bound: select(bound(Order.id)).where(*window).scalar_subquery()
+        criteria.extend([*window, Order.id >= id_bounds(func.min), Order.id <= id_bounds(func.max)])
+    return stmt.where(*criteria)
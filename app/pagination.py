@@ -0,0 +1,121 @@
+from flask import current_app, stream_with_context, url_for, Response, request
+from . import db
+
+
+# Keyset pagination / streaming for the list endpoints
+# - ?limit=N&after=<id>  -> one page ordered by id, plus a cursor to the next one
+# - ?stream=1            -> the whole table written as a JSON array batch by batch
+# - no parameters        -> the plain JSON array the endpoints always returned
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+# largest value an INTEGER column / bound parameter holds
+MAX_INT = 2 ** 63 - 1
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def _int_arg(args, key, default, minimum):
+    value = args.get(key)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise PaginationError(f'{key} must be an integer')
+    if value > MAX_INT:
+        raise PaginationError(f'{key} must be an integer <= {MAX_INT}')
+    if value < minimum:
+        raise PaginationError(f'{key} must be >= {minimum}')
+    return value
+
+
+def wants_page(args):
+    return 'limit' in args or 'after' in args
+
+
+def wants_stream(args):
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def page_args(args):
+    """
+    Parse limit/after from the query string, raises PaginationError
+    """
+    limit = min(_int_arg(args, 'limit', DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    after = _int_arg(args, 'after', 0, 0)
+    return limit, after
+
+
+def keyset_page(stmt, id_column, limit, after):
+    """
+    Fetch one page of stmt ordered by id_column, starting after the cursor.
+    One extra row is read to know whether a next page exists.
+    Returns (rows, next_cursor), next_cursor is None on the last page.
+    """
+    stmt = stmt.where(id_column > after).order_by(None).order_by(id_column).limit(limit + 1)
+    rows = db.session.scalars(stmt).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def page_payload(rows, next_cursor, serialize, limit):
+    """
+    Page envelope plus the URL of the next page (None on the last page)
+    """
+    next_url = None
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args.update(limit=limit, after=next_cursor)
+        next_url = url_for(request.endpoint, **request.view_args, **args)
+
+    return {
+        'items': [serialize(row) for row in rows],
+        'next_cursor': next_cursor,
+        'next': next_url
+    }, next_url
+
+
+def link_header(next_url):
+    return {'Link': f'<{next_url}>; rel="next"'} if next_url else {}
+
+
+def page_response(rows, next_cursor, serialize, limit):
+    """
+    Page envelope with the next cursor both in the body and in a Link header
+    """
+    payload, next_url = page_payload(rows, next_cursor, serialize, limit)
+    response = current_app.json.response(payload)
+    response.headers.extend(link_header(next_url))
+    return response
+
+
+def stream_rows(stmt, serialize, batch_size=None):
+    """
+    Write the result of stmt as a JSON array without materialising it:
+    yield_per keeps a server-side cursor open and only one batch of rows
+    (and their eager loads) is alive at a time.
+    """
+    dumps = current_app.json.dumps
+    batch_size = batch_size or STREAM_BATCH_SIZE
+
+    def generate():
+        result = db.session.scalars(stmt.execution_options(yield_per=batch_size))
+        yield '['
+        first = True
+        for partition in result.partitions():
+            chunk = ','.join(dumps(serialize(row)) for row in partition)
+            if not first:
+                chunk = ',' + chunk
+            first = False
+            # the identity map only holds weak references, so a batch is
+            # garbage once its chunk has been written
+            yield chunk
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,98 @@
+import json
+import time
+import uuid
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import func
+from . import db, kv
+from .kv import KVError
+from .models import Order, OrderItem, Product, utcnow
+
+
+# Popular products
+# - cache_popular_products (Celery beat) precomputes the ranking into Redis
+# - GET /api/products/popular serves those bytes as they are
+# - on a miss one request computes it under a Redis lock (SET NX), the others
+#   wait for the key instead of all hitting the database at once
+
+POPULAR_PRODUCTS_KEY = 'popular_products'
+
+
+def popular_products_key(days, limit):
+    # the configured window keeps the key the beat task and docs always used
+    config = current_app.config
+    if days == config['POPULAR_PRODUCTS_WINDOW_DAYS'] and limit == config['POPULAR_PRODUCTS_LIMIT']:
+        return POPULAR_PRODUCTS_KEY
+    return f'{POPULAR_PRODUCTS_KEY}:{days}d:{limit}'
+
+
+def compute_popular_products(days, limit):
+    """
+    Top `limit` products by number of order lines in the last `days` days
+    """
+    since = utcnow() - timedelta(days=days)
+    popular = db.session.query(
+        Product.id,
+        Product.name,
+        Product.price,
+        Product.stock,
+        func.count(OrderItem.id).label('order_count')
+    ).join(OrderItem).join(Order).filter(
+        Order.created_at >= since
+    ).group_by(Product.id).order_by(
+        func.count(OrderItem.id).desc(), Product.id
+    ).limit(limit).all()
+
+    return [
+        {
+            'id': p.id,
+            'name': p.name,
+            'price': float(p.price),
+            'stock': p.stock,
+            'order_count': p.order_count
+        }
+        for p in popular
+    ]
+
+
+def refresh_popular_products(days, limit):
+    """
+    Compute the ranking and store it, returns the encoded payload
+    """
+    payload = json.dumps(compute_popular_products(days, limit)).encode()
+    kv.set(popular_products_key(days, limit), payload, ttl=current_app.config['POPULAR_PRODUCTS_TTL'])
+    return payload
+
+
+def get_popular_products(days, limit):
+    """
+    Return (payload bytes, source) where source is 'hit', 'miss' or 'wait'
+    """
+    key = popular_products_key(days, limit)
+    try:
+        payload = kv.get(key)
+        if payload is not None:
+            return payload, 'hit'
+
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        lock_timeout = current_app.config['POPULAR_PRODUCTS_LOCK_TIMEOUT']
+        if kv.set(lock_key, token, ttl=lock_timeout, nx=True):
+            try:
+                return refresh_popular_products(days, limit), 'miss'
+            finally:
+                # only release our own lock, it may have expired and been retaken
+                if kv.get(lock_key) == token.encode():
+                    kv.delete(lock_key)
+
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            payload = kv.get(key)
+            if payload is not None:
+                return payload, 'wait'
+    except KVError:
+        pass
+
+    # lock holder died or Redis is gone, answer from the database
+    return json.dumps(compute_popular_products(days, limit)).encode(), 'miss'
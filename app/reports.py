@@ -0,0 +1,109 @@
+from datetime import datetime, time, timedelta
+from sqlalchemy import delete, func, insert, literal, select
+from . import db
+from .models import DailyProductSales, DailySales, Order, OrderItem, PaymentStatus, Product, utcnow
+
+
+# Sales reporting
+# - rollup_day() aggregates one day of paid orders in SQL (indexed paid_at)
+#   into DailySales / DailyProductSales, replacing that day's rows
+# - rollup_pending_days() rolls up every day since the last rollup, so the
+#   nightly task only ever touches the days that can still change
+# - sales_report() answers any date range from the rollup rows
+
+TOP_PRODUCTS = 5
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def rollup_day(day):
+    """
+    (Re)compute the rollup rows for one day, the caller commits
+    """
+    start, end = _day_bounds(day)
+    paid_that_day = (
+        Order.payment_status == PaymentStatus.PAID,
+        Order.paid_at >= start,
+        Order.paid_at < end,
+    )
+
+    total_orders, total_revenue = db.session.execute(
+        select(func.count(Order.id), func.coalesce(func.sum(Order.total_amount), 0.0))
+        .where(*paid_that_day)
+    ).one()
+
+    db.session.execute(delete(DailyProductSales).where(DailyProductSales.day == day))
+    db.session.execute(delete(DailySales).where(DailySales.day == day))
+    db.session.add(DailySales(day=day, total_orders=total_orders, total_revenue=float(total_revenue)))
+
+    db.session.execute(
+        insert(DailyProductSales).from_select(
+            ['day', 'product_id', 'quantity', 'revenue'],
+            select(
+                literal(day, db.Date),
+                OrderItem.product_id,
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.quantity * OrderItem.unit_price),
+            )
+            .join(Order, OrderItem.order_id == Order.id)
+            .where(*paid_that_day)
+            .group_by(OrderItem.product_id)
+        )
+    )
+
+
+def rollup_pending_days(today=None):
+    """
+    Roll up from the last rolled-up day (it may have been partial) to today.
+    Returns the days that were rolled up.
+    """
+    today = today or utcnow().date()
+    last_day = db.session.scalar(select(func.max(DailySales.day)))
+    if last_day is None:
+        first_paid = db.session.scalar(select(func.min(Order.paid_at)))
+        last_day = first_paid.date() if first_paid else today
+
+    days = []
+    day = min(last_day, today)
+    while day <= today:
+        rollup_day(day)
+        days.append(day)
+        day += timedelta(days=1)
+    db.session.commit()
+    return days
+
+
+def sales_report(start, end=None):
+    """
+    Report for the days start..end (inclusive) read from the rollups
+    """
+    end = end or start
+    total_orders, total_revenue = db.session.execute(
+        select(func.coalesce(func.sum(DailySales.total_orders), 0),
+               func.coalesce(func.sum(DailySales.total_revenue), 0.0))
+        .where(DailySales.day >= start, DailySales.day <= end)
+    ).one()
+
+    sold = func.sum(DailyProductSales.quantity).label('sold')
+    top_products = db.session.execute(
+        select(Product.name, sold)
+        .join(Product, Product.id == DailyProductSales.product_id)
+        .where(DailyProductSales.day >= start, DailyProductSales.day <= end)
+        .group_by(Product.id, Product.name)
+        .order_by(sold.desc(), Product.id)
+        .limit(TOP_PRODUCTS)
+    ).all()
+
+    report = {
+        'date': str(start) if start == end else f'{start}..{end}',
+        'total_revenue': float(total_revenue),
+        'total_orders': int(total_orders),
+        'top_products': [
+            {'name': name, 'sold': int(sold or 0)}
+            for name, sold in top_products
+        ]
+    }
+    return report
@@ -1,7 +1,23 @@
-from flask import Blueprint, request, jsonify
-from .models import Product, Order, OrderItem, PaymentStatus, ShippingStatus
-from . import db
+from flask import Blueprint, current_app, request, jsonify
+from .models import Product, Order, OrderItem, PaymentStatus, ShippingStatus, utcnow
+from .serializers import load_order, load_orders, orders_query, serialize_item, serialize_order, serialize_orders
+from .bulk_orders import BulkBodyError, ingest_orders, parse_bulk_body
+from .inventory import InsufficientStock, aggregate_quantities, is_valid_product_id, is_valid_quantity, load_products, reserve_stock
+from .popular import get_popular_products
+from .idempotency import idempotent
+from .hot_stock import hot_product_ids, hot_reservation
+from .low_stock import mark_low
+from .order_filters import FilterError, filter_orders
+from .events import order_event_stream, order_channel, order_status, publish_order_event
+from .reports import sales_report
+from .pagination import PaginationError, keyset_page, link_header, page_args, page_payload, page_response, stream_rows, wants_page, wants_stream
+from . import catalog_cache, db, kv, metrics
+from .encoding import compress_body, negotiate_encoding
+from .kv import KVError
+from .shipping import ALLOWED_TRANSITIONS
+from sqlalchemy import insert, select
 import random, string
+from datetime import date
 from flask import abort
 
 
@@ -16,17 +32,91 @@ from flask import abort
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 
+def list_response(stmt, model, serialize):
+    # ?stream=1 -> streamed array, ?limit/?after -> keyset page, else full list
+    try:
+        if wants_stream(request.args):
+            _, after = page_args(request.args)
+            return stream_rows(stmt.where(model.id > after), serialize)
+        if wants_page(request.args):
+            limit, after = page_args(request.args)
+            rows, next_cursor = keyset_page(stmt, model.id, limit, after)
+            return page_response(rows, next_cursor, serialize, limit)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return None
+
+
 @bp.route('/orders', methods=['GET'])
 def get_orders():
-    orders = Order.query.all()
-    return jsonify([order.serialize() for order in orders])
+    # ?email, ?payment_status, ?shipping_status, ?start/?end, all indexed
+    try:
+        stmt = filter_orders(orders_query(), request.args)
+    except FilterError as e:
+        return jsonify({'error': str(e)}), 400
+    response = list_response(stmt, Order, serialize_order)
+    if response is not None:
+        return response
+    orders = load_orders(stmt)
+    return jsonify(serialize_orders(orders))
+
+
+def cached_catalog_response(stmt):
+    # full list or keyset page, served from the versioned catalog cache
+    try:
+        paged = wants_page(request.args)
+        limit, after = page_args(request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        if paged:
+            rows, next_cursor = keyset_page(stmt, Product.id, limit, after)
+            payload, next_url = page_payload(rows, next_cursor, Product.serialize, limit)
+            return current_app.json.dumps(payload).encode(), link_header(next_url)
+        products = db.session.scalars(stmt).all()
+        return current_app.json.dumps([prod.serialize() for prod in products]).encode(), {}
+
+    entry = catalog_cache.get_or_build(f'products:{limit}:{after}' if paged else 'products:all', build)
+    # compressed once per cached entry; each encoding has its own strong ETag,
+    # the same on the 200 and on the 304 that revalidates it
+    encoding = negotiate_encoding(len(entry.body))
+    response = current_app.response_class(entry.encoded(encoding, compress_body),
+                                          mimetype='application/json', headers=entry.headers)
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f'{entry.etag}-{encoding}')
+    else:
+        response.set_etag(entry.etag)
+    return response.make_conditional(request)
+
+
+@bp.route('/products/popular', methods=['GET'])
+def popular_products():
+    config = current_app.config
+    try:
+        days = int(request.args.get('days', config['POPULAR_PRODUCTS_WINDOW_DAYS']))
+        limit = int(request.args.get('limit', config['POPULAR_PRODUCTS_LIMIT']))
+    except ValueError:
+        return jsonify({'error': 'days and limit must be integers'}), 400
+    if not 1 <= days <= 365 or not 1 <= limit <= 100:
+        return jsonify({'error': 'days must be within 1-365 and limit within 1-100'}), 400
+
+    # cached bytes go out untouched, no decode / re-encode
+    payload, source = get_popular_products(days, limit)
+    response = current_app.response_class(payload, mimetype='application/json')
+    response.headers['X-Cache'] = source
+    return response
 
 
 @bp.route('/products', methods=['GET', 'POST'])
 def products_handler():
     if request.method == 'GET':
-        products = Product.query.all()
-        return jsonify([prod.serialize() for prod in products])
+        stmt = select(Product).order_by(Product.id)
+        if wants_stream(request.args):
+            return list_response(stmt, Product, Product.serialize)
+        return cached_catalog_response(stmt)
 
     elif request.method=='POST':
         if not request.is_json:
@@ -38,14 +128,22 @@ def products_handler():
         if not body or not all(k in body for k in ['name', 'price', 'stock']):
             return jsonify({'error' : 'Not valid body ,required : name, price, stock'}),400
 
+        threshold = body.get('low_stock_threshold', current_app.config['LOW_STOCK_THRESHOLD'])
+        if not isinstance(threshold, int) or isinstance(threshold, bool) or threshold < 0:
+            return jsonify({'error': 'low_stock_threshold must be a non negative integer'}), 400
+
         try:
             product = Product(
                 name=body['name'],
                 price=body['price'],
-                stock=body['stock']
+                stock=body['stock'],
+                low_stock_threshold=threshold
             )
             db.session.add(product)
             db.session.commit()
+            catalog_cache.bump()
+            if product.stock <= product.low_stock_threshold:
+                mark_low({product.id})
             return jsonify(product.serialize()), 201
         except Exception as e:
             db.session.rollback()
@@ -56,6 +154,7 @@ def products_handler():
 # for orders
 
 @bp.route('/orders', methods= ['POST'])
+@idempotent
 def create_order():
     if not request.is_json:
         return jsonify({"error": "Request must be JSON format"}),400
@@ -68,46 +167,113 @@ def create_order():
     if not isinstance(body['items'],list) or len(body['items']) == 0:
         return jsonify({'error': 'items must be a non empty list'}), 400
 
+    for item in body['items']:
+        if not isinstance(item, dict) or not all(k in item for k in ['product_id', 'quantity']):
+            return jsonify({'error': 'Each item must have product_id and quantity'}), 400
+        if not is_valid_product_id(item['product_id']):
+            return jsonify({'error': 'product_id must be an integer'}), 400
+        if not is_valid_quantity(item['quantity']):
+            return jsonify({'error': 'quantity must be a positive integer'}), 400
+
+    # one IN query for the whole cart instead of a get() per line
+    quantities = aggregate_quantities(body['items'])
+    products = load_products(quantities)
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if not product:
+            return jsonify({'error': f'Product with ID {product_id} not found'}), 404
+        if product.stock < quantity:
+            return jsonify({'error': f'Insufficient stock for product {product.name}. Available: {product.stock}'}) ,400
+
     # Check on order [not empty]
     # apply atomicity for transaction -> all or none
     try:
-        order = Order(
-            name= body['name'],
-            email= body['email'],
-            payment_status= PaymentStatus.PENDING,
-            shipping_status= ShippingStatus.PENDING
-        )
-        db.session.add(order)
-        db.session.flush()
-        for item in body['items']:
-            if not all(k in item for k in ['product_id', 'quantity']):
-                return jsonify({'error': 'Each item must have product_id and quantity'})
-            product = db.session.get(Product, item['product_id'])
-            if not product:
-                return jsonify({'error': f'Product with ID {item["product_id"]} not found'}), 404
-            if product.stock < item['quantity']:
-                return jsonify({'error': f'Insufficient stock for product {product.name}. Available: {product.stock}'}) ,400
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item['product_id'],
-                quantity=item['quantity']
+        # hot products: taken from their counters first, returned if this fails
+        with hot_reservation(quantities, hot_product_ids(products.values())) as hot:
+            # prices are snapshotted, so later price edits never change this order
+            order = Order(
+                name= body['name'],
+                email= body['email'],
+                payment_status= PaymentStatus.PENDING,
+                shipping_status= ShippingStatus.PENDING,
+                total_amount= sum(item['quantity'] * products[item['product_id']].price for item in body['items'])
             )
+            db.session.add(order)
+            db.session.flush()
+            # one executemany for the lines, the ORM would insert them one by one
+            db.session.execute(insert(OrderItem), [
+                {
+                    'order_id': order.id,
+                    'product_id': item['product_id'],
+                    'quantity': item['quantity'],
+                    'unit_price': products[item['product_id']].price,
+                    'stock_applied': item['product_id'] not in hot
+                }
+                for item in body['items']
+            ])
+
+            # the check above is only advisory, the conditional update decides
+            low = reserve_stock({pid: q for pid, q in quantities.items() if pid not in hot})
+            db.session.commit()
+        catalog_cache.bump()
+        mark_low(low)
+        return jsonify(serialize_order(load_order(order.id, refresh=True))),201
 
-            product.stock -= item['quantity']
-            db.session.add(order_item)
-
-        db.session.commit()
-        return jsonify(order.serialize()),201
-
-
-
-
-
+    except InsufficientStock as e:
+        db.session.rollback()
+        product = products[e.product_id]
+        return jsonify({'error': f'Insufficient stock for product {product.name}. Requested: {e.requested}'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to create order: {str(e)}'}), 500
 
 
+# bulk ingestion for marketplace feeds -> one result per order
+@bp.route('/orders/bulk', methods=['POST'])
+def create_orders_bulk():
+    try:
+        payloads = parse_bulk_body(request)
+    except BulkBodyError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if len(payloads) == 0:
+        return jsonify({'error': 'orders must be a non empty list'}), 400
+    max_orders = current_app.config['BULK_ORDER_MAX_ORDERS']
+    if len(payloads) > max_orders:
+        return jsonify({'error': f'At most {max_orders} orders per request'}), 413
+
+    results, summary = ingest_orders(payloads, current_app.config['BULK_ORDER_CHUNK_SIZE'])
+    if summary['created']:
+        catalog_cache.bump()
+    return jsonify({**summary, 'results': results}), 200
+
+
+# shipping status for many orders at once -> one background task
+@bp.route('/orders/shipping-status', methods=['POST'])
+def update_shipping_status_bulk():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not all(k in body for k in ['order_ids', 'status']):
+        return jsonify({'error': 'those fields must included : [order_ids, status]'}), 400
+
+    # only statuses some order can move to (nothing goes back to pending)
+    statuses = [status.value for status, allowed in ALLOWED_TRANSITIONS.items() if allowed]
+    if body['status'] not in statuses:
+        return jsonify({'error': f"status must be one of: {', '.join(statuses)}"}), 400
+    order_ids = body['order_ids']
+    valid_id = lambda i: isinstance(i, int) and not isinstance(i, bool) and i > 0
+    if not isinstance(order_ids, list) or not order_ids or not all(valid_id(i) for i in order_ids):
+        return jsonify({'error': 'order_ids must be a non empty list of order ids'}), 400
+    order_ids = sorted(set(order_ids))
+    max_orders = current_app.config['SHIPPING_UPDATE_MAX_ORDERS']
+    if len(order_ids) > max_orders:
+        return jsonify({'error': f'At most {max_orders} orders per request'}), 413
+
+    # Import here to avoid circular imports
+    from app.tasks import bulk_update_order_status
+    result = bulk_update_order_status.delay(order_ids, body['status'])
+    return jsonify({'task_id': result.id, 'status': body['status'], 'orders': len(order_ids)}), 202
+
+
 # for an existing order -> to add more items
 @bp.route('/orders/<int:order_id>/items', methods=['POST'])
 
@@ -126,6 +292,10 @@ def add_more_items(order_id):
     data = request.get_json()
     if not data or not all(k in data for k in ['product_id', 'quantity']):
         return jsonify({'error': 'Missing required fields: product_id, quantity'}), 400
+    if not is_valid_product_id(data['product_id']):
+        return jsonify({'error': 'product_id must be an integer'}), 400
+    if not is_valid_quantity(data['quantity']):
+        return jsonify({'error': 'quantity must be a positive integer'}), 400
 
     product = db.session.get(Product, data['product_id'])
     if not product:
@@ -134,17 +304,27 @@ def add_more_items(order_id):
         return jsonify({'error': f'Insufficient stock. Available: {product.stock}, Requested: {data["quantity"]}'}), 400
 
     try:
-        order_item = OrderItem(
-            order_id=order_id,
-            product_id=data['product_id'],
-            quantity=data['quantity']
-        )
-
-        product.stock -= data['quantity']
+        quantities = {product.id: data['quantity']}
+        with hot_reservation(quantities, hot_product_ids([product])) as hot:
+            order_item = OrderItem(
+                order_id=order_id,
+                product_id=data['product_id'],
+                quantity=data['quantity'],
+                unit_price=product.price,
+                stock_applied=product.id not in hot
+            )
 
-        db.session.add(order_item)
-        db.session.commit()
-        return jsonify(order_item.serialize()), 201
+            db.session.add(order_item)
+            # incremented in SQL so two concurrent additions can't lose one another
+            order.total_amount = Order.total_amount + data['quantity'] * product.price
+            low = reserve_stock(quantities) if not hot else set()
+            db.session.commit()
+        catalog_cache.bump()
+        mark_low(low)
+        return jsonify(serialize_item(order_item)), 201
+    except InsufficientStock:
+        db.session.rollback()
+        return jsonify({'error': f'Insufficient stock. Requested: {data["quantity"]}'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to add item to order: {str(e)}'}), 500
@@ -157,8 +337,9 @@ def add_more_items(order_id):
 
 
 @bp.route('/orders/<int:order_id>/pay', methods=['POST'])
+@idempotent
 def pay_order(order_id):
-    order = db.session.get(Order, order_id)
+    order = load_order(order_id)
     if not order:
         abort(404, description=f"Order with ID {order_id} not found.")
 
@@ -173,17 +354,23 @@ def pay_order(order_id):
 
         order.payment_status = PaymentStatus.PAID
         order.payment_reference = payment_reference
+        order.paid_at = paid_at = utcnow()
 
         db.session.commit()
+        publish_order_event(order_id, 'payment', {
+            'payment_status': PaymentStatus.PAID.value,
+            'payment_reference': payment_reference,
+            'paid_at': paid_at.isoformat(),
+        })
 
         # Import here to avoid circular imports
         from app.tasks import send_order_confirmation
-        send_order_confirmation.delay(order.id)
+        send_order_confirmation.delay(order_id)
 
         return jsonify({
             'message': 'Payment successful',
             'payment_reference': payment_reference,
-            'order': order.serialize()
+            'order': serialize_order(load_order(order_id, refresh=True))
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -193,8 +380,49 @@ def pay_order(order_id):
 
 @bp.route('/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
+    order = load_order(order_id)
+    if not order:
+        abort(404, description=f"Order with ID {order_id} not found.")
+
+    return jsonify(serialize_order(order))
+
+
+@bp.route('/orders/<int:order_id>/events', methods=['GET'])
+def order_events(order_id):
+    # server-sent events: a snapshot, then payment / shipping changes as they happen
+    try:
+        subscription = kv.subscribe(order_channel(order_id))
+    except KVError:
+        return jsonify({'error': 'Order events are unavailable, try again later'}), 503
     order = db.session.get(Order, order_id)
     if not order:
+        subscription.close()
         abort(404, description=f"Order with ID {order_id} not found.")
+    snapshot = order_status(order)
+    db.session.remove()
+
+    return current_app.response_class(
+        order_event_stream(subscription, snapshot),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@bp.route('/reports/sales', methods=['GET'])
+def get_sales_report():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD, read from the daily rollups
+    try:
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else utcnow().date()
+        end = date.fromisoformat(request.args['end']) if 'end' in request.args else start
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    if end < start:
+        return jsonify({'error': 'end must not be before start'}), 400
+
+    return jsonify(sales_report(start, end))
+
 
-    return jsonify(order.serialize())
\ No newline at end of file
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text exposition format
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,69 @@
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from . import db
+from .models import Order, OrderItem
+
+
+# Serialization layer for orders
+# - every endpoint that returns orders loads them through here
+# - selectin loading keeps it to three SELECTs however many orders:
+#     orders -> their items -> the products those items point at
+# - total_amount and line prices are snapshotted on the rows, no Product needed
+
+ORDER_GRAPH = selectinload(Order.items).selectinload(OrderItem.product)
+
+
+def orders_query():
+    """
+    Base SELECT for orders with the whole item/product graph eager-loaded
+    """
+    return select(Order).options(ORDER_GRAPH).order_by(Order.id)
+
+
+def load_orders(stmt=None):
+    if stmt is None:
+        stmt = orders_query()
+    return db.session.scalars(stmt).all()
+
+
+def load_order(order_id, refresh=False):
+    """
+    Load one order with its graph. Use refresh=True after a commit so the
+    expired instances are repopulated in one go instead of lazily.
+    """
+    stmt = orders_query().where(Order.id == order_id)
+    if refresh:
+        stmt = stmt.execution_options(populate_existing=True)
+    return db.session.scalars(stmt).first()
+
+
+def serialize_product(product):
+    return product.serialize() if product else None
+
+
+def serialize_item(item):
+    return {
+        'id': item.id,
+        'product_id': item.product_id,
+        'order_id': item.order_id,
+        'quantity': item.quantity,
+        'unit_price': item.unit_price,
+        'product': serialize_product(item.product)
+    }
+
+
+def serialize_order(order):
+    return {
+        'id': order.id,
+        'payment_status': order.payment_status.value,
+        'payment_reference': order.payment_reference,
+        'shipping_status': order.shipping_status.value,
+        'name': order.name,
+        'email': order.email,
+        'items': [serialize_item(item) for item in order.items],
+        'total_amount': order.total_amount
+    }
+
+
+def serialize_orders(orders):
+    return [serialize_order(order) for order in orders]
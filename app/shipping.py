@@ -0,0 +1,44 @@
+from sqlalchemy import update
+from . import db
+from .models import Order, ShippingStatus
+
+
+# Bulk shipping status updates (POST /api/orders/shipping-status)
+# - one set-based UPDATE ... WHERE id IN (chunk) per chunk, one commit each,
+#   instead of one task + one commit per order
+# - the transition is checked in the same WHERE clause: only orders whose
+#   current status may move to the new one are touched, so a concurrent
+#   update is never overwritten backwards and nothing is read first
+# - RETURNING hands back what the notifications need, the caller fans them
+#   out once the chunk is committed
+
+# new status -> statuses an order may have before it (shipping only moves forward)
+ALLOWED_TRANSITIONS = {
+    ShippingStatus.PENDING: set(),
+    ShippingStatus.IN_PROGRESS: {ShippingStatus.PENDING},
+    ShippingStatus.DELIVERED: {ShippingStatus.PENDING, ShippingStatus.IN_PROGRESS},
+}
+
+
+def update_shipping_status(order_ids, status, chunk_size=1000):
+    """
+    Move order_ids to status chunk by chunk. Yields the (id, name, email)
+    rows of each chunk once it is committed; orders that don't exist or
+    can't move to status are left alone.
+    """
+    allowed = ALLOWED_TRANSITIONS[status]
+    if not allowed:
+        return
+    order_ids = sorted(set(order_ids))
+    for start in range(0, len(order_ids), chunk_size):
+        chunk = order_ids[start:start + chunk_size]
+        rows = db.session.execute(
+            update(Order)
+            .where(Order.id.in_(chunk), Order.shipping_status.in_(allowed))
+            .values(shipping_status=status)
+            .returning(Order.id, Order.name, Order.email)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        if rows:
+            yield rows
@@ -1,254 +1,197 @@
-from app.celery_app import celery
+from app.celery_app import celery, get_worker_app
+from celery.signals import worker_process_shutdown
 from flask import current_app
-from flask_mail import Message
-from app import mail, db, create_app
-from app.models import Order, Product, PaymentStatus, ShippingStatus, OrderItem
-from datetime import datetime, timedelta
-from sqlalchemy import func
-import redis
+from app import db, kv, catalog_cache, email_batcher
+from app.emails import build_message
+from app.models import Order, ShippingStatus, utcnow
+from app.events import publish_order_event
+from datetime import timedelta
 import json
-import os
-
-# Initialize Redis client with environment variable support
-def get_redis_client():
-    redis_url = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
-    # Extract host and port from redis URL
-    if redis_url.startswith('redis://'):
-        redis_url = redis_url.replace('redis://', '')
-        if '/' in redis_url:
-            host_port, db = redis_url.split('/')
-            if ':' in host_port:
-                host, port = host_port.split(':')
-            else:
-                host, port = host_port, 6379
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def requeue_on_failure(task, args, attempt):
+    """
+    on_failure callback for email_batcher.add. Email tasks are acknowledged
+    before their batch goes out (EARLY_ACK_QUEUES), so a message that fails
+    is sent again by a new run of the task, MAIL_TASK_RETRIES times with a
+    doubling delay
+    """
+    retries = current_app.config['MAIL_TASK_RETRIES']
+    delay = current_app.config['MAIL_TASK_RETRY_DELAY']
+
+    def requeue(error):
+        if attempt < retries:
+            task.apply_async(args, {'attempt': attempt + 1}, countdown=delay * 2 ** attempt)
         else:
-            host, port, db = redis_url, 6379, 0
-    return redis.Redis(host=host, port=int(port), db=int(db), decode_responses=True)
+            logger.error('Giving up on %s%r after %d attempts: %s', task.name, tuple(args), attempt + 1, error)
+    return requeue
 
-redis_client = get_redis_client()
 
-@celery.task(name='app.tasks.send_email_async')
-def send_email_async(subject, to, html_content):
+@celery.task(name='app.tasks.send_email_async', ignore_result=True)
+def send_email_async(template, to, context=None, attempt=0):
     """
     Asynchronous email sending task
+    Renders one of app.emails.EMAIL_TEMPLATES with context (ids and scalars)
+    in the worker and queues it on the batcher
     """
     try:
-        msg = Message(subject, recipients=[to])
-        msg.html = html_content
-        mail.send(msg)
-        return f"Email sent to {to}"
+        message = build_message(template, to, **(context or {}))
     except Exception as e:
         return f"Failed to send email: {str(e)}"
+    email_batcher.add(message, on_failure=requeue_on_failure(send_email_async, [template, to, context], attempt))
+    return f"Email queued for {to}"
 
 
-@celery.task(name='app.tasks.send_order_confirmation')
-def send_order_confirmation(order_id):
+@worker_process_shutdown.connect
+def flush_queued_emails(**kwargs):
+    # don't lose the batch that was still waiting for its window
+    with get_worker_app().app_context():
+        email_batcher.flush()
+
+
+@celery.task(name='app.tasks.send_order_confirmation', ignore_result=True)
+def send_order_confirmation(order_id, attempt=0):
     """
     Send order confirmation email
+    The message only carries order_id, the email is rendered here from the order
     """
-    app = create_app()
-    with app.app_context():
-        from flask import render_template
-        order = db.session.get(Order, order_id)
-        if not order:
-            return f"Order {order_id} not found"
-
-        order_items = []
-        for item in order.items:
-            order_items.append({
-                'product_name': item.product.name,
-                'quantity': item.quantity,
-                'price': item.product.price,
-                'subtotal': item.product.price * item.quantity
-            })
-
-        html_content = render_template(
-            'email/order_confirmation.html',
-            name=order.name,
-            order_id=order.id,
-            payment_reference=order.payment_reference,
-            total_amount=order.total_amount,
-            items=order_items
-        )
-
-        return send_email_async.delay(
-            "Order Confirmation",
-            order.email,
-            html_content
-        )
-
-
-@celery.task(name='app.tasks.check_low_stock')
+    from app.serializers import load_order
+
+    # items and their products in the same round trips, not a lazy load per line
+    order = load_order(order_id)
+    if not order:
+        return f"Order {order_id} not found"
+
+    order_items = []
+    for item in order.items:
+        order_items.append({
+            'product_name': item.product.name,
+            'quantity': item.quantity,
+            'price': item.unit_price,
+            'subtotal': item.unit_price * item.quantity
+        })
+
+    email_batcher.add(build_message(
+        'order_confirmation',
+        order.email,
+        name=order.name,
+        order_id=order.id,
+        payment_reference=order.payment_reference,
+        total_amount=order.total_amount,
+        items=order_items
+    ), on_failure=requeue_on_failure(send_order_confirmation, [order_id], attempt))
+
+    return f"Order confirmation queued for {order.email}"
+
+
+@celery.task(name='app.tasks.check_low_stock', ignore_result=True)
 def check_low_stock():
     """
-    Check for products with low stock and send alerts
-    Runs daily via Celery Beat
+    Send one digest of the products that went low since the last run
+    Runs every LOW_STOCK_DIGEST_SECONDS via Celery Beat
     """
-    app = create_app()
-    with app.app_context():
-        low_stock_threshold = 5
-        products = Product.query.filter(Product.stock <= low_stock_threshold).all()
-
-        if products:
-            low_stock_list = [
-                f"{p.name} - Stock: {p.stock}" for p in products
-            ]
-
-            # Store in Redis for quick access
-            redis_client.setex(
-                'low_stock_products',
-                86400,  # 24 hours
-                json.dumps(low_stock_list)
+    from app.low_stock import pop_digest
+
+    # products are queued as their stock crosses the threshold, no table scan
+    products = pop_digest()
+
+    if products:
+        # Send email alert (if admin email is configured)
+        admin_email = current_app.config.get('MAIL_USERNAME')
+        if admin_email:
+            send_email_async.delay(
+                'low_stock',
+                admin_email,
+                {'products': [[name, stock, threshold] for _, name, stock, threshold in products]}
             )
 
-            # Send email alert (if admin email is configured)
-            admin_email = current_app.config.get('MAIL_USERNAME')
-            if admin_email:
-                html_content = f"""
-                <h2>Low Stock Alert</h2>
-                <p>The following products are running low on stock:</p>
-                <ul>
-                    {"".join([f"<li>{item}</li>" for item in low_stock_list])}
-                </ul>
-                """
-                send_email_async.delay(
-                    "Low Stock Alert",
-                    admin_email,
-                    html_content
-                )
-
-            return f"Found {len(products)} products with low stock"
-        return "All products have sufficient stock"
-
-
-@celery.task(name='app.tasks.cleanup_old_pending_orders')
+        return f"Found {len(products)} products with low stock"
+    return "No new low stock products"
+
+
+@celery.task(name='app.tasks.cleanup_old_pending_orders', ignore_result=True)
 def cleanup_old_pending_orders():
     """
-    Delete pending orders older than 7 days
+    Delete pending orders older than 7 days (CLEANUP_PENDING_ORDER_DAYS)
     Runs daily via Celery Beat
     """
-    app = create_app()
-    with app.app_context():
-        cutoff_date = datetime.utcnow() - timedelta(days=7)
-
-        # Note: You'll need to add created_at field to Order model
-        # For now, this is a placeholder
-        old_orders = Order.query.filter(
-            Order.payment_status == PaymentStatus.PENDING
-        ).all()
-
-        count = 0
-        for order in old_orders:
-            # Restore stock
-            for item in order.items:
-                item.product.stock += item.quantity
+    from app.inventory import purge_pending_orders
 
-            db.session.delete(order)
-            count += 1
+    cutoff_date = utcnow() - timedelta(days=current_app.config['CLEANUP_PENDING_ORDER_DAYS'])
 
-        db.session.commit()
+    # bounded batches: one stock UPDATE + two bulk DELETEs per transaction
+    count = purge_pending_orders(cutoff_date, current_app.config['CLEANUP_BATCH_SIZE'])
+    if count:
+        catalog_cache.bump()
 
-        # Cache the cleanup result
-        redis_client.setex(
-            'last_cleanup',
-            86400,
-            json.dumps({
-                'timestamp': datetime.utcnow().isoformat(),
-                'orders_deleted': count
-            })
-        )
+    # Cache the cleanup result
+    kv.set(
+        'last_cleanup',
+        json.dumps({
+            'timestamp': utcnow().isoformat(),
+            'orders_deleted': count
+        }),
+        ttl=86400
+    )
 
-        return f"Deleted {count} old pending orders"
+    return f"Deleted {count} old pending orders"
 
 
-@celery.task(name='app.tasks.generate_daily_sales_report')
+@celery.task(name='app.tasks.generate_daily_sales_report', ignore_result=True)
 def generate_daily_sales_report():
     """
     Generate daily sales report and cache in Redis
     Runs daily via Celery Beat
     """
-    app = create_app()
-    with app.app_context():
-        today = datetime.utcnow().date()
-
-        # Get paid orders (you'll need to add created_at to Order model)
-        paid_orders = Order.query.filter(
-            Order.payment_status == PaymentStatus.PAID
-        ).all()
-
-        total_revenue = sum(order.total_amount for order in paid_orders)
-        total_orders = len(paid_orders)
-
-        # Get top selling products
-        from sqlalchemy import func
-        top_products = db.session.query(
-            Product.name,
-            func.sum(db.session.query(func.sum(OrderItem.quantity))
-                    .filter(OrderItem.product_id == Product.id)
-                    .correlate(Product)
-                    .scalar_subquery()).label('total_sold')
-        ).group_by(Product.id).order_by(func.sum(OrderItem.quantity).desc()).limit(5).all()
-
-        report = {
-            'date': str(today),
-            'total_revenue': float(total_revenue),
-            'total_orders': total_orders,
-            'top_products': [
-                {'name': name, 'sold': int(sold or 0)}
-                for name, sold in top_products
-            ]
-        }
-
-        # Cache in Redis for 30 days
-        redis_client.setex(
-            f'sales_report:{today}',
-            2592000,
-            json.dumps(report)
-        )
+    from app.reports import rollup_pending_days, sales_report
 
-        return report
+    # only the days since the last rollup are aggregated, in SQL
+    today = utcnow().date()
+    days = rollup_pending_days(today)
+    reports = {day: sales_report(day) for day in days}
 
+    # Cache in Redis for 30 days, every refreshed day in one pipelined write
+    kv.set_many(
+        {f'sales_report:{day}': json.dumps(report) for day, report in reports.items()},
+        ttl=2592000
+    )
 
-@celery.task(name='app.tasks.cache_popular_products')
+    return reports[today]
+
+
+@celery.task(name='app.tasks.cache_popular_products', ignore_result=True)
 def cache_popular_products():
     """
     Cache popular products in Redis
     Runs every 30 minutes via Celery Beat
     """
-    app = create_app()
-    with app.app_context():
-        from sqlalchemy import func
-        from app.models import OrderItem
-
-        # Get products ordered in the last 7 days
-        popular = db.session.query(
-            Product.id,
-            Product.name,
-            Product.price,
-            Product.stock,
-            func.count(OrderItem.id).label('order_count')
-        ).join(OrderItem).group_by(Product.id).order_by(
-            func.count(OrderItem.id).desc()
-        ).limit(10).all()
-
-        popular_list = [
-            {
-                'id': p.id,
-                'name': p.name,
-                'price': float(p.price),
-                'stock': p.stock,
-                'order_count': p.order_count
-            }
-            for p in popular
-        ]
-
-        redis_client.setex(
-            'popular_products',
-            1800,  # 30 minutes
-            json.dumps(popular_list)
-        )
+    from app.popular import refresh_popular_products
+
+    # Products ordered in the configured window (7 days / top 10 by default)
+    payload = refresh_popular_products(
+        current_app.config['POPULAR_PRODUCTS_WINDOW_DAYS'],
+        current_app.config['POPULAR_PRODUCTS_LIMIT']
+    )
 
-        return f"Cached {len(popular_list)} popular products"
+    return f"Cached {len(json.loads(payload))} popular products"
+
+
+@celery.task(name='app.tasks.reconcile_hot_stock')
+def reconcile_hot_stock():
+    """
+    Apply orders taken on hot-product counters to Product.stock and report
+    counter drift. Runs every HOT_STOCK_RECONCILE_SECONDS via Celery Beat
+    """
+    from app.hot_stock import reconcile_hot_stock as reconcile
+
+    report = reconcile(current_app.config['HOT_STOCK_RECONCILE_BATCH'])
+    if report['applied']:
+        catalog_cache.bump()
+    return report
 
 
 @celery.task(name='app.tasks.update_order_status')
@@ -256,24 +199,56 @@ def update_order_status(order_id, new_status):
     """
     Update order shipping status asynchronously
     """
-    app = create_app()
-    with app.app_context():
-        order = db.session.get(Order, order_id)
-        if order:
-            order.shipping_status = ShippingStatus(new_status)
-            db.session.commit()
-
-            # Send notification email
-            html_content = f"""
-            <h2>Order Status Update</h2>
-            <p>Dear {order.name},</p>
-            <p>Your order #{order.id} status has been updated to: <strong>{new_status}</strong></p>
-            """
-            send_email_async.delay(
-                f"Order #{order.id} Status Update",
-                order.email,
-                html_content
-            )
+    order = db.session.get(Order, order_id)
+    if order:
+        order.shipping_status = ShippingStatus(new_status)
+        db.session.commit()
+        publish_order_event(order_id, 'shipping', {'shipping_status': order.shipping_status.value})
 
-            return f"Updated order {order_id} status to {new_status}"
-        return f"Order {order_id} not found"
\ No newline at end of file
+        # Send notification email
+        send_email_async.delay(
+            'status_update',
+            order.email,
+            {'order_id': order.id, 'name': order.name, 'status': new_status}
+        )
+
+        return f"Updated order {order_id} status to {new_status}"
+    return f"Order {order_id} not found"
+
+
+@celery.task(name='app.tasks.bulk_update_order_status')
+def bulk_update_order_status(order_ids, new_status):
+    """
+    Update the shipping status of many orders, one UPDATE and one commit per
+    SHIPPING_UPDATE_CHUNK_SIZE orders (see app/shipping.py)
+    """
+    from app.events import publish_order_events
+    from app.shipping import update_shipping_status
+
+    status = ShippingStatus(new_status)
+    updated = 0
+    for rows in update_shipping_status(order_ids, status, current_app.config['SHIPPING_UPDATE_CHUNK_SIZE']):
+        updated += len(rows)
+        publish_order_events([row.id for row in rows], 'shipping', {'shipping_status': status.value})
+        # one email job per chunk instead of one task per order
+        send_shipping_notifications.delay(status.value, [[row.id, row.name, row.email] for row in rows])
+
+    return {'status': status.value, 'requested': len(set(order_ids)), 'updated': updated}
+
+
+@celery.task(name='app.tasks.send_shipping_notifications', bind=True, ignore_result=True)
+def send_shipping_notifications(self, new_status, recipients):
+    """
+    Status update emails for [[order_id, name, email], ...], sent together
+    over shared SMTP connections before the task returns. Recipients that
+    failed are retried on their own.
+    """
+    messages = [build_message('status_update', email, order_id=order_id, name=name, status=new_status)
+                for order_id, name, email in recipients]
+    failures = email_batcher.send_batch(messages)
+    if failures:
+        failed = [recipient for recipient, message in zip(recipients, messages)
+                  if any(message is failure for failure in failures)]
+        raise self.retry(args=(new_status, failed), max_retries=current_app.config['MAIL_TASK_RETRIES'],
+                         countdown=current_app.config['MAIL_TASK_RETRY_DELAY'] * 2 ** self.request.retries)
+    return f"Sent {len(recipients)} status emails"
@@ -0,0 +1,68 @@
+"""
+Compare two benchmarks.run reports:
+
+    python -m benchmarks.compare before.json after.json [--threshold 10]
+
+Prints the change per scenario and exits with 1 when a p95 got slower by
+more than --threshold percent, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s', 'peak_memory_kb']
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before, after, threshold):
+    regressions = []
+    rows = []
+    for name, old in before['scenarios'].items():
+        new = after['scenarios'].get(name)
+        if new is None:
+            continue
+        deltas = {metric: change(old.get(metric), new.get(metric)) for metric in METRICS}
+        rows.append((name, old, new, deltas))
+        if deltas['p95_ms'] is not None and deltas['p95_ms'] > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed p95 slowdown in percent')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f'{before.get("revision")} -> {after.get("revision")}')
+    if before.get('dataset') != after.get('dataset'):
+        print(f'warning: datasets differ {before.get("dataset")} vs {after.get("dataset")}')
+
+    rows, regressions = compare(before, after, args.threshold)
+    for name, old, new, deltas in rows:
+        cells = []
+        for metric in ['p50_ms', 'p95_ms', 'throughput_per_s']:
+            delta = deltas[metric]
+            cells.append(f'{metric} {old.get(metric)} -> {new.get(metric)}'
+                         + (f' ({delta:+.1f}%)' if delta is not None else ''))
+        print(f'{name:<32} ' + '  '.join(cells))
+
+    if regressions:
+        print(f'p95 regressions over {args.threshold}%: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Concurrent order creation against a SQLite file, SQLite defaults (rollback
+journal, synchronous=FULL, no mmap) vs the WAL settings from Config.
+
+    python -m benchmarks.concurrent_orders --threads 16 --orders 50 --readers 4
+
+Each thread posts --orders orders with its own test client, all threads start
+together; --readers threads page through /api/orders meanwhile. Failed
+requests (e.g. "database is locked") are counted separately.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from app import create_app, db
+from app.models import Product
+
+from .run import percentile
+
+PROFILES = {
+    'sqlite-defaults': {'SQLITE_JOURNAL_MODE': '', 'SQLITE_SYNCHRONOUS': '', 'SQLITE_MMAP_SIZE': 0},
+    'wal': {},  # Config defaults: WAL, synchronous=NORMAL, mmap
+}
+
+
+def run_profile(name, overrides, threads, orders, products, readers, workdir):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, name + '.db')}",
+        'CACHE_REDIS_URL': 'memory://',
+        **overrides,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Product(name=f'Product {i}', price=10.0, stock=10 ** 9) for i in range(products)])
+        db.session.commit()
+
+    start = threading.Barrier(threads + readers + 1)
+    latencies, failures, reads = [], [], []
+    lock = threading.Lock()
+    writing = threading.Event()
+    writing.set()
+
+    def worker(n):
+        client = app.test_client()
+        start.wait()
+        for i in range(orders):
+            t0 = time.perf_counter()
+            response = client.post('/api/orders', json={
+                'name': f'buyer {n}',
+                'email': f'buyer{n}@example.com',
+                'items': [{'product_id': (n + i + k) % products + 1, 'quantity': 1} for k in range(3)]
+            })
+            elapsed = (time.perf_counter() - t0) * 1000
+            with lock:
+                if response.status_code == 201:
+                    latencies.append(elapsed)
+                else:
+                    failures.append(response.get_json().get('error', response.status_code))
+
+    def reader():
+        client = app.test_client()
+        start.wait()
+        while writing.is_set():
+            t0 = time.perf_counter()
+            response = client.get('/api/orders?limit=50')
+            with lock:
+                if response.status_code == 200:
+                    reads.append((time.perf_counter() - t0) * 1000)
+                else:
+                    failures.append(response.get_json().get('error', response.status_code))
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in workers + reader_threads:
+        t.start()
+    start.wait()
+    started = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    writing.clear()
+    for t in reader_threads:
+        t.join()
+
+    with app.app_context():
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        db.engine.dispose()
+
+    return {
+        'journal_mode': journal_mode,
+        'orders_created': len(latencies),
+        'failed': len(failures),
+        'orders_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'reads_per_second': round(len(reads) / elapsed, 1),
+        'read_p95_ms': round(percentile(reads, 95), 2) if reads else None,
+        'errors': sorted(set(map(str, failures)))[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent order creation on SQLite')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--orders', type=int, default=50, help='orders per thread')
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--readers', type=int, default=4, help='threads reading order pages meanwhile')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, overrides in PROFILES.items():
+            results[name] = run_profile(name, overrides, args.threads, args.orders, args.products,
+                                        args.readers, workdir)
+            print(f'{name:<16} {results[name]}', flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
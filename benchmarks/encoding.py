@@ -0,0 +1,103 @@
+"""
+JSON encoding and response compression on a large order list.
+
+    python -m benchmarks.encoding --order-items 20000 --runs 20
+
+Seeds a SQLite file, then for each JSON provider (stdlib, orjson if
+installed) reports the time to encode the full GET /api/orders payload, the
+time and size of each Content-Encoding, and the end-to-end request through
+the test client (p50, bytes on the wire).
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from app import create_app, db
+from app.encoding import COMPACT_SEPARATORS, brotli, orjson
+from app.serializers import load_orders, serialize_orders
+
+from .factories import seed
+from .run import git_revision, percentile
+
+
+def make_app(db_path, provider):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'CACHE_REDIS_URL': 'memory://',
+        'JSON_PROVIDER': provider,
+    })
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, {
+        'p50_ms': round(percentile(samples, 50), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--order-items', type=int, default=20_000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    providers = ['stdlib'] + (['orjson'] if orjson is not None else [])
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    report = {'revision': git_revision(), 'providers': {}}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        app = make_app(db_path, 'stdlib')
+        with app.app_context():
+            db.create_all()
+            seed(products=args.products, order_items=args.order_items)
+            payload = serialize_orders(load_orders())
+        report['orders'] = len(payload)
+
+        for provider in providers:
+            app = make_app(db_path, provider)
+            result = {}
+            # compact, the way jsonify encodes responses
+            body, result['encode'] = timed(
+                lambda: app.json.dumps(payload, separators=COMPACT_SEPARATORS).encode(), args.runs)
+            result['bytes'] = {'identity': len(body)}
+
+            compressors = {
+                'gzip': lambda: gzip.compress(body, compresslevel=app.config['COMPRESS_GZIP_LEVEL']),
+                'br': lambda: brotli.compress(body, quality=app.config['COMPRESS_BROTLI_QUALITY']),
+            }
+            result['compress'] = {}
+            for encoding in encodings[1:]:
+                compressed, result['compress'][encoding] = timed(compressors[encoding], args.runs)
+                result['bytes'][encoding] = len(compressed)
+                result['compress'][encoding]['saved_pct'] = round(100 * (1 - len(compressed) / len(body)), 1)
+
+            client = app.test_client()
+            result['request'] = {}
+            for encoding in encodings:
+                response, timing = timed(
+                    lambda: client.get('/api/orders', headers={'Accept-Encoding': encoding}), args.runs)
+                assert response.status_code == 200, response.status_code
+                result['request'][encoding] = {**timing, 'wire_bytes': len(response.get_data())}
+            with app.app_context():
+                db.engine.dispose()
+
+            report['providers'][provider] = result
+            print(f'{provider:<8} {json.dumps(result)}', flush=True)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
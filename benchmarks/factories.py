@@ -0,0 +1,106 @@
+"""
+factory_boy / Faker factories for benchmark datasets.
+
+The factories build plain dicts, which are bulk-inserted in chunks: going
+through the ORM one object at a time would take longer than the benchmark.
+"""
+import random
+from datetime import timedelta
+
+import factory
+from faker import Faker
+from sqlalchemy import insert
+
+from app import db
+from app.models import Order, OrderItem, PaymentStatus, Product, ShippingStatus, utcnow
+
+fake = Faker()
+
+
+class ProductFactory(factory.Factory):
+    class Meta:
+        model = dict
+
+    name = factory.LazyFunction(lambda: fake.unique.catch_phrase()[:100])
+    price = factory.LazyFunction(lambda: round(random.uniform(1, 5000), 2))
+    stock = factory.LazyFunction(lambda: random.randint(10_000, 1_000_000))
+
+
+class OrderFactory(factory.Factory):
+    class Meta:
+        model = dict
+
+    class Params:
+        paid = factory.LazyFunction(lambda: random.random() < 0.6)
+
+    name = factory.Faker('name')
+    email = factory.Faker('email')
+    created_at = factory.LazyFunction(lambda: utcnow() - timedelta(minutes=random.randint(0, 30 * 24 * 60)))
+    payment_status = factory.LazyAttribute(lambda o: PaymentStatus.PAID if o.paid else PaymentStatus.PENDING)
+    payment_reference = factory.LazyAttribute(lambda o: fake.bothify('Ref_??????????').upper() if o.paid else None)
+    paid_at = factory.LazyAttribute(lambda o: o.created_at + timedelta(minutes=5) if o.paid else None)
+    shipping_status = ShippingStatus.PENDING
+    total_amount = 0.0
+
+
+class OrderItemFactory(factory.Factory):
+    class Meta:
+        model = dict
+
+    quantity = factory.LazyFunction(lambda: random.randint(1, 3))
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def seed(products=10_000, order_items=1_000_000, items_per_order=4, chunk_size=10_000, seed_value=42):
+    """
+    Insert `products` products and `order_items` order items spread over
+    ceil(order_items / items_per_order) orders. Needs an app context.
+    Returns the dataset description.
+    """
+    random.seed(seed_value)
+    Faker.seed(seed_value)
+    fake.unique.clear()
+
+    product_rows = ProductFactory.build_batch(products)
+    for chunk in _chunks(product_rows, chunk_size):
+        db.session.execute(insert(Product), chunk)
+    db.session.commit()
+    prices = dict(db.session.execute(db.select(Product.id, Product.price)).all())
+    product_ids = list(prices)
+
+    order_count = max(1, -(-order_items // items_per_order))
+    remaining_items = order_items
+    for chunk_start in range(0, order_count, chunk_size):
+        orders = OrderFactory.build_batch(min(chunk_size, order_count - chunk_start))
+        lines = []
+        for order in orders:
+            count = min(items_per_order, remaining_items) or 1
+            remaining_items -= count
+            order_lines = [
+                dict(OrderItemFactory.build(), product_id=product_id, unit_price=prices[product_id])
+                for product_id in random.sample(product_ids, min(count, len(product_ids)))
+            ]
+            order['total_amount'] = round(sum(l['quantity'] * l['unit_price'] for l in order_lines), 2)
+            lines.append(order_lines)
+
+        order_ids = db.session.scalars(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True), orders
+        ).all()
+        item_rows = [
+            dict(line, order_id=order_id)
+            for order_id, order_lines in zip(order_ids, lines)
+            for line in order_lines
+        ]
+        for item_chunk in _chunks(item_rows, chunk_size):
+            db.session.execute(insert(OrderItem), item_chunk)
+        db.session.commit()
+
+    return {
+        'products': products,
+        'orders': order_count,
+        'order_items': db.session.query(OrderItem).count(),
+    }
@@ -0,0 +1,211 @@
+"""
+Load / benchmark suite: seeds a realistic dataset and drives the API and the
+Celery tasks through the Flask test client.
+
+    python -m benchmarks.run --products 10000 --order-items 1000000 --output bench.json
+    python -m benchmarks.compare before.json after.json
+
+Every scenario reports p50/p95/p99 latency, throughput and the peak Python
+memory allocated while it runs (tracemalloc, measured on a separate pass so
+it doesn't skew the timings). Tasks run eagerly, no broker needed.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from app import create_app, db
+from app.celery_app import celery, init_worker_app
+from app.models import Order, Product
+
+from .factories import seed
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples_ms, elapsed):
+    return {
+        'runs': len(samples_ms),
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'mean_ms': round(statistics.mean(samples_ms), 3),
+        'throughput_per_s': round(len(samples_ms) / elapsed, 2) if elapsed else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    def __init__(self, app, runs, memory_runs):
+        self.app = app
+        self.client = app.test_client()
+        self.runs = runs
+        self.memory_runs = memory_runs
+        self.results = {}
+
+    def scenario(self, name, call, runs=None, expect=(200, 201)):
+        runs = runs or self.runs
+
+        def once(i):
+            response = call(i)
+            status = getattr(response, 'status_code', 200)
+            if status not in expect:
+                raise RuntimeError(f'{name}: unexpected status {status}: {response.get_data(as_text=True)[:200]}')
+
+        samples = []
+        started = time.perf_counter()
+        for i in range(runs):
+            t0 = time.perf_counter()
+            once(i)
+            samples.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - started
+        result = summarize(samples, elapsed)
+
+        memory_runs = min(runs, self.memory_runs)
+        if memory_runs:
+            tracemalloc.start()
+            for i in range(runs, runs + memory_runs):
+                once(i)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['peak_memory_kb'] = round(peak / 1024, 1)
+
+        self.results[name] = result
+        print(f'{name:<32} p50 {result["p50_ms"]:>9.3f} ms  p95 {result["p95_ms"]:>9.3f} ms  '
+              f'{result["throughput_per_s"]:>9} /s', flush=True)
+        return result
+
+
+def run_scenarios(bench, dataset, stream_runs, task_runs):
+    client = bench.client
+    with bench.app.app_context():
+        product_ids = list(db.session.scalars(db.select(Product.id)))
+        max_order_id = db.session.scalar(db.select(db.func.max(Order.id))) or 0
+
+    created = []
+
+    def new_order(i):
+        response = client.post('/api/orders', json={
+            'name': f'bench {i}',
+            'email': f'bench{i}@example.com',
+            'items': [{'product_id': pid, 'quantity': random.randint(1, 3)}
+                      for pid in random.sample(product_ids, random.randint(1, 5))]
+        })
+        if response.status_code == 201:
+            created.append(response.get_json()['id'])
+        return response
+
+    def add_item(i):
+        return client.post(f'/api/orders/{created[i % len(created)]}/items',
+                           json={'product_id': random.choice(product_ids), 'quantity': 1})
+
+    def pay(i):
+        return client.post(f'/api/orders/{created[i]}/pay')
+
+    def create_product(i):
+        return client.post('/api/products', json={'name': f'bench product {i}', 'price': 9.99, 'stock': 100})
+
+    bench.scenario('create_order', new_order)
+    bench.scenario('add_more_items', add_item)
+    # one payment per order created above (both passes)
+    bench.scenario('pay_order', pay, runs=len(created) - min(bench.runs, bench.memory_runs))
+    bench.scenario('get_order', lambda i: client.get(f'/api/orders/{random.randint(1, max_order_id)}'))
+    bench.scenario('get_orders_page', lambda i: client.get(
+        f'/api/orders?limit=100&after={random.randint(0, max(0, max_order_id - 100))}'))
+    bench.scenario('get_orders_stream', lambda i: _drain(client.get('/api/orders?stream=1')), runs=stream_runs)
+    bench.scenario('products_list_cold', lambda i: (create_product(-i - 1), client.get('/api/products'))[1])
+    bench.scenario('products_list_cached', lambda i: client.get('/api/products'))
+    bench.scenario('products_page', lambda i: client.get(
+        f'/api/products?limit=100&after={random.randint(0, max(0, len(product_ids) - 100))}'))
+    bench.scenario('products_create', create_product)
+    bench.scenario('products_popular', lambda i: client.get('/api/products/popular'))
+
+    from app import tasks
+    for name in ['cache_popular_products', 'generate_daily_sales_report', 'check_low_stock',
+                 'cleanup_old_pending_orders']:
+        task = getattr(tasks, name)
+        bench.scenario(f'task.{name}', lambda i, task=task: task.apply().get(), runs=task_runs)
+
+
+def _drain(response):
+    # a streamed body is only produced while it is read
+    for _ in response.response:
+        pass
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flasky load / benchmark suite')
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--order-items', type=int, default=1_000_000)
+    parser.add_argument('--items-per-order', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--memory-runs', type=int, default=20, help='extra requests traced for peak memory')
+    parser.add_argument('--stream-runs', type=int, default=1, help='full /api/orders?stream=1 dumps')
+    parser.add_argument('--task-runs', type=int, default=3)
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary one)')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    random.seed(1)
+    celery.conf.task_always_eager = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.database or os.path.join(tmp, 'bench.db')
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+            'CACHE_REDIS_URL': 'memory://',
+            'MAIL_BATCH_WINDOW': 0,
+            'MAIL_DEFAULT_SENDER': 'bench@example.com',
+        })
+        init_worker_app(app)
+
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            dataset = seed(args.products, args.order_items, args.items_per_order)
+            dataset['seed_seconds'] = round(time.perf_counter() - started, 2)
+        print(f'seeded {dataset}', flush=True)
+
+        bench = Bench(app, args.runs, args.memory_runs)
+        run_scenarios(bench, dataset, args.stream_runs, args.task_runs)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    report = {
+        'revision': git_revision(),
+        'dataset': dataset,
+        'params': {'runs': args.runs, 'memory_runs': args.memory_runs},
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'scenarios': bench.results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Celery task overhead: building a Flask app per task run (the old pattern)
+vs. running inside the per-process worker app.
+
+    python -m benchmarks.task_overhead --runs 200
+
+Tasks are executed in-process with .apply(), so no broker is needed; the
+numbers are the per-run cost on top of the task body itself.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from app import create_app, db
+from app.celery_app import celery, init_worker_app
+from app.models import Order
+
+
+def make_config(db_path):
+    return {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "CACHE_REDIS_URL": "memory://",
+    }
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': runs,
+        'mean_ms': round(statistics.mean(samples), 3),
+        'p50_ms': round(statistics.median(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    celery.conf.task_always_eager = True
+    from app.tasks import update_order_status
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = make_config(os.path.join(tmp, 'bench.db'))
+        app = init_worker_app(create_app(config))
+        with app.app_context():
+            db.create_all()
+            order = Order(name="bench", email="bench@example.com")
+            db.session.add(order)
+            db.session.commit()
+            order_id = order.id
+
+        def per_run_app():
+            # what every task did before: create_app() + a fresh app context
+            fresh = create_app(config)
+            with fresh.app_context():
+                update_order_status.run(order_id, 'in_progress')
+                for engine in db.engines.values():
+                    engine.dispose()
+
+        def worker_app():
+            update_order_status.apply(args=(order_id, 'in_progress'))
+
+        before = timed(per_run_app, args.runs)
+        after = timed(worker_app, args.runs)
+
+    print(json.dumps({
+        'benchmark': 'task_overhead',
+        'before_create_app_per_run': before,
+        'after_worker_process_app': after,
+        'speedup': round(before['mean_ms'] / after['mean_ms'], 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
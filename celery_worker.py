@@ -1,14 +1,7 @@
-from app import create_app
-from app.celery_app import celery
-from app import db
+from app.celery_app import celery, init_worker_app
 
-flask_app = create_app()
+# Build the Flask app once here; prefork children inherit it and only reset
+# their DB pools (see worker_process_init in app/celery_app.py), so tasks
+# never call create_app() themselves.
+flask_app = init_worker_app()
 celery.conf.update(flask_app.config)
-
-class ContextTask(celery.Task):
-    """Make celery tasks work with Flask app context"""
-    def __call__(self, *args, **kwargs):
-        with flask_app.app_context():
-            return self.run(*args, **kwargs)
-
-celery.Task = ContextTask
\ No newline at end of file
@@ -1,13 +1,22 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
 import pytest
+from sqlalchemy import event
 from app import create_app, db
+from app.celery_app import celery
+
+# tasks run inline, inside the test app's context (no broker / worker needed)
+celery.conf.task_always_eager = True
 
 @pytest.fixture
 def client():
-    app = create_app()
-    app.config.update({
+    app = create_app({
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
         "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "CACHE_REDIS_URL": "memory://",
+        "MAIL_BATCH_WINDOW": 0,
     })
 
     with app.test_client() as client:
@@ -16,3 +25,61 @@ def client():
         yield client
         with app.app_context():
             db.drop_all()
+
+
+class QueryRecord:
+    def __init__(self, budget, label):
+        self.budget = budget
+        self.label = label
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def normalize_sql(statement):
+    # one line, literals and IN (?, ?, ...) lists folded so repeats group together
+    sql = ' '.join(statement.split())
+    sql = re.sub(r"'(?:[^']|'')*'", "'?'", sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', 'N', sql)
+    sql = re.sub(r'\((?:\s*(?:\?|N|\'\?\')\s*,)+\s*(?:\?|N|\'\?\')\s*\)', '(...)', sql)
+    return sql
+
+
+def format_statements(statements):
+    grouped = Counter(normalize_sql(s) for s in statements)
+    return '\n'.join(f'  {count:>3} x {sql}' for sql, count in grouped.most_common())
+
+
+@pytest.fixture
+def query_budget(client):
+    """
+    with query_budget(3): client.get(...)           fails over 3 statements
+    with query_budget(3, same_as=small): ...        fails if the count differs
+                                                    from an earlier block (N+1)
+    On failure the statements are printed grouped by normalized SQL.
+    """
+    with client.application.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def budget(max_queries, label='', same_as=None):
+        record = QueryRecord(max_queries, label)
+        listener = lambda conn, cursor, statement, *args: record.statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            yield record
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        name = f' ({label})' if label else ''
+        if record.count > max_queries:
+            pytest.fail(f'{record.count} queries{name}, budget is {max_queries}:\n'
+                        f'{format_statements(record.statements)}')
+        if same_as is not None and record.count != same_as.count:
+            pytest.fail(f'query count grows with result size{name}: {same_as.count} -> {record.count}\n'
+                        f'before:\n{format_statements(same_as.statements)}\n'
+                        f'after:\n{format_statements(record.statements)}')
+
+    return budget
@@ -0,0 +1,38 @@
+import json
+from app import db
+from app.models import Order, OrderItem, PaymentStatus, Product
+from benchmarks import compare
+from benchmarks.factories import seed
+
+
+class TestBenchmarkDataset:
+    def test_seed_builds_consistent_dataset(self, client):
+        with client.application.app_context():
+            dataset = seed(products=20, order_items=50, items_per_order=4, chunk_size=7)
+
+            assert dataset == {'products': 20, 'orders': 13, 'order_items': 50}
+            assert db.session.query(Product).count() == 20
+            assert db.session.query(OrderItem).count() == 50
+
+            # snapshot totals match the line items
+            for order in db.session.query(Order):
+                expected = sum(i.quantity * i.unit_price for i in order.items)
+                assert abs(order.total_amount - round(expected, 2)) < 0.01
+                assert (order.paid_at is not None) == (order.payment_status == PaymentStatus.PAID)
+
+
+class TestBenchmarkCompare:
+    def report(self, tmp_path, name, p95):
+        path = tmp_path / name
+        path.write_text(json.dumps({
+            'revision': name,
+            'dataset': {'products': 1},
+            'scenarios': {'get_order': {'p50_ms': 1.0, 'p95_ms': p95, 'throughput_per_s': 100.0}}
+        }))
+        return str(path)
+
+    def test_flags_p95_regression(self, tmp_path, capsys):
+        before = self.report(tmp_path, 'before.json', 2.0)
+        assert compare.main([before, self.report(tmp_path, 'same.json', 2.1)]) == 0
+        assert compare.main([before, self.report(tmp_path, 'slow.json', 3.0)]) == 1
+        assert 'get_order' in capsys.readouterr().out.splitlines()[-1]
@@ -0,0 +1,108 @@
+import json
+import pytest
+from app.models import Product, db
+
+
+class TestBulkOrders:
+
+    @pytest.fixture(autouse=True)
+    def setup_products(self, client):
+        self.client = client
+        with client.application.app_context():
+            db.session.add_all([
+                Product(name="Galaxy 26 Ultra", price=1299.99, stock=4),
+                Product(name="MackBook Air", price=2299.99, stock=100),
+            ])
+            db.session.commit()
+
+    def order(self, *items):
+        return {
+            "name": "feed",
+            "email": "feed@example.com",
+            "items": [{"product_id": pid, "quantity": qty} for pid, qty in items]
+        }
+
+    def test_json_array_with_per_order_results(self):
+        self.client.application.config['BULK_ORDER_CHUNK_SIZE'] = 2
+        payload = [
+            self.order((1, 2), (2, 1)),
+            self.order((1, 1)),
+            self.order((99, 1)),
+            self.order((1, 2)),          # only one Galaxy left by now
+            {"name": "broken"},
+            self.order((2, 3)),
+        ]
+        response = self.client.post('/api/orders/bulk', json=payload)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['received'] == 6
+        assert body['created'] == 3
+        assert body['failed'] == 3
+        assert body['orders_per_second'] > 0
+        assert [r['status'] for r in body['results']] == [
+            'created', 'created', 'failed', 'failed', 'failed', 'created'
+        ]
+        assert 'not found' in body['results'][2]['error']
+        assert 'Insufficient stock' in body['results'][3]['error']
+
+        products = self.client.get('/api/products').get_json()
+        assert products[0]['stock'] == 1
+        assert products[1]['stock'] == 96
+
+        orders = self.client.get('/api/orders').get_json()
+        assert [o['id'] for o in orders] == [r['id'] for r in body['results'] if r['status'] == 'created']
+        assert len(orders[0]['items']) == 2
+
+    def test_failed_chunk_gives_its_stock_back(self, monkeypatch):
+        from app import bulk_orders
+        self.client.application.config['BULK_ORDER_CHUNK_SIZE'] = 1
+        insert_chunk, calls = bulk_orders._insert_chunk, []
+
+        def flaky_insert(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise RuntimeError('database went away')
+            return insert_chunk(*args)
+        monkeypatch.setattr(bulk_orders, '_insert_chunk', flaky_insert)
+
+        response = self.client.post('/api/orders/bulk', json=[self.order((1, 3)), self.order((1, 3))])
+        body = response.get_json()
+        assert [r['status'] for r in body['results']] == ['failed', 'created']
+        assert 'database went away' in body['results'][0]['error']
+        assert self.client.get('/api/products').get_json()[0]['stock'] == 1
+
+    def test_bad_order_does_not_sink_its_chunk(self, monkeypatch):
+        from app import bulk_orders
+        insert_chunk = bulk_orders._insert_chunk
+
+        def poisoned_insert(accepted, *args):
+            if any(payload['email'] == 'poison@example.com' for _, payload in accepted):
+                raise RuntimeError('constraint failed')
+            return insert_chunk(accepted, *args)
+        monkeypatch.setattr(bulk_orders, '_insert_chunk', poisoned_insert)
+
+        poison = {**self.order((2, 1)), "email": "poison@example.com"}
+        payload = [self.order((1, 1)), {**self.order((1, 1)), "name": None}, poison, self.order((2, 2))]
+        body = self.client.post('/api/orders/bulk', json=payload).get_json()
+        assert [r['status'] for r in body['results']] == ['created', 'failed', 'failed', 'created']
+        assert body['results'][1]['error'] == 'name must be a non empty string'
+        assert 'constraint failed' in body['results'][2]['error']
+
+        products = self.client.get('/api/products').get_json()
+        assert [p['stock'] for p in products] == [3, 98]
+
+    def test_ndjson_body(self):
+        lines = "\n".join(json.dumps(self.order((2, 1))) for _ in range(5))
+        response = self.client.post('/api/orders/bulk', data=lines,
+                                    content_type='application/x-ndjson')
+        assert response.status_code == 200
+        assert response.get_json()['created'] == 5
+
+        response = self.client.post('/api/orders/bulk', data='{"name": ',
+                                    content_type='application/x-ndjson')
+        assert response.status_code == 400
+
+    def test_rejects_oversized_batches(self):
+        self.client.application.config['BULK_ORDER_MAX_ORDERS'] = 2
+        response = self.client.post('/api/orders/bulk', json=[self.order((2, 1))] * 3)
+        assert response.status_code == 413
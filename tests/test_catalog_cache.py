@@ -0,0 +1,105 @@
+import time
+import pytest
+from sqlalchemy import event
+from app.cache import LRUCache
+from app.kv import KVError
+from app.models import Product, db
+
+
+class TestCatalogCache:
+
+    @pytest.fixture(autouse=True)
+    def setup_products(self, client):
+        self.client = client
+        with client.application.app_context():
+            db.session.add_all([
+                Product(name="Galaxy 26 Ultra", price=1299.99, stock=4),
+                Product(name="MackBook Air", price=2299.99, stock=7),
+            ])
+            db.session.commit()
+            self.engine = db.engine
+
+    def get_counting_queries(self, url, **kwargs):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(self.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get(url, **kwargs)
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', listener)
+        return response, len(statements)
+
+    def test_second_read_is_served_from_cache(self):
+        first, queries = self.get_counting_queries('/api/products')
+        assert first.status_code == 200
+        assert queries == 1
+        assert first.headers['ETag']
+
+        second, queries = self.get_counting_queries('/api/products')
+        assert queries == 0
+        assert second.data == first.data
+        assert second.headers['ETag'] == first.headers['ETag']
+
+    def test_if_none_match_gets_304(self):
+        etag = self.client.get('/api/products').headers['ETag']
+        response, queries = self.get_counting_queries(
+            '/api/products', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert queries == 0
+
+    def test_orders_and_new_products_invalidate(self):
+        etag = self.client.get('/api/products').headers['ETag']
+
+        order = {"name": "loai", "email": "loai@gmail.com",
+                 "items": [{"product_id": 1, "quantity": 1}]}
+        assert self.client.post('/api/orders', json=order).status_code == 201
+        response = self.client.get('/api/products', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.get_json()[0]['stock'] == 3
+        etag = response.headers['ETag']
+
+        new_product = {"name": "iPhone 14", "price": 999.99, "stock": 10}
+        assert self.client.post('/api/products', json=new_product).status_code == 201
+        response = self.client.get('/api/products', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert len(response.get_json()) == 3
+
+    def test_pages_are_cached_separately(self):
+        page = self.client.get('/api/products?limit=1')
+        assert page.get_json()['next_cursor'] == 1
+        assert 'Link' in page.headers
+        cached, queries = self.get_counting_queries('/api/products?limit=1')
+        assert queries == 0
+        assert cached.headers['Link'] == page.headers['Link']
+        assert len(self.client.get('/api/products').get_json()) == 2
+
+    def test_nothing_is_cached_while_redis_is_down(self, monkeypatch):
+        def unavailable(*args, **kwargs):
+            raise KVError('connection refused')
+        store = self.client.application.extensions['kv']
+        monkeypatch.setattr(store, 'get', unavailable)
+        monkeypatch.setattr(store, 'incr', unavailable)
+
+        first, queries = self.get_counting_queries('/api/products')
+        assert first.status_code == 200 and queries == 1
+        # another process changing stock can't bump a version we can't read,
+        # so every read goes to the database
+        with self.client.application.app_context():
+            db.session.get(Product, 1).stock = 0
+            db.session.commit()
+        second, queries = self.get_counting_queries('/api/products')
+        assert queries == 1
+        assert second.get_json()[0]['stock'] == 0
+        assert second.headers['ETag'] != first.headers['ETag']
+
+
+def test_lru_entries_expire():
+    lru = LRUCache(maxsize=2, ttl=0.05)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.set('c', 3)
+    assert lru.get('a') is None
+    assert lru.get('c') == 3
+    time.sleep(0.1)
+    assert lru.get('b') is None and lru.get('c') is None
@@ -0,0 +1,59 @@
+from datetime import timedelta
+import pytest
+from sqlalchemy import event
+from app.inventory import purge_pending_orders
+from app.models import Order, OrderItem, PaymentStatus, Product, db, utcnow
+
+
+class TestPendingOrderCleanup:
+
+    @pytest.fixture(autouse=True)
+    def setup_orders(self, client):
+        self.client = client
+        self.app = client.application
+        with self.app.app_context():
+            db.session.add_all([
+                Product(name="Galaxy 26 Ultra", price=100.0, stock=100),
+                Product(name="MackBook Air", price=10.0, stock=100),
+            ])
+            db.session.commit()
+
+        # 7 stale pending, 1 stale paid, 1 fresh pending
+        for i in range(9):
+            response = client.post('/api/orders', json={
+                "name": "loai", "email": "loai@gmail.com",
+                "items": [{"product_id": 1, "quantity": 2}, {"product_id": 2, "quantity": 1}]
+            })
+            assert response.status_code == 201
+        with self.app.app_context():
+            for order in db.session.scalars(db.select(Order)):
+                if order.id <= 8:
+                    order.created_at = utcnow() - timedelta(days=10)
+                if order.id == 8:
+                    order.payment_status = PaymentStatus.PAID
+            db.session.commit()
+            self.engine = db.engine
+
+    def test_purges_in_batches_and_restores_stock(self):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        with self.app.app_context():
+            event.listen(self.engine, 'before_cursor_execute', listener)
+            try:
+                deleted = purge_pending_orders(utcnow() - timedelta(days=7), batch_size=3)
+            finally:
+                event.remove(self.engine, 'before_cursor_execute', listener)
+            assert deleted == 7
+
+            # 3 batches of (select ids, restore, delete items, delete orders) + final empty select
+            assert len(statements) == 3 * 4 + 1
+
+            assert db.session.get(Product, 1).stock == 100 - 2 * 2
+            assert db.session.get(Product, 2).stock == 100 - 2
+            assert sorted(db.session.scalars(db.select(Order.id))) == [8, 9]
+            assert db.session.query(OrderItem).count() == 4
+
+    def test_nothing_to_purge(self):
+        with self.app.app_context():
+            assert purge_pending_orders(utcnow() - timedelta(days=30)) == 0
+            assert db.session.get(Product, 1).stock == 100 - 9 * 2
@@ -0,0 +1,97 @@
+import threading
+import pytest
+from app import create_app, db
+from app.models import Product, OrderItem
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    # threads need a real file database, :memory: is one shared connection
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'concurrency.db'}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30}},
+        "CACHE_REDIS_URL": "memory://",
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Product(name="Limited Drop", price=99.0, stock=10),
+            Product(name="Sidekick", price=5.0, stock=1000),
+        ])
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+
+def test_concurrent_orders_never_oversell(file_app):
+    threads_count = 40
+    start = threading.Barrier(threads_count)
+    statuses = []
+    lock = threading.Lock()
+
+    def place_order(i):
+        client = file_app.test_client()
+        start.wait()
+        response = client.post('/api/orders', json={
+            "name": f"buyer {i}",
+            "email": f"buyer{i}@example.com",
+            "items": [
+                {"product_id": 2, "quantity": 1},
+                {"product_id": 1, "quantity": 1 + i % 2},
+            ]
+        })
+        with lock:
+            statuses.append((response.status_code, 1 + i % 2))
+
+    threads = [threading.Thread(target=place_order, args=(i,)) for i in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(statuses) == threads_count
+    assert {status for status, _ in statuses} <= {201, 400}
+    sold = sum(quantity for status, quantity in statuses if status == 201)
+    placed = sum(1 for status, _ in statuses if status == 201)
+
+    with file_app.app_context():
+        drop = db.session.get(Product, 1)
+        sidekick = db.session.get(Product, 2)
+        assert drop.stock >= 0
+        assert drop.stock + sold == 10
+        # a failed order must not keep the lines it already reserved
+        assert sidekick.stock + placed == 1000
+        assert db.session.query(OrderItem).filter_by(product_id=1).count() == placed
+
+
+def test_order_fails_as_a_whole(client):
+    with client.application.app_context():
+        db.session.add_all([
+            Product(name="Plenty", price=1.0, stock=50),
+            Product(name="Scarce", price=1.0, stock=1),
+        ])
+        db.session.commit()
+
+    response = client.post('/api/orders', json={
+        "name": "loai",
+        "email": "loai@gmail.com",
+        "items": [
+            {"product_id": 1, "quantity": 5},
+            {"product_id": 2, "quantity": 2},
+        ]
+    })
+    assert response.status_code == 400
+
+    products = client.get('/api/products').get_json()
+    assert [p['stock'] for p in products] == [50, 1]
+    assert client.get('/api/orders').get_json() == []
+
+    response = client.post('/api/orders', json={
+        "name": "loai",
+        "email": "loai@gmail.com",
+        "items": [{"product_id": 1, "quantity": -3}]
+    })
+    assert response.status_code == 400
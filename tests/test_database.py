@@ -0,0 +1,42 @@
+from app import create_app, db
+from app.database import engine_options
+from config import Config
+
+
+def config_for(uri, **overrides):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update(SQLALCHEMY_DATABASE_URI=uri, **overrides)
+    return config
+
+
+class TestEngineOptions:
+
+    def test_server_database_gets_pool_and_statement_timeout(self):
+        options = engine_options(config_for(
+            'postgresql://flasky@db/flasky', DB_POOL_SIZE=5, DB_MAX_OVERFLOW=2, DB_STATEMENT_TIMEOUT=1500))
+        assert options['pool_size'] == 5
+        assert options['max_overflow'] == 2
+        assert options['pool_pre_ping'] is True
+        assert options['pool_recycle'] == Config.DB_POOL_RECYCLE
+        assert options['connect_args'] == {'options': '-c statement_timeout=1500'}
+
+    def test_sqlite_has_no_pool_sizing_and_explicit_options_win(self):
+        options = engine_options(config_for(
+            'sqlite:///inventory.db', SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}}))
+        assert 'pool_size' not in options
+        assert options['connect_args'] == {'timeout': 30}
+
+    def test_sqlite_file_runs_in_wal_mode(self, tmp_path):
+        app = create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'wal.db'}",
+            "CACHE_REDIS_URL": "memory://",
+            "SQLITE_BUSY_TIMEOUT": 2500,
+        })
+        with app.app_context():
+            pragma = lambda name: db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+            assert pragma('journal_mode') == 'wal'
+            assert pragma('synchronous') == 1  # NORMAL
+            assert pragma('busy_timeout') == 2500
+            assert pragma('mmap_size') == Config.SQLITE_MMAP_SIZE
+            db.engine.dispose()
@@ -0,0 +1,76 @@
+import json
+import pytest
+from app import email_batcher
+from app.emails import EMAIL_TEMPLATES, build_message, render_email, warm_templates
+from app.models import Order, OrderItem, Product, db
+from app.tasks import (bulk_update_order_status, check_low_stock, send_email_async,
+                       send_order_confirmation, send_shipping_notifications, update_order_status)
+
+
+class TestTemplatedEmails:
+
+    @pytest.fixture(autouse=True)
+    def setup_order(self, client):
+        self.client = client
+        self.app = client.application
+        self.app.extensions['mail'].default_sender = 'shop@example.com'
+        with self.app.app_context():
+            product = Product(name="Galaxy 26 Ultra", price=1299.99, stock=10)
+            order = Order(name="loai", email="loai@gmail.com", total_amount=2599.98,
+                          payment_reference="PAY-1",
+                          items=[OrderItem(product=product, quantity=2, unit_price=1299.99)])
+            db.session.add(order)
+            db.session.commit()
+            self.order_id = order.id
+
+    def test_status_update_task_carries_ids_not_html(self, monkeypatch):
+        sent = []
+        monkeypatch.setattr('app.tasks.send_email_async.delay', lambda *args: sent.append(args))
+        with self.app.app_context():
+            update_order_status.apply(args=(self.order_id, 'in_progress')).get()
+
+        assert sent == [('status_update', 'loai@gmail.com',
+                         {'order_id': self.order_id, 'name': 'loai', 'status': 'in_progress'})]
+        assert '<' not in json.dumps(sent)
+
+        with self.app.app_context():
+            subject, html = render_email(sent[0][0], **sent[0][2])
+        assert subject == f"Order #{self.order_id} Status Update"
+        assert '<strong>in_progress</strong>' in html
+
+    def test_order_confirmation_is_rendered_in_the_worker(self, monkeypatch):
+        queued = []
+        monkeypatch.setattr(email_batcher, 'add', lambda msg, **kwargs: queued.append(msg))
+        with self.app.app_context():
+            result = send_order_confirmation.apply(args=(self.order_id,)).get()
+
+        # a plain string, not an AsyncResult for the result backend
+        assert result == "Order confirmation queued for loai@gmail.com"
+        (msg,) = queued
+        assert msg.subject == "Order Confirmation" and msg.recipients == ["loai@gmail.com"]
+        assert "Galaxy 26 Ultra" in msg.html and "$2599.98" in msg.html
+
+    def test_context_is_escaped(self):
+        with self.app.app_context():
+            msg = build_message('status_update', 'a@example.com', order_id=1, name='<b>x</b>', status='delivered')
+        assert '&lt;b&gt;x&lt;/b&gt;' in msg.html
+        with pytest.raises(KeyError):
+            render_email('no_such_template')
+
+    def test_templates_are_compiled_once(self, monkeypatch):
+        warm_templates(self.app)
+        assert len(self.app.jinja_env.cache) >= len(EMAIL_TEMPLATES)
+
+        def no_reads(*args):
+            raise AssertionError('template read again')
+        monkeypatch.setattr(self.app.jinja_env.loader, 'get_source', no_reads)
+        with self.app.app_context():
+            for template in EMAIL_TEMPLATES:
+                render_email(template, order_id=1, name='x', status='delivered', items=[],
+                             total_amount=0, products=[])
+
+    def test_fire_and_forget_tasks_store_no_result(self):
+        for task in (send_email_async, send_order_confirmation, send_shipping_notifications, check_low_stock):
+            assert task.ignore_result, task.name
+        # its task_id is handed to the client
+        assert not bulk_update_order_status.ignore_result
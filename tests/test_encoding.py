@@ -0,0 +1,160 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from flask import Response
+from app import create_app
+from app.encoding import FastJSONProvider, brotli, orjson
+from app.models import Order, OrderItem, Product, db
+
+
+def make_app(**config):
+    return create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "CACHE_REDIS_URL": "memory://",
+        **config,
+    })
+
+
+class TestFastJSONProvider:
+
+    payload = {
+        'b': [1, 2.5, None, True],
+        'a': {'created_at': datetime(2026, 3, 1, 12, 30), 'day': date(2026, 3, 2)},
+        'total': Decimal('19.99'),
+        'name': 'Galaxy',
+    }
+
+    def test_backend_follows_json_provider(self):
+        assert make_app(JSON_PROVIDER='stdlib').json.backend == 'stdlib'
+        expected = 'orjson' if orjson is not None else 'stdlib'
+        assert make_app().json.backend == expected
+
+        with pytest.raises(ValueError):
+            make_app(JSON_PROVIDER='ujson')
+
+    def test_orjson_output_matches_stdlib(self):
+        pytest.importorskip('orjson')
+        fast, stdlib = make_app().json, make_app(JSON_PROVIDER='stdlib').json
+        assert fast.backend == 'orjson'
+
+        compact = {'separators': (',', ':')}
+        assert fast.dumps(self.payload, **compact) == stdlib.dumps(self.payload, **compact)
+        assert fast.loads(fast.dumps(self.payload)) == json.loads(stdlib.dumps(self.payload))
+
+        # same values: UTF-8 instead of \u escapes, int keys sorted as strings
+        other = {'name': 'Ünïcode ✓', 'counts': {3: 'x', 10: 'y'}}
+        assert fast.loads(fast.dumps(other)) == json.loads(stdlib.dumps(other))
+        assert fast.loads(fast.dumps(other))['counts'] == {'3': 'x', '10': 'y'}
+
+    def test_falls_back_to_stdlib_for_what_orjson_cannot_encode(self):
+        provider = FastJSONProvider(make_app())
+        assert json.loads(provider.dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+        # indent is stdlib only
+        assert '\n' in provider.dumps({'a': 1}, indent=2)
+
+
+class TestCompression:
+
+    @pytest.fixture(autouse=True)
+    def setup_orders(self, client):
+        self.client = client
+        self.app = client.application
+        with self.app.app_context():
+            product = Product(name="Galaxy 26 Ultra", price=1299.99, stock=1000)
+            db.session.add(product)
+            db.session.add_all([
+                Order(name=f"buyer {i}", email=f"buyer{i}@example.com", total_amount=1299.99,
+                      items=[OrderItem(product=product, quantity=1, unit_price=1299.99)])
+                for i in range(40)
+            ])
+            db.session.commit()
+
+    def identity(self, url):
+        response = self.client.get(url, headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in response.headers
+        return response.data
+
+    def test_large_list_is_gzipped(self):
+        body = self.identity('/api/orders')
+        assert len(body) > self.app.config['COMPRESS_MIN_SIZE']
+
+        response = self.client.get('/api/orders', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert int(response.headers['Content-Length']) == len(response.data) < len(body)
+        assert gzip.decompress(response.data) == body
+
+    def test_brotli_preferred_when_available(self):
+        pytest.importorskip('brotli')
+        body = self.identity('/api/orders')
+
+        response = self.client.get('/api/orders', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert brotli.decompress(response.data) == body
+
+        response = self.client.get('/api/orders', headers={'Accept-Encoding': 'gzip, br;q=0.5'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/api/orders/1', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_json()['id'] == 1
+
+    def test_disabled(self):
+        self.app.extensions['compress'].enabled = False
+        response = self.client.get('/api/orders', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+
+    def test_streamed_list_is_compressed_as_it_streams(self):
+        body = self.identity('/api/orders')
+
+        response = self.client.get('/api/orders?stream=1', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        assert json.loads(gzip.decompress(response.data)) == json.loads(body)
+
+    def test_catalog_etag_is_the_same_on_200_and_304(self, monkeypatch):
+        from app import encoding
+        with self.app.app_context():
+            db.session.add_all([Product(name=f"product {i}", price=9.99, stock=10) for i in range(40)])
+            db.session.commit()
+        identity = self.client.get('/api/products', headers={'Accept-Encoding': 'identity'})
+
+        compressions = []
+        compress_body = encoding.compress_body
+        monkeypatch.setattr('app.routes.compress_body',
+                            lambda body, enc: compressions.append(enc) or compress_body(body, enc))
+
+        response = self.client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data) == identity.data
+        etag = response.headers['ETag']
+        assert not etag.startswith('W/') and etag != identity.headers['ETag']
+
+        not_modified = self.client.get('/api/products', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert not_modified.status_code == 304
+        assert not_modified.headers['ETag'] == etag
+
+        # the gzip validator doesn't revalidate the identity body
+        assert self.client.get('/api/products', headers={'If-None-Match': etag}).status_code == 200
+
+        # compressed once for this catalog version
+        assert self.client.get('/api/products', headers={'Accept-Encoding': 'gzip'}).data == response.data
+        assert compressions == ['gzip']
+
+    def test_server_sent_events_are_left_alone(self):
+        compress = self.app.extensions['compress']
+        assert 'text/event-stream' not in compress.mimetypes
+
+        with self.app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            response = Response(iter([b'data: {}\n\n'] * 200), mimetype='text/event-stream')
+            response = self.app.process_response(response)
+        assert 'Content-Encoding' not in response.headers
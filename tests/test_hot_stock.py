@@ -0,0 +1,141 @@
+from datetime import timedelta
+import pytest
+from app import kv
+from app.hot_stock import counter_key, reconcile_hot_stock, set_hot
+from app.inventory import purge_pending_orders
+from app.models import Order, OrderItem, Product, db, utcnow
+
+
+class TestHotStock:
+
+    @pytest.fixture(autouse=True)
+    def setup_products(self, client):
+        self.client = client
+        self.app = client.application
+        self.app.config['HOT_STOCK_ENABLED'] = True
+        with self.app.app_context():
+            db.session.add_all([
+                Product(name="Limited Drop", price=99.0, stock=5),
+                Product(name="Sidekick", price=5.0, stock=100),
+            ])
+            db.session.commit()
+            set_hot([1])
+
+    def order(self, *items):
+        return self.client.post('/api/orders', json={
+            "name": "loai",
+            "email": "loai@gmail.com",
+            "items": [{"product_id": pid, "quantity": q} for pid, q in items]
+        })
+
+    def stock(self, product_id):
+        with self.app.app_context():
+            return db.session.get(Product, product_id).stock
+
+    def counter(self, product_id):
+        with self.app.app_context():
+            value = kv.get(counter_key(product_id))
+            return None if value is None else int(value)
+
+    def test_orders_take_the_counter_and_reconcile_applies_them(self):
+        assert self.counter(1) == 5
+        assert self.order((1, 2), (2, 1)).status_code == 201
+
+        # the hot row is left alone until the reconcile, the other one isn't
+        assert self.counter(1) == 3
+        assert self.stock(1) == 5
+        assert self.stock(2) == 99
+        with self.app.app_context():
+            assert {(i.product_id, i.stock_applied) for i in db.session.query(OrderItem)} == {(1, False), (2, True)}
+            report = reconcile_hot_stock()
+        assert report['applied'] == {1: 2}
+        assert report['drift'] == {}
+        assert self.stock(1) == 3
+        assert self.counter(1) == 3
+
+        with self.app.app_context():
+            assert reconcile_hot_stock()['applied'] == {}
+        assert self.stock(1) == 3
+
+    def test_never_oversells(self):
+        statuses = [self.order((1, 1)).status_code for _ in range(8)]
+        assert statuses.count(201) == 5
+        assert statuses.count(400) == 3
+        assert self.counter(1) == 0
+        with self.app.app_context():
+            reconcile_hot_stock()
+        assert self.stock(1) == 0
+
+    def test_failed_order_gives_the_counter_back(self):
+        # the hot line is taken first, the normal line then runs out
+        response = self.order((1, 2), (2, 1000))
+        assert response.status_code == 400
+        assert self.counter(1) == 5
+        with self.app.app_context():
+            assert db.session.query(Order).count() == 0
+
+    def test_missing_counter_is_seeded_from_the_database(self):
+        assert self.order((1, 2)).status_code == 201
+        with self.app.app_context():
+            kv.delete(counter_key(1))
+        # 5 in stock, 2 pending on an unreconciled line
+        assert self.order((1, 3)).status_code == 201
+        assert self.order((1, 1)).status_code == 400
+        assert self.counter(1) == 0
+
+    def test_drift_is_reported_and_a_high_counter_corrected(self):
+        with self.app.app_context():
+            kv.incr(counter_key(1), 3)
+            report = reconcile_hot_stock()
+        assert report['drift'] == {1: 3}
+        assert report['corrected'] == {1: -3}
+        assert self.counter(1) == 5
+
+        with self.app.app_context():
+            kv.incr(counter_key(1), -2)
+            report = reconcile_hot_stock()
+        # lower could be an order in flight, only reported
+        assert report['drift'] == {1: -2}
+        assert report['corrected'] == {}
+        assert self.counter(1) == 3
+
+    def test_database_path_counts_pending_lines(self):
+        assert self.order((1, 4)).status_code == 201
+        self.app.config['HOT_STOCK_ENABLED'] = False
+        # stock still says 5, but 4 of them are sold
+        assert self.stock(1) == 5
+        assert self.order((1, 2)).status_code == 400
+        assert self.order((1, 1)).status_code == 201
+
+    def test_unmark_applies_pending_lines(self):
+        assert self.order((1, 2)).status_code == 201
+        with self.app.app_context():
+            set_hot([1], hot=False)
+        assert self.stock(1) == 3
+        assert self.counter(1) is None
+        assert self.order((1, 3)).status_code == 201
+        assert self.stock(1) == 0
+
+    def test_purge_gives_stock_back_to_the_counter(self):
+        assert self.order((1, 2)).status_code == 201
+        with self.app.app_context():
+            db.session.query(Order).update({'created_at': utcnow() - timedelta(days=30)})
+            db.session.commit()
+            assert purge_pending_orders(utcnow() - timedelta(days=7)) == 1
+        # never applied, so the database stock stays, the counter gets it back
+        assert self.stock(1) == 5
+        assert self.counter(1) == 5
+
+    def test_bulk_ingestion_uses_the_counter(self):
+        orders = [{"name": f"buyer {i}", "email": f"b{i}@example.com",
+                   "items": [{"product_id": 1, "quantity": 2}]} for i in range(3)]
+        body = self.client.post('/api/orders/bulk', json=orders).get_json()
+        assert [r['status'] for r in body['results']] == ['created', 'created', 'failed']
+        assert self.counter(1) == 1
+        assert self.stock(1) == 5
+
+    def test_reconcile_task(self):
+        from app.tasks import reconcile_hot_stock as task
+        assert self.order((1, 1)).status_code == 201
+        assert task.apply().get()['applied'] == {1: 1}
+        assert self.stock(1) == 4
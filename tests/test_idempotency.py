@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+import pytest
+from app import kv
+from app.models import Order, Product, db
+
+
+class TestIdempotencyKeys:
+
+    @pytest.fixture(autouse=True)
+    def setup_products(self, client):
+        self.client = client
+        self.app = client.application
+        with self.app.app_context():
+            db.session.add(Product(name="Galaxy 26 Ultra", price=1299.99, stock=4))
+            db.session.commit()
+
+    order_data = {
+        "name": "loai",
+        "email": "loai@gmail.com",
+        "items": [{"product_id": 1, "quantity": 1}]
+    }
+
+    def post(self, url, key, body=None):
+        return self.client.post(url, json=body, headers={'Idempotency-Key': key})
+
+    def test_retried_order_is_created_once(self):
+        first = self.post('/api/orders', 'order-1', self.order_data)
+        retry = self.post('/api/orders', 'order-1', self.order_data)
+        assert first.status_code == retry.status_code == 201
+        assert retry.get_json() == first.get_json()
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert 'Idempotent-Replayed' not in first.headers
+
+        with self.app.app_context():
+            assert db.session.query(Order).count() == 1
+            assert db.session.get(Product, 1).stock == 3
+
+        # a new key is a new order
+        assert self.post('/api/orders', 'order-2', self.order_data).get_json()['id'] != first.get_json()['id']
+
+    def test_retried_payment_replays_the_success(self):
+        order_id = self.client.post('/api/orders', json=self.order_data).get_json()['id']
+        first = self.post(f'/api/orders/{order_id}/pay', 'pay-1')
+        retry = self.post(f'/api/orders/{order_id}/pay', 'pay-1')
+        assert first.status_code == retry.status_code == 200
+        assert retry.get_json()['payment_reference'] == first.get_json()['payment_reference']
+
+        # without the key it is still a second payment attempt
+        assert self.client.post(f'/api/orders/{order_id}/pay').status_code == 400
+
+    def test_key_reused_with_another_body(self):
+        assert self.post('/api/orders', 'order-1', self.order_data).status_code == 201
+        other = dict(self.order_data, name="someone else")
+        response = self.post('/api/orders', 'order-1', other)
+        assert response.status_code == 422
+
+    def test_duplicate_waits_for_the_request_in_flight(self):
+        key = 'idempotency:POST:/api/orders:order-1'
+        with self.app.app_context():
+            kv.set(f'{key}:lock', 'first-request', ttl=10)
+
+        def first_request_finishes():
+            with self.app.app_context():
+                kv.set(key, json.dumps({'status': 201, 'mimetype': 'application/json',
+                                        'body': '{"id": 42}', 'fingerprint': fingerprint}))
+
+        fingerprint = hashlib.sha256(json.dumps(self.order_data).encode()).hexdigest()
+        threading.Timer(0.2, first_request_finishes).start()
+        response = self.client.post('/api/orders', data=json.dumps(self.order_data),
+                                    content_type='application/json', headers={'Idempotency-Key': 'order-1'})
+        assert response.status_code == 201
+        assert response.get_json() == {'id': 42}
+        with self.app.app_context():
+            assert db.session.query(Order).count() == 0
+
+    def test_duplicate_takes_over_when_the_first_request_fails(self):
+        lock_key = 'idempotency:POST:/api/orders:order-1:lock'
+        with self.app.app_context():
+            kv.set(lock_key, 'first-request', ttl=10)
+
+        def first_request_fails():
+            # a 5xx stores nothing and releases the lock
+            with self.app.app_context():
+                kv.delete(lock_key)
+
+        threading.Timer(0.2, first_request_fails).start()
+        response = self.post('/api/orders', 'order-1', self.order_data)
+        assert response.status_code == 201
+        assert 'Idempotent-Replayed' not in response.headers
+        with self.app.app_context():
+            assert db.session.query(Order).count() == 1
+            assert kv.get(lock_key) is None
+
+        retry = self.post('/api/orders', 'order-1', self.order_data)
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert retry.get_json() == response.get_json()
+
+    def test_duplicate_gives_up_after_lock_timeout(self):
+        self.app.config['IDEMPOTENCY_LOCK_TIMEOUT'] = 0.2
+        with self.app.app_context():
+            kv.set('idempotency:POST:/api/orders:order-1:lock', 'first-request', ttl=10)
+        response = self.post('/api/orders', 'order-1', self.order_data)
+        assert response.status_code == 409
+
+    def test_response_stored_just_before_the_lock_is_replayed(self, monkeypatch):
+        key = 'idempotency:POST:/api/orders:order-1'
+        fingerprint = hashlib.sha256(json.dumps(self.order_data).encode()).hexdigest()
+        with self.app.app_context():
+            # the first request stored its response and released the lock
+            # right after the duplicate's first GET
+            kv.set(key, json.dumps({'status': 201, 'mimetype': 'application/json',
+                                    'body': '{"id": 42}', 'fingerprint': fingerprint}))
+        store = self.app.extensions['kv']
+        get, reads = store.get, []
+
+        def get_missing_first_read(name):
+            reads.append(name)
+            return None if reads.count(key) == 1 and name == key else get(name)
+        monkeypatch.setattr(store, 'get', get_missing_first_read)
+
+        response = self.client.post('/api/orders', data=json.dumps(self.order_data),
+                                    content_type='application/json', headers={'Idempotency-Key': 'order-1'})
+        assert response.status_code == 201
+        assert response.get_json() == {'id': 42}
+        with self.app.app_context():
+            assert db.session.query(Order).count() == 0
+        assert get(f'{key}:lock') is None
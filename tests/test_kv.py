@@ -0,0 +1,181 @@
+import queue
+import time
+import pytest
+from app.kv import KVError, MemoryKV, PubSubHub, RedisKV, create_kv
+
+
+def test_memory_backend_api():
+    store = MemoryKV()
+    assert store.get('missing') is None
+    assert store.set('a', 'one')
+    assert store.get('a') == b'one'
+    assert not store.set('a', 'two', nx=True)
+    assert store.get('a') == b'one'
+
+    store.set_many({'b': b'two', 'c': 3}, ttl=60)
+    assert store.get_many(['a', 'b', 'c', 'd']) == [b'one', b'two', b'3', None]
+
+    assert store.incr('counter') == 1
+    assert store.incr('counter', 5) == 6
+    assert store.get('counter') == b'6'
+
+    assert store.delete('a', 'd') == 1
+    assert store.get('a') is None
+
+
+def test_memory_backend_pubsub():
+    store = MemoryKV()
+    first, second = store.subscribe('orders:1:events'), store.subscribe('orders:1:events')
+    assert store.publish('orders:1:events', 'paid') == 2
+    assert store.publish('orders:2:events', 'other') == 0
+    assert first.get(0.1) == second.get(0.1) == b'paid'
+    assert first.get(0.01) is None
+
+    first.close()
+    assert store.publish('orders:1:events', 'shipped') == 1
+    assert store.publish_many([('orders:1:events', 'a'), ('orders:2:events', 'b')]) == [1, 0]
+    assert second.get(0.1) == b'shipped'
+    assert second.get(0.1) == b'a'
+    second.close()
+    assert store.publish('orders:1:events', 'delivered') == 0
+
+
+def test_memory_backend_reserve_many():
+    store = MemoryKV()
+    store.set_many({'stock:1': 5, 'stock:2': 1})
+    assert store.reserve_many({'stock:1': 2, 'stock:2': 1}) is None
+    assert store.get_many(['stock:1', 'stock:2']) == [b'3', b'0']
+
+    # all or nothing: nothing is taken when one key falls short or is missing
+    assert store.reserve_many({'stock:1': 1, 'stock:2': 1}) == ('short', 'stock:2')
+    assert store.reserve_many({'stock:1': 1, 'stock:3': 1}) == ('missing', 'stock:3')
+    assert store.get('stock:1') == b'3'
+
+    store.release_many({'stock:1': 2, 'stock:3': 4})
+    assert store.get_many(['stock:1', 'stock:3']) == [b'5', None]
+
+
+def test_memory_backend_sets():
+    store = MemoryKV()
+    assert store.add_members('low', [1, 2]) == [1, 2]
+    assert store.add_members('low', [2, 3]) == [3]
+    assert store.members('low') == {b'1', b'2', b'3'}
+    assert store.remove_members('low', [1, 4]) == 1
+    assert store.pop_members('low') == {b'2', b'3'}
+    assert store.members('low') == set()
+    assert store.pop_members('low') == set()
+
+
+def test_memory_backend_expiry():
+    store = MemoryKV()
+    store.set('short', 'x', ttl=0.05)
+    store.set_many({'k1': 1, 'k2': 2})
+    store.expire_many(['k1', 'k2'], 0.05)
+    assert store.get_many(['short', 'k1', 'k2']) == [b'x', b'1', b'2']
+    time.sleep(0.1)
+    assert store.get_many(['short', 'k1', 'k2']) == [None, None, None]
+    assert not store.expire('short', 10)
+    assert store.set('short', 'again', nx=True)
+
+
+def test_backend_from_url():
+    assert isinstance(create_kv('memory://'), MemoryKV)
+    redis_kv = create_kv('redis://localhost:6390/3', max_connections=7, socket_timeout=0.5)
+    assert isinstance(redis_kv, RedisKV)
+    assert redis_kv.pool.max_connections == 7
+    assert redis_kv.pool.connection_kwargs['db'] == 3
+    assert redis_kv.pool.connection_kwargs['socket_timeout'] == 0.5
+
+
+class PubSubStandIn:
+    """
+    What PubSubHub needs of a redis-py PubSub, messages pushed by the test
+    """
+    def __init__(self, confirm=True):
+        self.confirm = confirm
+        self.commands = []
+        self.inbox = queue.Queue()
+
+    def subscribe(self, channel):
+        self.commands.append(('subscribe', channel))
+        if self.confirm:
+            self.inbox.put({'type': 'subscribe', 'channel': channel.encode(), 'data': 1})
+
+    def unsubscribe(self, channel):
+        self.commands.append(('unsubscribe', channel))
+
+    def get_message(self, timeout):
+        try:
+            return self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        pass
+
+
+class ClientStandIn:
+    def __init__(self, pubsub):
+        self.pubsubs = []
+        self._pubsub = pubsub
+
+    def pubsub(self):
+        self.pubsubs.append(self._pubsub)
+        return self._pubsub
+
+
+def test_pubsub_hub_shares_one_connection():
+    pubsub = PubSubStandIn()
+    client = ClientStandIn(pubsub)
+    hub = PubSubHub(client, subscribe_timeout=1)
+    try:
+        first, second = hub.subscribe('orders:1:events'), hub.subscribe('orders:1:events')
+        other = hub.subscribe('orders:2:events')
+        assert len(client.pubsubs) == 1
+        assert pubsub.commands == [('subscribe', 'orders:1:events'), ('subscribe', 'orders:2:events')]
+
+        pubsub.inbox.put({'type': 'message', 'channel': b'orders:1:events', 'data': b'paid'})
+        assert first.get(1) == second.get(1) == b'paid'
+        assert other.get(0.1) is None
+
+        first.close()
+        second.close()
+        for _ in range(50):
+            if ('unsubscribe', 'orders:1:events') in pubsub.commands:
+                break
+            time.sleep(0.02)
+        assert pubsub.commands[-1] == ('unsubscribe', 'orders:1:events')
+        other.close()
+    finally:
+        hub.close()
+
+
+def test_pubsub_hub_unconfirmed_subscribe_fails():
+    hub = PubSubHub(ClientStandIn(PubSubStandIn(confirm=False)), subscribe_timeout=0.1)
+    try:
+        with pytest.raises(KVError):
+            hub.subscribe('orders:1:events')
+        assert hub._channels == {}
+    finally:
+        hub.close()
+
+
+def test_redis_subscribe_without_a_server_fails_fast():
+    store = RedisKV('redis://127.0.0.1:1/0', socket_timeout=0.1, socket_connect_timeout=0.1)
+    try:
+        started = time.monotonic()
+        with pytest.raises(KVError):
+            store.subscribe('orders:1:events')
+        assert time.monotonic() - started < 2
+        # the subscription never borrowed a connection from the KV pool
+        assert store.pool._created_connections == 0
+    finally:
+        store.close()
+
+
+def test_extension_uses_the_app_backend(client):
+    from app import kv
+    with client.application.app_context():
+        assert isinstance(kv.backend, MemoryKV)
+        kv.set('hello', 'world')
+        assert kv.get('hello') == b'world'
@@ -0,0 +1,126 @@
+from datetime import timedelta
+import pytest
+from app import kv
+from app.emails import render_email
+from app.hot_stock import reconcile_hot_stock, set_hot
+from app.inventory import purge_pending_orders
+from app.low_stock import LOW_STOCK_PENDING_KEY, low_stock_ids, sync_low_stock
+from app.models import Order, Product, db, utcnow
+from app.tasks import check_low_stock
+
+
+class TestLowStock:
+
+    @pytest.fixture(autouse=True)
+    def setup_products(self, client, monkeypatch):
+        self.client = client
+        self.app = client.application
+        self.app.config['MAIL_USERNAME'] = 'admin@example.com'
+        self.emails = []
+        monkeypatch.setattr('app.tasks.send_email_async.delay',
+                            lambda template, to, context: self.emails.append((template, to, context)))
+        with self.app.app_context():
+            db.session.add_all([
+                Product(name="Laptop", price=999.0, stock=10),
+                Product(name="Mouse", price=25.0, stock=100, low_stock_threshold=50),
+                Product(name="Cable", price=5.0, stock=100),
+            ])
+            db.session.commit()
+
+    def order(self, *items):
+        return self.client.post('/api/orders', json={
+            "name": "loai",
+            "email": "loai@gmail.com",
+            "items": [{"product_id": pid, "quantity": q} for pid, q in items]
+        })
+
+    def low(self):
+        with self.app.app_context():
+            return low_stock_ids()
+
+    def digest(self):
+        with self.app.app_context():
+            return check_low_stock.apply().get()
+
+    def test_crossing_the_threshold_alerts_once_in_one_digest(self):
+        assert self.order((1, 4), (3, 1)).status_code == 201
+        assert self.low() == set()
+
+        # Laptop 6 -> 5 (threshold 5), Mouse 100 -> 40 (threshold 50)
+        assert self.order((1, 1), (2, 60)).status_code == 201
+        assert self.low() == {1, 2}
+        # already low: no second alert
+        assert self.order((1, 1)).status_code == 201
+
+        assert self.digest() == "Found 2 products with low stock"
+        assert len(self.emails) == 1
+        template, to, context = self.emails[0]
+        assert (template, to) == ("low_stock", "admin@example.com")
+        with self.app.app_context():
+            subject, html = render_email(template, **context)
+        assert subject == "Low Stock Alert"
+        assert "Laptop - Stock: 4 (threshold 5)" in html
+        assert "Mouse - Stock: 40 (threshold 50)" in html
+
+        assert self.digest() == "No new low stock products"
+        assert len(self.emails) == 1
+        assert self.low() == {1, 2}
+
+    def test_add_more_items_and_bulk_detect_the_crossing(self):
+        order_id = self.order((3, 1)).get_json()['id']
+        response = self.client.post(f'/api/orders/{order_id}/items', json={"product_id": 1, "quantity": 6})
+        assert response.status_code == 201
+        assert self.low() == {1}
+
+        orders = [{"name": "b", "email": "b@example.com", "items": [{"product_id": 2, "quantity": 60}]}]
+        assert self.client.post('/api/orders/bulk', json=orders).get_json()['created'] == 1
+        assert self.low() == {1, 2}
+
+    def test_restock_rearms_the_alert(self):
+        assert self.order((1, 8)).status_code == 201
+        assert self.digest() == "Found 1 products with low stock"
+
+        with self.app.app_context():
+            db.session.query(Order).update({'created_at': utcnow() - timedelta(days=30)})
+            db.session.commit()
+            purge_pending_orders(utcnow() - timedelta(days=7))
+        assert self.low() == set()
+
+        assert self.order((1, 6)).status_code == 201
+        assert self.low() == {1}
+        assert self.digest() == "Found 1 products with low stock"
+        assert len(self.emails) == 2
+
+    def test_product_threshold_on_create(self):
+        response = self.client.post('/api/products', json={"name": "Dock", "price": 80.0, "stock": 3})
+        assert response.status_code == 201
+        assert response.get_json()['low_stock_threshold'] == 5
+        assert self.low() == {4}
+
+        response = self.client.post('/api/products', json={
+            "name": "Hub", "price": 20.0, "stock": 3, "low_stock_threshold": 2})
+        assert response.status_code == 201
+        assert 5 not in self.low()
+
+        response = self.client.post('/api/products', json={
+            "name": "Hub", "price": 20.0, "stock": 3, "low_stock_threshold": -1})
+        assert response.status_code == 400
+
+    def test_hot_products_alert_when_reconciled(self):
+        self.app.config['HOT_STOCK_ENABLED'] = True
+        with self.app.app_context():
+            set_hot([1])
+        assert self.order((1, 7)).status_code == 201
+        assert self.low() == set()
+        with self.app.app_context():
+            reconcile_hot_stock()
+        assert self.low() == {1}
+
+    def test_sync_rebuilds_the_set(self):
+        with self.app.app_context():
+            db.session.get(Product, 1).stock = 2
+            db.session.commit()
+            kv.add_members('low_stock_products', [3])
+            assert sync_low_stock() == {1}
+            assert low_stock_ids() == {1}
+            assert kv.members(LOW_STOCK_PENDING_KEY) == {b'1'}
@@ -0,0 +1,176 @@
+import socketserver
+import threading
+import pytest
+from flask_mail import Message
+from app import create_app, email_batcher
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Just enough SMTP to talk to smtplib, counting connections and messages.
+    Recipients in `flaky` get a 451 on their first RCPT.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.flaky = set()
+        self.lock = threading.Lock()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 stand-in ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif command == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip('<> ')
+                with server.lock:
+                    if address in server.flaky:
+                        server.flaky.discard(address)
+                        self.reply('451 try again later')
+                        continue
+                recipients.append(address)
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.messages.extend(recipients)
+                self.reply('250 queued')
+            elif command in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mail_app(smtp_server):
+    return create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "CACHE_REDIS_URL": "memory://",
+        "MAIL_SERVER": "127.0.0.1",
+        "MAIL_PORT": smtp_server.server_address[1],
+        "MAIL_USE_TLS": False,
+        "MAIL_USE_SSL": False,
+        "MAIL_USERNAME": None,
+        "MAIL_PASSWORD": None,
+        "MAIL_DEFAULT_SENDER": "shop@example.com",
+        "MAIL_SUPPRESS_SEND": False,
+        "MAIL_BATCH_SIZE": 10,
+        "MAIL_BATCH_WINDOW": 60,
+    })
+
+
+def message(to):
+    msg = Message("Order Confirmation", recipients=[to])
+    msg.html = "<p>thanks</p>"
+    return msg
+
+
+def test_batches_share_one_connection(mail_app, smtp_server):
+    with mail_app.app_context():
+        for i in range(25):
+            email_batcher.add(message(f"buyer{i}@example.com"))
+        # two full batches went out on their own, five are waiting for the window
+        assert smtp_server.connections == 2
+        assert email_batcher.pending() == 5
+        assert email_batcher.flush() == (5, 0)
+
+    assert smtp_server.connections == 3
+    assert len(smtp_server.messages) == 25
+
+
+def test_window_flushes_a_partial_batch(mail_app, smtp_server):
+    mail_app.config['MAIL_BATCH_WINDOW'] = 0.1
+    mail_app.extensions['email_batcher'].window = 0.1
+    with mail_app.app_context():
+        email_batcher.add(message("one@example.com"))
+        email_batcher.add(message("two@example.com"))
+    for _ in range(50):
+        if len(smtp_server.messages) == 2:
+            break
+        threading.Event().wait(0.05)
+    assert smtp_server.messages == ["one@example.com", "two@example.com"]
+    assert smtp_server.connections == 1
+
+
+def test_transient_failures_are_retried(mail_app, smtp_server):
+    smtp_server.flaky.add("flaky@example.com")
+    with mail_app.app_context():
+        email_batcher.add(message("flaky@example.com"))
+        email_batcher.add(message("steady@example.com"))
+        assert email_batcher.flush() == (2, 0)
+    assert sorted(smtp_server.messages) == ["flaky@example.com", "steady@example.com"]
+    assert smtp_server.connections == 1
+
+
+def test_send_email_task_goes_through_the_batcher(mail_app, smtp_server):
+    from app.tasks import send_email_async
+    with mail_app.app_context():
+        for i in range(10):
+            send_email_async.delay("status_update", f"buyer{i}@example.com",
+                                   {"order_id": i, "name": "buyer", "status": "delivered"})
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 10
+
+
+def test_failed_email_is_queued_again_by_its_task(mail_app, smtp_server):
+    from app.tasks import send_email_async
+    mail_app.config['MAIL_TASK_RETRIES'] = 1
+    mail_app.extensions['email_batcher'].retries = 0
+    smtp_server.flaky.add("flaky@example.com")
+    with mail_app.app_context():
+        send_email_async.delay("status_update", "flaky@example.com",
+                               {"order_id": 1, "name": "buyer", "status": "delivered"})
+        assert email_batcher.flush() == (0, 1)
+        # the task ran again and queued a fresh message
+        assert email_batcher.pending() == 1
+        assert email_batcher.flush() == (1, 0)
+    assert smtp_server.messages == ["flaky@example.com"]
+
+
+def test_shipping_notifications_retry_only_failed_recipients(mail_app, smtp_server):
+    from app.tasks import send_shipping_notifications
+    mail_app.extensions['email_batcher'].retries = 0
+    smtp_server.flaky.add("two@example.com")
+    recipients = [[1, "one", "one@example.com"], [2, "two", "two@example.com"], [3, "three", "three@example.com"]]
+    with mail_app.app_context():
+        send_shipping_notifications.delay("delivered", recipients)
+        assert email_batcher.pending() == 0
+    assert sorted(smtp_server.messages) == ["one@example.com", "three@example.com", "two@example.com"]
+    # one session for the chunk, one for the retry of its failure
+    assert smtp_server.connections == 2
@@ -0,0 +1,68 @@
+import re
+import pytest
+from app import celery_app
+from app.celery_app import init_worker_app
+from app.models import Order, Product, db
+from app.tasks import update_order_status
+
+
+def sample(text, name, **labels):
+    # value of one series in the Prometheus text output
+    for line in text.splitlines():
+        match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ''))
+        if found == labels:
+            return float(match.group(3))
+    return None
+
+
+class TestMetrics:
+
+    @pytest.fixture(autouse=True)
+    def setup_data(self, client, monkeypatch):
+        self.client = client
+        self.app = client.application
+        monkeypatch.setattr(celery_app, '_flask_app', None)
+        init_worker_app(self.app)
+        with self.app.app_context():
+            db.session.add(Product(name="Galaxy 26 Ultra", price=1299.99, stock=4))
+            order = Order(name="loai", email="loai@gmail.com")
+            db.session.add(order)
+            db.session.commit()
+            self.order_id = order.id
+
+    def test_request_metrics_per_endpoint(self):
+        for _ in range(2):
+            assert self.client.get(f'/api/orders/{self.order_id}').status_code == 200
+        assert self.client.get('/api/orders/999').status_code == 404
+
+        response = self.client.get('/api/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        text = response.get_data(as_text=True)
+
+        labels = {'endpoint': 'api.get_order', 'method': 'GET'}
+        assert sample(text, 'flasky_http_requests_total', status='200', **labels) == 2
+        assert sample(text, 'flasky_http_requests_total', status='404', **labels) == 1
+        assert sample(text, 'flasky_http_request_duration_seconds_count', **labels) == 3
+        # order + its (empty) items for each hit, one query for the miss
+        assert sample(text, 'flasky_http_request_db_queries_sum', **labels) == 5
+        assert sample(text, 'flasky_http_request_db_queries_bucket', le='0.0', **labels) == 0
+        assert sample(text, 'flasky_http_request_db_queries_bucket', le='+Inf', **labels) == 3
+        assert sample(text, 'flasky_http_request_db_duration_seconds_sum', **labels) > 0
+
+    def test_task_metrics(self):
+        update_order_status.apply(args=(self.order_id, 'in_progress')).get()
+        update_order_status.apply(args=(self.order_id, 'not-a-status'))
+
+        text = self.client.get('/api/metrics').get_data(as_text=True)
+        task = {'task': 'app.tasks.update_order_status'}
+        assert sample(text, 'flasky_celery_task_runs_total', state='success', **task) == 1
+        assert sample(text, 'flasky_celery_task_runs_total', state='failure', **task) == 1
+        assert sample(text, 'flasky_celery_task_duration_seconds_count', **task) == 2
+        assert sample(text, 'flasky_celery_task_db_queries_sum', **task) >= 2
+        # tasks that never ran are left out
+        assert sample(text, 'flasky_celery_task_runs_total', state='success',
+                      task='app.tasks.check_low_stock') is None
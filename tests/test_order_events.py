@@ -0,0 +1,81 @@
+import json
+import pytest
+from app.kv import KVError
+from app.models import Product, db
+from app.tasks import update_order_status
+
+
+def read_event(stream):
+    # next non-comment SSE event as (event, data)
+    while True:
+        chunk = next(stream).decode()
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            return fields['event'], json.loads(fields['data'])
+
+
+class TestOrderEvents:
+
+    @pytest.fixture(autouse=True)
+    def setup_order(self, client):
+        self.client = client
+        self.app = client.application
+        self.app.config.update(SSE_HEARTBEAT=0.05, SSE_MAX_DURATION=5)
+        with self.app.app_context():
+            db.session.add(Product(name="Galaxy 26 Ultra", price=1299.99, stock=4))
+            db.session.commit()
+        response = client.post('/api/orders', json={
+            "name": "loai",
+            "email": "loai@gmail.com",
+            "items": [{"product_id": 1, "quantity": 1}]
+        })
+        self.order_id = response.get_json()['id']
+
+    def open_stream(self):
+        response = self.client.get(f'/api/orders/{self.order_id}/events', buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        return response, iter(response.response)
+
+    def test_pushes_payment_and_shipping_changes(self):
+        response, stream = self.open_stream()
+        event, data = read_event(stream)
+        assert event == 'snapshot'
+        assert data['payment_status'] == 'pending'
+        assert data['shipping_status'] == 'pending'
+
+        payment = self.client.post(f'/api/orders/{self.order_id}/pay').get_json()
+        event, data = read_event(stream)
+        assert event == 'payment'
+        assert data['payment_status'] == 'paid'
+        assert data['payment_reference'] == payment['payment_reference']
+        assert 'items' not in data
+
+        update_order_status.apply(args=(self.order_id, 'in_progress'))
+        assert read_event(stream) == ('shipping', {'shipping_status': 'in_progress'})
+
+        # delivered is final, the stream ends there
+        update_order_status.apply(args=(self.order_id, 'delivered'))
+        assert read_event(stream) == ('shipping', {'shipping_status': 'delivered'})
+        with pytest.raises(StopIteration):
+            next(stream)
+        response.close()
+
+    def test_heartbeat_while_nothing_happens(self):
+        response, stream = self.open_stream()
+        read_event(stream)
+        assert next(stream) == b': keep-alive\n\n'
+        response.close()
+        # the viewer went away, its subscription is gone too
+        assert self.app.extensions['kv']._channels == {}
+
+    def test_unknown_order(self):
+        assert self.client.get('/api/orders/999/events').status_code == 404
+
+    def test_unavailable_pubsub_is_a_503(self, monkeypatch):
+        def unavailable(channel):
+            raise KVError('Too many connections')
+        monkeypatch.setattr(self.app.extensions['kv'], 'subscribe', unavailable)
+        response = self.client.get(f'/api/orders/{self.order_id}/events')
+        assert response.status_code == 503
+        assert 'error' in response.get_json()
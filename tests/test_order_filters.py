@@ -0,0 +1,96 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from app.models import Order, PaymentStatus, ShippingStatus, db
+
+
+class TestOrderFilters:
+
+    @pytest.fixture(autouse=True)
+    def setup_orders(self, client):
+        self.client = client
+        self.app = client.application
+        with self.app.app_context():
+            for i in range(1, 21):
+                db.session.add(Order(
+                    name=f"buyer {i}",
+                    email="loai@gmail.com" if i % 5 == 0 else f"buyer{i}@example.com",
+                    payment_status=PaymentStatus.PAID if i % 2 == 0 else PaymentStatus.PENDING,
+                    shipping_status=ShippingStatus.DELIVERED if i % 4 == 0 else ShippingStatus.PENDING,
+                    created_at=datetime(2025, 1, i, 12, 0),
+                ))
+            db.session.commit()
+
+    def ids(self, query):
+        response = self.client.get(f'/api/orders?{query}')
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        return [order['id'] for order in (body['items'] if isinstance(body, dict) else body)]
+
+    def test_filters(self):
+        assert self.ids('email=loai@gmail.com') == [5, 10, 15, 20]
+        assert self.ids('payment_status=paid') == list(range(2, 21, 2))
+        assert self.ids('shipping_status=delivered') == [4, 8, 12, 16, 20]
+        assert self.ids('start=2025-01-03&end=2025-01-05') == [3, 4, 5]
+        assert self.ids('start=2025-01-18') == [18, 19, 20]
+        assert self.ids('end=2025-01-02') == [1, 2]
+        assert self.ids('start=2025-02-01') == []
+        assert self.ids('start=2025-01-19&end=9999-12-31') == [19, 20]
+        assert self.ids('start=0001-01-01&end=2025-01-01') == [1]
+        assert self.ids('email=loai@gmail.com&payment_status=paid&end=2025-01-15') == [10]
+
+    def test_filters_with_pages_and_stream(self):
+        page = self.client.get('/api/orders?payment_status=paid&limit=3').get_json()
+        assert [o['id'] for o in page['items']] == [2, 4, 6]
+        assert 'payment_status=paid' in page['next']
+        page = self.client.get(page['next']).get_json()
+        assert [o['id'] for o in page['items']] == [8, 10, 12]
+
+        assert self.ids('start=2025-01-10&limit=2&after=15') == [16, 17]
+        assert self.ids('shipping_status=delivered&stream=1') == [4, 8, 12, 16, 20]
+
+    @pytest.mark.parametrize('query', [
+        'payment_status=refunded',
+        'shipping_status=lost',
+        'start=yesterday',
+        'start=2025-01-10&end=2025-01-01',
+    ])
+    def test_invalid_filters(self, query):
+        response = self.client.get(f'/api/orders?{query}')
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+    @pytest.mark.parametrize('query', [
+        'email=loai@gmail.com',
+        'payment_status=pending',
+        'shipping_status=in_progress',
+        'start=2025-01-03&end=2025-01-05',
+        'start=2025-01-03',
+        'end=2025-01-05',
+        'payment_status=paid&limit=5&after=4',
+        'start=2025-01-03&limit=5&after=4',
+        'email=loai@gmail.com&stream=1',
+    ])
+    def test_filters_use_an_index(self, query):
+        with self.app.app_context():
+            engine = db.engine
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT') and 'FROM "order"' in statement:
+                statements.append((statement, parameters))
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            self.client.get(f'/api/orders?{query}').get_data()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        # the same statement and parameters the endpoint ran
+        statement, parameters = statements[0]
+        with engine.connect() as conn:
+            plan = [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+
+        assert not any(step.startswith('SCAN') for step in plan), plan
+        assert any('USING' in step and ('INDEX' in step or 'PRIMARY KEY' in step) for step in plan), plan
+        assert not any('TEMP B-TREE' in step for step in plan), plan
@@ -58,6 +58,24 @@ class TestOrderProcess:
         print(f"Updated stock - Galaxy 26 Ultra: {galaxy['stock']}, MacBook Air: {macbook_air['stock']}")
 
 
+    def test_product_id_must_be_an_integer(self, client):
+        for product_id in ([1], "1", True, None):
+            response = client.post('/api/orders', json={
+                "name": "me",
+                "email": "me@gmail.com",
+                "items": [{"product_id": product_id, "quantity": 1}]
+            })
+            assert response.status_code == 400, product_id
+            assert response.get_json() == {'error': 'product_id must be an integer'}
+
+        order_id = client.post('/api/orders', json={
+            "name": "me",
+            "email": "me@gmail.com",
+            "items": [{"product_id": 1, "quantity": 1}]
+        }).get_json()['id']
+        response = client.post(f'/api/orders/{order_id}/items', json={"product_id": [2], "quantity": 1})
+        assert response.status_code == 400
+
     def test_add_items_to_existing_order(self, client):
         order_data= {
         "name": "loai",
@@ -116,4 +134,72 @@ class TestOrderProcess:
         assert get_payment['payment_reference'].startswith('Ref_')
         assert get_payment['order']['payment_status'] == 'paid'
 
-        print(get_payment['payment_reference'])
\ No newline at end of file
+        print(get_payment['payment_reference'])
+
+    def test_get_orders_query_count_is_constant(self, client, query_budget):
+        order_data = {
+            "name": "loai",
+            "email": "loai@gmail.com",
+            "items": [
+                {"product_id": 2, "quantity": 1},
+                {"product_id": 3, "quantity": 1}
+            ]
+        }
+        assert client.post('/api/orders', json=order_data).status_code == 201
+        with query_budget(3, 'one order') as few_orders:
+            orders = client.get('/api/orders').get_json()
+        assert len(orders) == 1
+        assert orders[0]['total_amount'] == pytest.approx(2299.99 + 3009.00)
+
+        for _ in range(3):
+            assert client.post('/api/orders', json=order_data).status_code == 201
+        with query_budget(3, 'four orders', same_as=few_orders):
+            orders = client.get('/api/orders').get_json()
+        assert len(orders) == 4
+
+        order_id = orders[-1]['id']
+        with query_budget(3, 'single order'):
+            order = client.get(f'/api/orders/{order_id}').get_json()
+        assert len(order['items']) == 2
+
+
+    def test_order_total_is_snapshotted(self, client):
+        order_data = {
+            "name": "loai",
+            "email": "loai@gmail.com",
+            "items": [{"product_id": 2, "quantity": 2}]
+        }
+        response = client.post('/api/orders', json=order_data)
+        assert response.status_code == 201
+        order = response.get_json()
+        assert order['total_amount'] == pytest.approx(2 * 2299.99)
+        assert order['items'][0]['unit_price'] == pytest.approx(2299.99)
+
+        with client.application.app_context():
+            db.session.get(Product, 2).price = 1999.99
+            db.session.commit()
+
+        response = client.post(f"/api/orders/{order['id']}/items", json={"product_id": 2, "quantity": 1})
+        assert response.status_code == 201
+        assert response.get_json()['unit_price'] == pytest.approx(1999.99)
+
+        order = client.get(f"/api/orders/{order['id']}").get_json()
+        assert order['total_amount'] == pytest.approx(2 * 2299.99 + 1999.99)
+
+
+    def test_backfill_order_totals_command(self, client):
+        app = client.application
+        with app.app_context():
+            order = Order(name="legacy", email="legacy@gmail.com")
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(OrderItem(order_id=order.id, product_id=3, quantity=2, unit_price=3009.00))
+            db.session.commit()
+            order_id = order.id
+
+        result = app.test_cli_runner().invoke(args=['backfill-order-totals'])
+        assert result.exit_code == 0
+        assert 'recomputed 1 order total(s)' in result.output
+
+        with app.app_context():
+            assert db.session.get(Order, order_id).total_amount == pytest.approx(6018.00)
@@ -0,0 +1,82 @@
+import pytest
+from app.models import Product, db
+
+
+class TestPagination:
+
+    @pytest.fixture(autouse=True)
+    def setup_products(self, client):
+        self.client = client
+        with client.application.app_context():
+            db.session.add_all([
+                Product(name=f"Product {i}", price=10.0 + i, stock=100)
+                for i in range(1, 26)
+            ])
+            db.session.commit()
+
+    def test_plain_list_is_unchanged(self):
+        response = self.client.get('/api/products')
+        assert response.status_code == 200
+        assert len(response.get_json()) == 25
+
+    def test_walk_pages_with_cursor(self):
+        seen = []
+        url = '/api/products?limit=10'
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            assert response.status_code == 200
+            page = response.get_json()
+            seen.extend(p['id'] for p in page['items'])
+            url = page['next']
+            pages += 1
+            if url:
+                assert response.headers['Link'] == f'<{url}>; rel="next"'
+                assert page['next_cursor'] == page['items'][-1]['id']
+        assert pages == 3
+        assert seen == list(range(1, 26))
+
+    def test_after_cursor_skips_seen_rows(self):
+        page = self.client.get('/api/products?limit=5&after=20').get_json()
+        assert [p['id'] for p in page['items']] == [21, 22, 23, 24, 25]
+        assert page['next_cursor'] is None
+        assert page['next'] is None
+
+    def test_invalid_limit(self):
+        response = self.client.get('/api/products?limit=abc')
+        assert response.status_code == 400
+        response = self.client.get('/api/products?limit=0')
+        assert response.status_code == 400
+
+    def test_cursor_beyond_64_bits(self):
+        response = self.client.get(f'/api/products?after={2 ** 63 - 1}')
+        assert response.status_code == 200
+        assert response.get_json()['items'] == []
+        for query in (f'after={2 ** 63}', f'limit={2 ** 64}', f'after={10 ** 30}&stream=1'):
+            response = self.client.get(f'/api/products?{query}')
+            assert response.status_code == 400, query
+            assert 'error' in response.get_json()
+
+    def test_stream_products(self, monkeypatch):
+        monkeypatch.setattr('app.pagination.STREAM_BATCH_SIZE', 4)
+        response = self.client.get('/api/products?stream=1')
+        assert response.status_code == 200
+        assert response.is_streamed
+        products = response.get_json()
+        assert [p['id'] for p in products] == list(range(1, 26))
+
+    def test_stream_and_page_orders(self, monkeypatch):
+        monkeypatch.setattr('app.pagination.STREAM_BATCH_SIZE', 2)
+        for i in range(1, 8):
+            order = {"name": "loai", "email": "loai@gmail.com",
+                     "items": [{"product_id": i, "quantity": 1}]}
+            assert self.client.post('/api/orders', json=order).status_code == 201
+
+        streamed = self.client.get('/api/orders?stream=1&after=2').get_json()
+        assert [o['id'] for o in streamed] == [3, 4, 5, 6, 7]
+        assert streamed[0]['items'][0]['product']['id'] == 3
+
+        page = self.client.get('/api/orders?limit=3').get_json()
+        assert [o['id'] for o in page['items']] == [1, 2, 3]
+        assert page['next_cursor'] == 3
+        assert page['items'][0]['total_amount'] == pytest.approx(11.0)
@@ -0,0 +1,79 @@
+import json
+import threading
+from datetime import timedelta
+import pytest
+from app import kv
+from app.models import Product, Order, db, utcnow
+
+
+class TestPopularProducts:
+
+    @pytest.fixture(autouse=True)
+    def setup_orders(self, client):
+        self.client = client
+        with client.application.app_context():
+            db.session.add_all([
+                Product(name="Galaxy 26 Ultra", price=1299.99, stock=40),
+                Product(name="MackBook Air", price=2299.99, stock=70),
+                Product(name="MackBook Pro", price=3009.00, stock=90),
+            ])
+            db.session.commit()
+
+        for product_id, times in [(1, 1), (2, 3), (3, 2)]:
+            for _ in range(times):
+                order = {"name": "loai", "email": "loai@gmail.com",
+                         "items": [{"product_id": product_id, "quantity": 1}]}
+                assert client.post('/api/orders', json=order).status_code == 201
+
+    def test_ranks_products_in_window(self):
+        response = self.client.get('/api/products/popular')
+        assert response.status_code == 200
+        assert response.headers['X-Cache'] == 'miss'
+        ranking = response.get_json()
+        assert [p['id'] for p in ranking] == [2, 3, 1]
+        assert ranking[0]['order_count'] == 3
+
+        assert [p['id'] for p in self.client.get('/api/products/popular?limit=2').get_json()] == [2, 3]
+
+    def test_window_excludes_old_orders(self):
+        with self.client.application.app_context():
+            for order in db.session.scalars(db.select(Order).where(Order.id.in_([2, 3, 4]))):
+                order.created_at = utcnow() - timedelta(days=30)
+            db.session.commit()
+        assert [p['id'] for p in self.client.get('/api/products/popular').get_json()] == [3, 1]
+        assert [p['id'] for p in self.client.get('/api/products/popular?days=60').get_json()] == [2, 3, 1]
+
+    def test_invalid_params(self):
+        assert self.client.get('/api/products/popular?days=x').status_code == 400
+        assert self.client.get('/api/products/popular?limit=1000').status_code == 400
+
+    def test_serves_cached_bytes(self):
+        first = self.client.get('/api/products/popular')
+        assert first.headers['X-Cache'] == 'miss'
+        with self.client.application.app_context():
+            assert kv.get('popular_products') == first.data
+            assert kv.get('popular_products:lock') is None
+
+            kv.set('popular_products', b'[{"id": 42, "precomputed": true}]')
+        second = self.client.get('/api/products/popular')
+        assert second.headers['X-Cache'] == 'hit'
+        assert second.data == b'[{"id": 42, "precomputed": true}]'
+
+        custom = self.client.get('/api/products/popular?limit=1')
+        assert custom.headers['X-Cache'] == 'miss'
+        with self.client.application.app_context():
+            assert json.loads(kv.get('popular_products:7d:1'))[0]['id'] == 2
+
+    def test_waits_for_lock_holder(self):
+        app = self.client.application
+        with app.app_context():
+            kv.set('popular_products:lock', 'someone-else', ttl=10)
+
+        def other_worker_finishes():
+            with app.app_context():
+                kv.set('popular_products', b'[]')
+
+        threading.Timer(0.2, other_worker_finishes).start()
+        response = self.client.get('/api/products/popular')
+        assert response.headers['X-Cache'] == 'wait'
+        assert response.data == b'[]'
@@ -0,0 +1,90 @@
+import pytest
+from app.models import Product, db
+
+
+# Statement budgets per endpoint. Each one is exercised at two sizes and has
+# to run the same number of statements at both, so an N+1 (a lazy load per
+# item, a get() per cart line) fails here even while the budget still holds.
+
+class TestQueryBudgets:
+
+    @pytest.fixture(autouse=True)
+    def setup_products(self, client):
+        self.client = client
+        with client.application.app_context():
+            db.session.add_all([Product(name=f"Product {i}", price=10.0 + i, stock=100) for i in range(1, 11)])
+            db.session.commit()
+
+    def create_order(self, lines):
+        response = self.client.post('/api/orders', json={
+            "name": "loai",
+            "email": "loai@gmail.com",
+            "items": [{"product_id": product_id, "quantity": 1} for product_id in range(1, lines + 1)]
+        })
+        assert response.status_code == 201
+        return response.get_json()['id']
+
+    def test_create_order(self, query_budget):
+        # product IN, order, item executemany, stock update, order + items + products
+        with query_budget(8, 'one line') as small:
+            self.create_order(1)
+        with query_budget(8, 'ten lines', same_as=small):
+            self.create_order(10)
+
+    def test_add_more_items(self, query_budget):
+        small_order, large_order = self.create_order(1), self.create_order(10)
+        with query_budget(7, 'one line') as small:
+            assert self.client.post(f'/api/orders/{small_order}/items',
+                                    json={"product_id": 1, "quantity": 1}).status_code == 201
+        with query_budget(7, 'ten lines', same_as=small):
+            assert self.client.post(f'/api/orders/{large_order}/items',
+                                    json={"product_id": 1, "quantity": 1}).status_code == 201
+
+    def test_get_order(self, query_budget):
+        small_order, large_order = self.create_order(1), self.create_order(10)
+        with query_budget(3, 'one line') as small:
+            assert len(self.client.get(f'/api/orders/{small_order}').get_json()['items']) == 1
+        with query_budget(3, 'ten lines', same_as=small):
+            assert len(self.client.get(f'/api/orders/{large_order}').get_json()['items']) == 10
+
+    def test_pay_order(self, query_budget):
+        # includes the confirmation email task, it runs inline in tests
+        small_order, large_order = self.create_order(1), self.create_order(10)
+        with query_budget(10, 'one line') as small:
+            assert self.client.post(f'/api/orders/{small_order}/pay').status_code == 200
+        with query_budget(10, 'ten lines', same_as=small):
+            assert self.client.post(f'/api/orders/{large_order}/pay').status_code == 200
+
+    def test_order_confirmation_task(self, query_budget, monkeypatch):
+        # in a fresh session, the way a worker runs it (nothing in the identity map)
+        from app import email_batcher
+        from app.tasks import send_order_confirmation
+        sent = []
+        monkeypatch.setattr(email_batcher, 'add', lambda msg, **kwargs: sent.append(msg))
+        small_order, large_order = self.create_order(1), self.create_order(10)
+        app = self.client.application
+        with app.app_context(), query_budget(3, 'one line') as small:
+            send_order_confirmation.run(small_order)
+        with app.app_context(), query_budget(3, 'ten lines', same_as=small):
+            send_order_confirmation.run(large_order)
+        assert len(sent) == 2
+
+    def test_order_pages_and_stream(self, query_budget):
+        self.create_order(1)
+        with query_budget(3, 'page of one') as small_page:
+            assert len(self.client.get('/api/orders?limit=50').get_json()['items']) == 1
+        with query_budget(3, 'stream of one') as small_stream:
+            assert len(self.client.get('/api/orders?stream=1').get_json()) == 1
+
+        for lines in range(2, 11):
+            self.create_order(lines)
+        with query_budget(3, 'page of ten', same_as=small_page):
+            assert len(self.client.get('/api/orders?limit=50').get_json()['items']) == 10
+        with query_budget(3, 'stream of ten', same_as=small_stream):
+            assert len(self.client.get('/api/orders?stream=1').get_json()) == 10
+
+    def test_products(self, query_budget):
+        with query_budget(1, 'catalog'):
+            assert len(self.client.get('/api/products').get_json()) == 10
+        with query_budget(2, 'create product'):
+            assert self.client.post('/api/products', json={"name": "New", "price": 1.0, "stock": 1}).status_code == 201
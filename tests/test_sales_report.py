@@ -0,0 +1,74 @@
+from datetime import date, datetime, timedelta
+import pytest
+from app.models import DailySales, Order, PaymentStatus, Product, db
+from app.reports import rollup_pending_days, sales_report
+
+
+class TestSalesReport:
+
+    @pytest.fixture(autouse=True)
+    def setup_orders(self, client):
+        self.client = client
+        self.app = client.application
+        with self.app.app_context():
+            db.session.add_all([
+                Product(name="Galaxy 26 Ultra", price=100.0, stock=100),
+                Product(name="MackBook Air", price=10.0, stock=100),
+            ])
+            db.session.commit()
+
+        # (paid day, [(product_id, quantity)]), None -> still pending
+        orders = [
+            (date(2025, 1, 1), [(1, 1), (2, 2)]),
+            (date(2025, 1, 1), [(2, 5)]),
+            (date(2025, 1, 3), [(1, 2)]),
+            (None, [(1, 9)]),
+        ]
+        for paid_day, items in orders:
+            response = client.post('/api/orders', json={
+                "name": "loai", "email": "loai@gmail.com",
+                "items": [{"product_id": pid, "quantity": qty} for pid, qty in items]
+            })
+            assert response.status_code == 201
+            if paid_day:
+                with self.app.app_context():
+                    order = db.session.get(Order, response.get_json()['id'])
+                    order.payment_status = PaymentStatus.PAID
+                    order.paid_at = datetime.combine(paid_day, datetime.min.time()) + timedelta(hours=12)
+                    db.session.commit()
+
+    def test_rollup_and_range_report(self):
+        with self.app.app_context():
+            days = rollup_pending_days(date(2025, 1, 3))
+            assert days == [date(2025, 1, 1), date(2025, 1, 2), date(2025, 1, 3)]
+
+            day_one = sales_report(date(2025, 1, 1))
+            assert day_one['total_orders'] == 2
+            assert day_one['total_revenue'] == pytest.approx(170.0)
+            assert day_one['top_products'] == [
+                {'name': 'MackBook Air', 'sold': 7},
+                {'name': 'Galaxy 26 Ultra', 'sold': 1},
+            ]
+
+            assert sales_report(date(2025, 1, 2))['total_orders'] == 0
+
+            whole = sales_report(date(2025, 1, 1), date(2025, 1, 3))
+            assert whole['total_orders'] == 3
+            assert whole['total_revenue'] == pytest.approx(370.0)
+            assert whole['top_products'][0] == {'name': 'MackBook Air', 'sold': 7}
+            assert whole['top_products'][1] == {'name': 'Galaxy 26 Ultra', 'sold': 3}
+
+            # the next run only revisits the last rolled-up day onwards
+            assert rollup_pending_days(date(2025, 1, 4)) == [date(2025, 1, 3), date(2025, 1, 4)]
+            assert db.session.query(DailySales).count() == 4
+
+    def test_report_endpoint(self):
+        with self.app.app_context():
+            rollup_pending_days(date(2025, 1, 3))
+
+        response = self.client.get('/api/reports/sales?start=2025-01-01&end=2025-01-03')
+        assert response.status_code == 200
+        assert response.get_json()['total_orders'] == 3
+
+        assert self.client.get('/api/reports/sales?start=yesterday').status_code == 400
+        assert self.client.get('/api/reports/sales?start=2025-01-03&end=2025-01-01').status_code == 400
@@ -0,0 +1,88 @@
+import pytest
+from app import mail
+from app.events import order_channel
+from app.models import Order, ShippingStatus, db
+from app.tasks import bulk_update_order_status
+
+
+class TestBulkShippingStatus:
+
+    @pytest.fixture(autouse=True)
+    def setup_orders(self, client):
+        self.client = client
+        self.app = client.application
+        self.app.extensions['mail'].default_sender = 'shop@example.com'
+        with self.app.app_context():
+            db.session.add_all([
+                Order(name=f"buyer {i}", email=f"buyer{i}@example.com",
+                      shipping_status=ShippingStatus.DELIVERED if i == 5 else ShippingStatus.PENDING)
+                for i in range(1, 6)
+            ])
+            db.session.commit()
+
+    def statuses(self):
+        with self.app.app_context():
+            return {order.id: order.shipping_status.value for order in db.session.query(Order)}
+
+    def test_endpoint_updates_orders_and_skips_invalid_transitions(self):
+        response = self.client.post('/api/orders/shipping-status', json={
+            "order_ids": [1, 2, 3, 5, 99, 2],
+            "status": "in_progress"
+        })
+        assert response.status_code == 202
+        body = response.get_json()
+        assert body['orders'] == 5
+        assert body['task_id']
+
+        # 5 is delivered already and never goes back, 99 doesn't exist
+        assert self.statuses() == {1: 'in_progress', 2: 'in_progress', 3: 'in_progress', 4: 'pending', 5: 'delivered'}
+
+        with self.app.app_context():
+            result = bulk_update_order_status.apply(args=([1, 4, 5], 'delivered')).get()
+        assert result == {'status': 'delivered', 'requested': 3, 'updated': 2}
+        assert self.statuses()[1] == self.statuses()[4] == 'delivered'
+
+        with self.app.app_context():
+            assert bulk_update_order_status.apply(args=([1, 2], 'pending')).get()['updated'] == 0
+        assert self.statuses()[2] == 'in_progress'
+
+    def test_one_update_and_one_email_job_per_chunk(self, query_budget, monkeypatch):
+        self.app.config['SHIPPING_UPDATE_CHUNK_SIZE'] = 2
+        jobs = []
+        monkeypatch.setattr('app.tasks.send_shipping_notifications.delay',
+                            lambda status, recipients: jobs.append((status, recipients)))
+
+        with self.app.app_context():
+            with query_budget(3, label='5 orders in chunks of 2'):
+                result = bulk_update_order_status.apply(args=([1, 2, 3, 4, 5], 'delivered')).get()
+        assert result['updated'] == 4
+        assert jobs == [
+            ('delivered', [[1, 'buyer 1', 'buyer1@example.com'], [2, 'buyer 2', 'buyer2@example.com']]),
+            ('delivered', [[3, 'buyer 3', 'buyer3@example.com'], [4, 'buyer 4', 'buyer4@example.com']]),
+        ]
+
+    def test_notifications_and_events(self):
+        with self.app.app_context():
+            subscription = self.app.extensions['kv'].subscribe(order_channel(2))
+            with mail.record_messages() as outbox:
+                bulk_update_order_status.apply(args=([1, 2, 3], 'in_progress')).get()
+        assert sorted(msg.recipients[0] for msg in outbox) == [
+            'buyer1@example.com', 'buyer2@example.com', 'buyer3@example.com']
+        assert 'in_progress' in outbox[0].html
+        assert b'"shipping_status": "in_progress"' in subscription.get(0.1)
+        subscription.close()
+
+    @pytest.mark.parametrize('body, code', [
+        ({"order_ids": [1], "status": "lost"}, 400),
+        ({"order_ids": [1], "status": "pending"}, 400),
+        ({"order_ids": [], "status": "delivered"}, 400),
+        ({"order_ids": [1, "2"], "status": "delivered"}, 400),
+        ({"order_ids": [True], "status": "delivered"}, 400),
+        ({"status": "delivered"}, 400),
+        ({"order_ids": list(range(1, 12)), "status": "delivered"}, 413),
+    ])
+    def test_invalid_requests(self, body, code):
+        self.app.config['SHIPPING_UPDATE_MAX_ORDERS'] = 10
+        response = self.client.post('/api/orders/shipping-status', json=body)
+        assert response.status_code == code
+        assert 'error' in response.get_json()
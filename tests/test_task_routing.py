@@ -0,0 +1,102 @@
+import threading
+import time
+import pytest
+from celery.contrib.testing.worker import start_worker
+from app import create_app, db, email_batcher
+from app.celery_app import EARLY_ACK_QUEUES, TASK_QUEUES, TASK_ROUTES, celery, init_worker_app
+from app.models import Order, OrderItem, Product
+
+
+class TestTaskRouting:
+
+    def route(self, task):
+        return celery.amqp.router.route({}, task)
+
+    def test_every_task_is_routed_with_time_limits(self):
+        import app.tasks  # noqa: F401, registers the tasks
+        for name, (queue, priority, soft, hard) in TASK_ROUTES.items():
+            route = self.route(name)
+            assert route['queue'].name == queue in TASK_QUEUES
+            assert route['queue'].queue_arguments == {'x-max-priority': 9}
+            assert 0 <= route['priority'] == priority <= 9
+            task = celery.tasks[name]
+            assert (task.soft_time_limit, task.time_limit) == (soft, hard)
+            assert soft < hard
+            # email tasks return before their batch is sent, they ack on start
+            assert task.acks_late == (queue not in EARLY_ACK_QUEUES)
+
+        assert self.route('app.tasks.send_order_confirmation')['queue'].name == 'email'
+        assert self.route('app.tasks.generate_daily_sales_report')['queue'].name == 'batch'
+        # priority orders tasks sharing a queue
+        assert self.route('app.tasks.send_order_confirmation')['priority'] > \
+            self.route('app.tasks.send_email_async')['priority']
+        assert self.route('app.tasks.bulk_update_order_status')['priority'] > \
+            self.route('app.tasks.cleanup_old_pending_orders')['priority']
+        assert celery.conf.worker_prefetch_multiplier == 1
+
+
+class TestQueueIsolation:
+    """
+    Real workers on the in-memory broker: one consuming batch, one consuming
+    email, the way docker-compose runs them
+    """
+
+    @pytest.fixture
+    def workers(self, tmp_path, monkeypatch):
+        app = create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'routing.db'}",
+            "CACHE_REDIS_URL": "memory://",
+        })
+        with app.app_context():
+            db.create_all()
+            order = Order(name="loai", email="loai@gmail.com", total_amount=10.0, payment_reference="PAY-1",
+                          items=[OrderItem(product=Product(name="Cable", price=5.0, stock=10),
+                                           quantity=2, unit_price=5.0)])
+            db.session.add(order)
+            db.session.commit()
+            self.order_id = order.id
+
+        monkeypatch.setattr('app.celery_app._flask_app', None)
+        init_worker_app(app)
+        settings = {'task_always_eager': False, 'broker_url': 'memory://', 'result_backend': 'cache+memory://'}
+        previous = {key: celery.conf[key] for key in settings}
+        celery.conf.update(settings)
+        # connections are pooled per broker url, start over on the memory one
+        monkeypatch.setattr(celery, '_pool', None)
+        monkeypatch.setattr(celery.amqp, '_producer_pool', None)
+        try:
+            with start_worker(celery, pool='threads', concurrency=1, queues=['batch'], perform_ping_check=False), \
+                    start_worker(celery, pool='threads', concurrency=1, queues=['email'], perform_ping_check=False):
+                yield app
+        finally:
+            celery.conf.update(previous)
+
+    def test_confirmation_is_not_stuck_behind_a_long_report(self, workers, monkeypatch):
+        from app.tasks import generate_daily_sales_report, send_order_confirmation
+
+        report_running, release_report = threading.Event(), threading.Event()
+
+        def slow_rollup(today):
+            report_running.set()
+            release_report.wait(10)
+            return [today]
+        monkeypatch.setattr('app.reports.rollup_pending_days', slow_rollup)
+
+        confirmed = threading.Event()
+        monkeypatch.setattr(email_batcher, 'add', lambda msg, **kwargs: confirmed.set())
+
+        try:
+            generate_daily_sales_report.delay()
+            assert report_running.wait(5)
+
+            started = time.perf_counter()
+            send_order_confirmation.delay(self.order_id)
+            assert confirmed.wait(5), 'confirmation waited for the report'
+            latency = time.perf_counter() - started
+            assert not release_report.is_set()
+        finally:
+            release_report.set()
+
+        # picked up straight away by the email worker, not after the report
+        assert latency < 2
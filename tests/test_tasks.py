@@ -0,0 +1,32 @@
+import pytest
+from app import celery_app
+from app.celery_app import init_worker_app
+from app.models import Order, ShippingStatus, db
+from app.tasks import update_order_status
+
+
+class TestWorkerApp:
+
+    @pytest.fixture(autouse=True)
+    def worker_app(self, client, monkeypatch):
+        self.app = client.application
+        monkeypatch.setattr(celery_app, '_flask_app', None)
+        init_worker_app(self.app)
+        with self.app.app_context():
+            order = Order(name="loai", email="loai@gmail.com")
+            db.session.add(order)
+            db.session.commit()
+            self.order_id = order.id
+
+    def test_tasks_reuse_the_process_app(self, monkeypatch):
+        def create_app(*args, **kwargs):
+            raise AssertionError('tasks must not build a Flask app per run')
+        monkeypatch.setattr('app.create_app', create_app)
+
+        # called outside any app context, like a worker does
+        for status in ['in_progress', 'delivered']:
+            result = update_order_status.apply(args=(self.order_id, status))
+            assert result.get() == f"Updated order {self.order_id} status to {status}"
+
+        with self.app.app_context():
+            assert db.session.get(Order, self.order_id).shipping_status == ShippingStatus.DELIVERED